@@ -0,0 +1,92 @@
+import argparse
+import re
+import time
+
+from list_sessions import parse_session_status_output
+
+SESSION_STATUS_TEMPLATE = '''{session_id} - user{session_id} (1{session_id:04d})
+           Since: Tue 2024-05-14 08:{minute:02d}:13 CEST; 3h 12min ago
+          Leader: {leader} (lightdm)
+            Seat: seat0; vc7
+         Display: :{session_id}
+         Service: lightdm; type x11; class user
+         Desktop: xfce
+           State: active
+            Idle: no
+            Unit: session-{session_id}.scope
+                  ├─{leader} lightdm --session-child 14 23
+                  └─{child} xfce4-session
+'''
+
+SSH_SESSION_STATUS_TEMPLATE = '''{session_id} - user{session_id} (1{session_id:04d})
+           Since: Tue 2024-05-14 08:{minute:02d}:13 CEST; 3h 12min ago
+          Leader: {leader} (sshd)
+          Remote: 10.0.{minute}.{minute}
+         Service: sshd; type tty; class user
+           State: active
+            Unit: session-{session_id}.scope
+                  ├─{leader} sshd: user{session_id} [priv]
+                  └─{child} -bash
+'''
+
+
+def generate_outputs(count, ssh_every=4):
+    """
+    Generates synthetic 'loginctl session-status' outputs, every ssh_every-th one an SSH session without Seat and Display.
+    """
+    outputs = []
+    for number in range(count):
+        ssh = ssh_every and number % ssh_every == 0
+        template = SSH_SESSION_STATUS_TEMPLATE if ssh else SESSION_STATUS_TEMPLATE
+        outputs.append((str(number), template.format(session_id=number, minute=number % 60,
+                                                     leader=10000 + number, child=20000 + number)))
+    return outputs
+
+
+def legacy_parse(session_id, output):
+    # The per-field re.search parser which get_session_details used before the single-pass parser
+    output = output.strip()
+    try:
+        return {
+            'SessionID': session_id,
+            'Since': re.search(r'Since:\s+(.+)', output).group(1),
+            'Leader': re.search(r'Leader:\s+(\d+)', output).group(1),
+            'Seat': re.search(r'Seat:\s+(.+)', output).group(1),
+            'Display': re.search(r'Display:\s+(.+)', output).group(1),
+            'Service': re.search(r'Service:\s+(.+)', output).group(1),
+            'Desktop': re.search(r'Desktop:\s+(.+)', output).group(1),
+            'State': re.search(r'State:\s+(.+)', output).group(1),
+            'Idle': re.search(r'Idle:\s+(.+)', output).group(1),
+            'Unit': re.search(r'Unit:\s+(\S+)', output).group(1),
+        }
+    except AttributeError:
+        return None
+
+
+def measure(name, parser, outputs, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for session_id, output in outputs:
+            parser(session_id, output)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{name:<12} {len(outputs):>8} sessions  {best * 1000:9.1f} ms  {len(outputs) / best:12.0f} sessions/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the parse throughput of loginctl session-status outputs.')
+    parser.add_argument('--sessions', type=int, default=10000, help='Number of synthetic sessions (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per parser, the best is reported (default: %(default)s)')
+    parser.add_argument('--ssh-every', type=int, default=4,
+                        help='Every Nth session is an SSH session without Seat and Display, 0 for none (default: %(default)s)')
+    args = parser.parse_args()
+
+    # The legacy parser gives up on the first missing field, so it does less work on SSH sessions
+    outputs = generate_outputs(args.sessions, args.ssh_every)
+    measure('legacy', legacy_parse, outputs, args.repeat)
+    measure('single-pass', parse_session_status_output, outputs, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import host_tools
+
+# Cold start budget of a subcommand: imports until its options are parsed, in milliseconds
+DEFAULT_BUDGET_MS = 150
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'host_tools.py')
+
+
+def import_time_ms(stderr):
+    """
+    Sums the cumulative time of the top level imports in the output of python -X importtime, in milliseconds.
+    Nested imports are indented and already counted in their top level import.
+    """
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit() and not name.startswith('  '):
+            total += int(cumulative)
+    return total / 1000
+
+
+def measure(subcommand, repeat):
+    """
+    Starts 'host_tools.py <subcommand> --help' in fresh interpreters, which imports everything the subcommand
+    needs and exits after parsing its options. Returns the best (import ms, wall ms).
+    """
+    best_import, best_wall = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-X', 'importtime', SCRIPT, subcommand, '--help'],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+        wall = (time.perf_counter() - start) * 1000
+        imports = import_time_ms(completed.stderr)
+        best_import = imports if best_import is None else min(best_import, imports)
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+    return best_import, best_wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold start of the host_tools subcommands.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per subcommand, the best is reported (default: %(default)s)')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help='Import time a subcommand may take (default: %(default)s)')
+    args = parser.parse_args()
+
+    over_budget = []
+    for subcommand in host_tools.SUBCOMMANDS:
+        imports, wall = measure(subcommand, args.repeat)
+        print(f'{subcommand:<10} imports {imports:8.1f} ms  wall {wall:8.1f} ms')
+        if imports > args.budget_ms:
+            over_budget.append(subcommand)
+    if over_budget:
+        print(f'Over the budget of {args.budget_ms} ms: {", ".join(over_budget)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
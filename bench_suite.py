@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Shared start of the fake executables. Every call is appended to $FAKE_CALLS. The environment injects
+# latency (FAKE_LATENCY seconds), hangs (FAKE_HANG) and failures: the first FAKE_FAIL_CALLS calls exit
+# with FAKE_FAIL_CODE, e.g. 200 for dnf's lock contention.
+FAKE_PREAMBLE = '''import os
+import sys
+import time
+
+TOOL = os.path.basename(sys.argv[0])
+calls_file = os.environ['FAKE_CALLS']
+with open(calls_file, 'a+') as calls:
+    calls.seek(0)
+    previous_calls = sum(1 for line in calls if line.startswith(TOOL + ' '))
+    calls.write(' '.join([TOOL] + sys.argv[1:2]) + '\\n')
+if os.environ.get('FAKE_HANG'):
+    while True:
+        time.sleep(60)
+time.sleep(float(os.environ.get('FAKE_LATENCY', 0)))
+if previous_calls < int(os.environ.get('FAKE_FAIL_CALLS', 0)):
+    sys.exit(int(os.environ.get('FAKE_FAIL_CODE', 1)))
+out = sys.stdout
+'''
+
+FAKE_LOGINCTL = FAKE_PREAMBLE + '''
+count = int(os.environ.get('FAKE_SESSIONS', 10))
+
+
+def is_ssh(number):
+    return number % 4 == 0
+
+
+command = sys.argv[1]
+if command == 'list-sessions':
+    for number in range(1, count + 1):
+        seat, tty = ('-', f'pts/{number}') if is_ssh(number) else ('seat0', f'tty{number % 12}')
+        out.write(f'{number:>6} {1000 + number % 500:>5} user{number % 500} {seat} {tty}\\n')
+elif command == 'show-session':
+    if os.environ.get('FAKE_SHOW_SESSION_FAIL'):
+        sys.exit(1)
+    for session_id in [argument for argument in sys.argv[2:] if not argument.startswith('-')]:
+        number = int(session_id)
+        ssh = is_ssh(number)
+        out.write(f'Id={session_id}\\nTimestamp=Tue 2024-05-14 08:{number % 60:02d}:13 CEST\\n'
+                  f'Leader={10000 + number}\\nSeat={"" if ssh else "seat0"}\\nDisplay={"" if ssh else ":" + session_id}\\n'
+                  f'Service={"sshd" if ssh else "lightdm"}\\nDesktop={"" if ssh else "xfce"}\\n'
+                  f'State=active\\nIdleHint={"yes" if ssh else "no"}\\nScope=session-{session_id}.scope\\n'
+                  f'IdleSinceHint={int((time.time() - number) * 1000000) if ssh else 0}\\n\\n')
+elif command == 'session-status':
+    session_id = sys.argv[2]
+    number = int(session_id)
+    lines = [f'{session_id} - user{number % 500} ({1000 + number % 500})',
+             f'           Since: Tue 2024-05-14 08:{number % 60:02d}:13 CEST; 3h 12min ago',
+             f'          Leader: {10000 + number} ({"sshd" if is_ssh(number) else "lightdm"})']
+    if not is_ssh(number):
+        lines += ['            Seat: seat0; vc7', f'         Display: :{session_id}',
+                  '         Service: lightdm; type x11; class user', '         Desktop: xfce']
+    else:
+        lines += ['         Service: sshd; type tty; class user']
+    lines += ['           State: active', '            Idle: no', f'            Unit: session-{session_id}.scope']
+    out.write('\\n'.join(lines) + '\\n')
+'''
+
+FAKE_DNF = FAKE_PREAMBLE + '''
+count = int(os.environ.get('FAKE_UPDATES', 10))
+if sys.argv[1] == 'check-update':
+    out.write('Last metadata expiration check: 0:12:01 ago on Tue 14 May 2024 08:00:00 AM CEST.\\n\\n')
+    for number in range(count):
+        out.write(f'package{number}.x86_64{" " * 20}{number % 9 + 1}.{number % 17}-{number % 5 + 1}.el9'
+                  f'{" " * 10}{"appstream" if number % 3 else "baseos"}\\n')
+    sys.exit(100 if count else 0)
+'''
+
+# Scenarios: function run in the child, environment of the fakes and, for the hang, the timeout of dnf
+SCENARIOS = {
+    'sessions_10k': ('sessions', {'FAKE_SESSIONS': '10000'}),
+    'sessions_fallback_500': ('sessions', {'FAKE_SESSIONS': '500', 'FAKE_SHOW_SESSION_FAIL': '1'}),
+    'check_updates_5k': ('check_updates', {'FAKE_UPDATES': '5000'}),
+    'are_updates_available_5k': ('are_updates_available', {'FAKE_UPDATES': '5000'}),
+    'dnf_latency_2s': ('are_updates_available', {'FAKE_UPDATES': '100', 'FAKE_LATENCY': '2'}),
+    'dnf_locked_twice': ('are_updates_available', {'FAKE_UPDATES': '100', 'FAKE_FAIL_CALLS': '2',
+                                                   'FAKE_FAIL_CODE': '200'}),
+    'dnf_hang': ('check_update_timeout', {'FAKE_HANG': '1'}),
+}
+# Seconds dnf may hang in the dnf_hang scenario before it is terminated
+HANG_TIMEOUT = 3
+# Relative increase of wall time and peak RSS over the baseline which counts as a regression
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_BASELINE = 'bench_baseline.json'
+
+
+def run_target(target):
+    """
+    Runs the measured function in the child and returns the number of items it handled.
+    """
+    import logging
+    import metrics
+
+    if target == 'sessions':
+        import list_sessions
+        session_ids = list_sessions.get_session_ids() or []
+        details = list_sessions.get_all_session_details(session_ids)
+        return sum(1 for session in details if session)
+    if target == 'check_updates':
+        import check_updates
+        check_updates.check_updates(logging.getLogger('check_updates'), 'dnf', use_cache=False)
+    elif target == 'are_updates_available':
+        import dnf_clean_and_update_check
+        dnf_clean_and_update_check.are_updates_available()
+    elif target == 'check_update_timeout':
+        import update_engine
+        _, updates = update_engine.run_check_update(timeout=HANG_TIMEOUT)
+        return len(updates)
+    pending = [value for (name, _), value in metrics.REGISTRY.gauges.items() if name == 'pending_updates']
+    return pending[0] if pending else 0
+
+
+def run_child(scenario, workdir):
+    """
+    Runs one scenario in this process and prints its measurements as JSON.
+    """
+    import logging
+    import dnf_lock
+    import metrics
+    import update_history
+
+    logging.basicConfig(filename=os.path.join(workdir, 'bench.log'), level=logging.INFO)
+    # Keep the lock and the shared results of the fake dnf away from the real ones
+    dnf_lock.LOCK_FILE = os.path.join(workdir, 'dnf_scripts.lock')
+    dnf_lock.RESULT_DIR = workdir
+    update_history.HISTORY_DB = os.path.join(workdir, 'update_history.db')
+    start = time.perf_counter()
+    items = run_target(SCENARIOS[scenario][0])
+    wall = time.perf_counter() - start
+    parse_seconds = sum(total for (name, labels), (_, total, _) in metrics.REGISTRY.histograms.items()
+                        if name == 'stage_duration_seconds' and dict(labels)['stage'].startswith('parse_'))
+    print(json.dumps({
+        'items': items,
+        'wall_seconds': round(wall, 4),
+        'items_per_second': round(items / wall) if wall else None,
+        'parse_seconds': round(parse_seconds, 4),
+        # kilobytes on Linux
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+
+
+def install_fakes(directory):
+    for name, source in (('loginctl', FAKE_LOGINCTL), ('dnf', FAKE_DNF)):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as file:
+            file.write(f'#!{sys.executable}\n{source}')
+        os.chmod(path, 0o755)
+
+
+def measure(scenario, workdir, fake_dir, repeat):
+    """
+    Runs a scenario repeat times in fresh interpreters and returns the run with the best wall time,
+    with the number of fake loginctl and dnf processes it started.
+    """
+    best = None
+    calls_file = os.path.join(workdir, 'calls')
+    for _ in range(repeat):
+        open(calls_file, 'w').close()
+        # Every run records its updates into an empty history
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(os.path.join(workdir, f'update_history.db{suffix}')):
+                os.remove(os.path.join(workdir, f'update_history.db{suffix}'))
+        env = dict(os.environ, PATH=f'{fake_dir}{os.pathsep}{os.environ.get("PATH", "")}', FAKE_CALLS=calls_file,
+                   **SCENARIOS[scenario][1])
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', scenario, '--workdir', workdir],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=subprocess.PIPE,
+                                   text=True, check=True)
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        with open(calls_file, 'r') as file:
+            result['subprocesses'] = sum(1 for _ in file)
+        if best is None or result['wall_seconds'] < best['wall_seconds']:
+            best = result
+    return best
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the regressions of results against the baseline as messages.
+    """
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline.get(scenario)
+        if base is None:
+            continue
+        for key in ('wall_seconds', 'peak_rss_kb'):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f'{scenario}: {key} {result[key]} > baseline {base[key]} + {tolerance:.0%}')
+        if result['subprocesses'] > base['subprocesses']:
+            regressions.append(f'{scenario}: subprocesses {result["subprocesses"]} > baseline {base["subprocesses"]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the scripts against fake loginctl and dnf at production scale.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='Comma separated scenarios to run (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario, the fastest is reported (default: %(default)s)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='Baseline file to compare against, when it exists (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative increase over the baseline (default: %(default)s)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child, args.workdir)
+        return
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    workdir = tempfile.mkdtemp(prefix='bench_suite.')
+    results = {}
+    try:
+        fake_dir = os.path.join(workdir, 'bin')
+        os.mkdir(fake_dir)
+        install_fakes(fake_dir)
+        for scenario in scenarios:
+            result = measure(scenario, workdir, fake_dir, args.repeat)
+            results[scenario] = result
+            print(f'{scenario:<26} {result["wall_seconds"]:8.3f} s  {result["items"]:>6} items  '
+                  f'{result["items_per_second"] or 0:>9} items/s  parse {result["parse_seconds"]:7.4f} s  '
+                  f'{result["subprocesses"]:>5} processes  {result["peak_rss_kb"]:>7} KiB peak RSS')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        print(f'Baseline stored in {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
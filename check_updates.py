@@ -1,92 +1,110 @@
-import subprocess
+import argparse
 import logging
 import sys
 import re
 
+import command_runner
+import metrics
+import script_logging
+import update_cache
+import update_engine
+import update_history
+
 # Path to the OS release file
 os_release_file_path = '/etc/redhat-release'
 
-# Define a custom log level TRACE
-TRACE_LEVEL_NUM = 25
 # Log file
 LOG_FILE = 'file.log'
 
 
-def trace(self, message, *args, **kws):
-    if self.isEnabledFor(TRACE_LEVEL_NUM):
-        self._log(TRACE_LEVEL_NUM, message, args, **kws)
-
-
-# Extend the Logger class with the trace method
-class CustomLogger(logging.getLoggerClass()):
-    def trace(self, message, *args, **kws):
-        if self.isEnabledFor(TRACE_LEVEL_NUM):
-            self._log(TRACE_LEVEL_NUM, message, args, **kws)
-
-
-# Set the custom logger class
-logging.setLoggerClass(CustomLogger)
-
-# Add TRACE level to the logging module
-logging.addLevelName(TRACE_LEVEL_NUM, "TRACE")
+def configure_logging():
+    # Log to the file and to the console, with the TRACE level available
+    script_logging.configure_logging(LOG_FILE, logging.DEBUG, '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                                     console=True)
 
 
-def configure_logging():
-    # Configure logging
-    logging.basicConfig(level=logging.DEBUG,
-                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                        handlers=[
-                            logging.FileHandler(LOG_FILE),
-                            logging.StreamHandler()
-                        ])
+def check_updates_with_native_engine(logger):
+    try:
+        updates_available, updates = update_engine.check_updates_native()
+    except Exception as e:
+        print("An error occurred while checking for updates in the cached metadata.")
+        logger.error(f"Native update check failed: {e}")
+        return None
+    if updates_available:
+        print(f"Updates are available.")
+    else:
+        print(f"Operation was successful, No updates available.")
+    return updates_available, updates
 
 
-def check_updates(logger):
+def check_updates_with_dnf(logger):
     try:
-        # Run the dnf check-update command and capture the output
-        result = subprocess.run(['dnf', 'check-update'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        # Return values taken from the man entry of the dnf command
-        # 0   : Operation was successful, No updates available
-        # 1   : An error occurred, which was handled by dnf
-        # 3   : An unknown unhandled error occurred during operation
-        # 100 : Updates are available and a list of the updates will be printed
-        # 200 : There was a problem with acquiring or releasing of locks
-
-        # Check the return code to determine if updates are available
-        if result.returncode == 0:
-            print(f"Operation was successful, No updates available.")
-            logger.info(f"Operation was successful, No updates available.")
-            return False
-        elif result.returncode == 1:
-            print(f"An error occurred, which was handled by dnf.")
-            logger.error(f"An error occurred, which was handled by dnf.")
-            return False
-        elif result.returncode == 3:
-            print(f"An unknown unhandled error occurred during operation.")
-            return False
-        elif result.returncode == 100:
-            print(f"Updates are available.")
-            return True
-        elif result.returncode == 200:
-            print(f"There was a problem with acquiring or releasing of locks.")
-            return False
-        else:
-            # Handle other return codes by returning False and printing stderr
-            print(result.stderr.decode())
-            return False
-    except subprocess.CalledProcessError as e:
-        # Print any error that occurs during the subprocess call
-        print(f"Error: {e.stderr.strip()}")
-        return False
+        # Run the dnf check-update command and parse the updates while they are printed
+        result, updates = update_engine.run_check_update_coordinated()
+        message = command_runner.log_result(result, 'dnf check-update', logger)
+        print(message)
+        if result.outcome.name == 'updates':
+            return True, updates
+        if result.outcome.name == 'success':
+            return False, []
+        return None
     except Exception as e:
         # Handle any exceptions that occur during the subprocess run
         print("An error occurred while checking for updates.")
         print(str(e))
+        return None
+
+
+def get_updates(logger, engine='dnf', use_cache=False, refresh=False):
+    """
+    Returns (updates available, list of update_engine.Update), or None if the check failed.
+    With use_cache a result cached since the last change of the repo metadata and rpmdb is returned,
+    refresh forces a real check.
+    """
+    # The native engine reads the cached repository metadata instead of running dnf
+    if engine == 'native':
+        check = lambda: check_updates_with_native_engine(logger)
+    else:
+        check = lambda: check_updates_with_dnf(logger)
+    if not use_cache:
+        return check()
+    # The engines differ in their results, e.g. native ignores the excludes of dnf, so each has its own entry
+    return update_cache.cached_update_check(check, refresh=refresh, key=engine)
+
+
+def check_updates(logger, engine='dnf', use_cache=False, refresh=False, history=True):
+    with metrics.timed('check_updates'):
+        result = get_updates(logger, engine, use_cache, refresh)
+    if result is None:
         return False
-
-
-def main():
+    updates_available, updates = result
+    # Counted like dnf_clean_and_update_check.py and the update history, without the Obsoleting Packages lines
+    metrics.REGISTRY.set('pending_updates', sum(1 for update in updates if update.obsoletes is None))
+    if history:
+        update_history.record_check(updates, logger=logger)
+    for update in updates:
+        logger.debug("Update available: %s.%s %s %s", update.name, update.arch, update.version, update.repo)
+    return updates_available
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Check whether package updates are available.')
+    parser.add_argument('--engine', choices=['dnf', 'native'], default='dnf',
+                        help='Run dnf check-update or compare the rpmdb with the cached metadata (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Neither use nor store the cached result of the last check')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Ignore the cached result and run a real check')
+    parser.add_argument('--no-history', action='store_true',
+                        help=f'Do not record the result in the update history {update_history.HISTORY_DB}')
+    parser.add_argument('--textfile-dir', default=metrics.TEXTFILE_DIR,
+                        help='node_exporter textfile collector directory the metrics are written to '
+                             '(default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
     # Call the function to configure logging and log messages
     configure_logging()
     # Create logger
@@ -96,8 +114,11 @@ def main():
     logger.error("This is my error message")
     logger.trace("This is my trace message")
 
-    updates_available = check_updates(logger)
+    metrics.enable()
+    updates_available = check_updates(logger, args.engine, use_cache=not args.no_cache, refresh=args.refresh,
+                                      history=not args.no_history)
     print(updates_available)
+    metrics.write_textfile('check_updates', args.textfile_dir)
 
 
 # Entry point of the script
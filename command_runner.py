@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from collections import namedtuple
+
+# Seconds a command may run before it is terminated
+DEFAULT_TIMEOUT = 300
+# Seconds between terminating a command and killing it
+KILL_AFTER = 10
+# Bytes of stdout and of stderr kept from a command, the rest is read and dropped
+DEFAULT_MAX_OUTPUT = 1024 * 1024
+# Commands run at the same time by run_commands
+DEFAULT_CONCURRENCY = 8
+# Longest line passed to a line handler
+LINE_LIMIT = 1024 * 1024
+
+Outcome = namedtuple('Outcome', ['name', 'level', 'description'])
+CommandResult = namedtuple('CommandResult', ['command', 'returncode', 'stdout', 'stderr', 'outcome', 'seconds',
+                                             'timed_out', 'truncated', 'stopped'])
+
+SUCCESS = Outcome('success', logging.INFO, 'Operation was successful')
+# Return values taken from the man entry of the dnf command
+DNF_OUTCOMES = {
+    0: SUCCESS,
+    1: Outcome('error', logging.ERROR, 'An error occurred, which was handled by dnf'),
+    3: Outcome('error', logging.CRITICAL, 'An unknown unhandled error occurred during operation'),
+    200: Outcome('locked', logging.WARNING, 'There was a problem with acquiring or releasing of locks'),
+}
+# Outcomes by command prefix, the longest matching prefix wins
+EXIT_CODE_OUTCOMES = {
+    ('dnf',): DNF_OUTCOMES,
+    ('dnf', 'check-update'): {
+        **DNF_OUTCOMES,
+        0: Outcome('success', logging.INFO, 'Operation was successful, No updates available'),
+        100: Outcome('updates', logging.INFO, 'Updates are available'),
+    },
+    ('loginctl',): {
+        0: SUCCESS,
+        1: Outcome('error', logging.ERROR, 'An error occurred while querying the login manager'),
+    },
+}
+DEFAULT_OUTCOMES = {0: SUCCESS}
+UNEXPECTED_OUTCOME = Outcome('error', logging.ERROR, 'Unexpected return code')
+TIMEOUT_OUTCOME = Outcome('timeout', logging.ERROR, 'The command timed out')
+STOPPED_OUTCOME = Outcome('stopped', logging.DEBUG, 'The command was stopped after the wanted output')
+# Functions called with the CommandResult of every finished command, e.g. to record metrics
+RESULT_HOOKS = []
+
+
+def lookup_outcome(command, returncode):
+    """
+    Maps the return code of a command to an Outcome using EXIT_CODE_OUTCOMES.
+    """
+    for length in range(len(command), 0, -1):
+        outcomes = EXIT_CODE_OUTCOMES.get(tuple(command[:length]))
+        if outcomes is not None:
+            break
+    else:
+        outcomes = DEFAULT_OUTCOMES
+    return outcomes.get(returncode, UNEXPECTED_OUTCOME)
+
+
+def call_result_hooks(result):
+    for hook in RESULT_HOOKS:
+        try:
+            hook(result)
+        except Exception as e:
+            message = f'Result hook {hook.__name__} failed: {e}'
+            logging.warning(message)
+    return result
+
+
+async def read_capped(stream, max_output):
+    """
+    Reads a stream to its end, keeping at most max_output bytes. Returns (text, truncated).
+    """
+    chunks = []
+    size = 0
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        if size < max_output:
+            chunks.append(chunk[:max_output - size])
+        size += len(chunk)
+    return b''.join(chunks).decode(errors='replace'), size > max_output
+
+
+async def read_lines(stream, line_handler):
+    """
+    Passes every line of a stream to line_handler. Returns True as soon as line_handler returns True.
+    """
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:
+            # A line longer than LINE_LIMIT, readuntil() already dropped it
+            continue
+        if not line:
+            return False
+        if line_handler(line.decode(errors='replace')):
+            return True
+
+
+def signal_process_group(process, signal_number):
+    try:
+        os.killpg(process.pid, signal_number)
+    except ProcessLookupError:
+        pass
+
+
+async def stop_process(process, kill_after=KILL_AFTER):
+    """
+    Terminates the process group of a command and kills it if it is still running kill_after seconds later.
+    Signalling the group also stops the children, which would otherwise keep the pipes open.
+    """
+    if process.returncode is not None:
+        return
+    signal_process_group(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), kill_after)
+    except asyncio.TimeoutError:
+        if kill_after:
+            message = f'Command did not terminate within {kill_after}s, killing it: {process.pid}'
+            logging.warning(message)
+        signal_process_group(process, signal.SIGKILL)
+        await process.wait()
+
+
+async def run_command_async(command, timeout=DEFAULT_TIMEOUT, max_output=DEFAULT_MAX_OUTPUT, kill_after=KILL_AFTER,
+                            line_handler=None, semaphore=None, outcomes=None):
+    """
+    Runs a command and returns a CommandResult, it never raises for a failing command.
+    The command is terminated after timeout seconds, and killed if it does not exit kill_after seconds later.
+    With line_handler, stdout is not captured but passed to line_handler line by line while it is printed,
+    and the command is stopped as soon as line_handler returns True.
+    With semaphore, the command waits for a free slot before it starts.
+    outcomes maps return codes to Outcomes instead of looking them up by command in EXIT_CODE_OUTCOMES.
+    """
+    if semaphore is not None:
+        async with semaphore:
+            return await run_command_async(command, timeout, max_output, kill_after, line_handler, None, outcomes)
+
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    try:
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE, limit=LINE_LIMIT,
+                                                       start_new_session=True)
+    except OSError as e:
+        outcome = Outcome('error', logging.CRITICAL, f'The command could not be started: {e}')
+        return call_result_hooks(CommandResult(command, None, '', str(e), outcome, time.monotonic() - start,
+                                               False, False, False))
+
+    try:
+        if line_handler is None:
+            stdout_task = asyncio.ensure_future(read_capped(process.stdout, max_output))
+        else:
+            stdout_task = asyncio.ensure_future(read_lines(process.stdout, line_handler))
+        stderr_task = asyncio.ensure_future(read_capped(process.stderr, max_output))
+
+        timed_out = False
+        stopped = False
+        done, _ = await asyncio.wait({stdout_task}, timeout=remaining())
+        if stdout_task not in done:
+            timed_out = True
+        elif line_handler is not None and stdout_task.result():
+            stopped = True
+        else:
+            try:
+                await asyncio.wait_for(process.wait(), remaining())
+            except asyncio.TimeoutError:
+                timed_out = True
+        if timed_out or stopped:
+            await stop_process(process, kill_after)
+        else:
+            await process.wait()
+    except BaseException:
+        # Cancelled, e.g. by KeyboardInterrupt: do not leave the command running in its own session
+        await stop_process(process, 0)
+        raise
+
+    # Children of the command may still hold the pipes open, do not wait for them forever
+    done, pending = await asyncio.wait({stdout_task, stderr_task}, timeout=kill_after)
+    for task in pending:
+        task.cancel()
+    stdout, stdout_truncated = '', False
+    if stdout_task in done and line_handler is None:
+        stdout, stdout_truncated = stdout_task.result()
+    stderr, stderr_truncated = stderr_task.result() if stderr_task in done else ('', False)
+
+    if timed_out:
+        outcome = TIMEOUT_OUTCOME
+    elif stopped:
+        outcome = STOPPED_OUTCOME
+    else:
+        outcome = (lookup_outcome(command, process.returncode) if outcomes is None
+                   else outcomes.get(process.returncode, UNEXPECTED_OUTCOME))
+    return call_result_hooks(CommandResult(command, process.returncode, stdout, stderr, outcome,
+                                           time.monotonic() - start, timed_out, stdout_truncated or stderr_truncated,
+                                           stopped))
+
+
+async def run_commands_async(commands, concurrency=DEFAULT_CONCURRENCY, **kwargs):
+    """
+    Runs independent commands at the same time, at most concurrency at once.
+    Returns their CommandResults in the order of commands.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(run_command_async(command, semaphore=semaphore, **kwargs) for command in commands))
+
+
+def run_command(command, **kwargs):
+    """
+    Runs a single command from synchronous code, see run_command_async for the arguments.
+    """
+    return asyncio.run(run_command_async(command, **kwargs))
+
+
+def run_commands(commands, concurrency=DEFAULT_CONCURRENCY, **kwargs):
+    """
+    Runs independent commands concurrently from synchronous code, see run_commands_async.
+    """
+    return asyncio.run(run_commands_async(commands, concurrency, **kwargs))
+
+
+def log_result(result, label, logger=logging):
+    """
+    Logs the outcome of a command at the level of its outcome, with its stderr for errors.
+    Returns the logged message.
+    """
+    message = f'{label}: {result.outcome.description}.'
+    if result.outcome is UNEXPECTED_OUTCOME:
+        message = f'{label}: {result.outcome.description}: {result.returncode}'
+    if result.outcome.level >= logging.ERROR and result.stderr:
+        message += f'\nSTDERR: {result.stderr.strip()}'
+    logger.log(result.outcome.level, message)
+    return message
@@ -0,0 +1,218 @@
+import logging
+import os
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from update_engine import DNF_CACHE_DIR, REPO_NS
+
+# Eviction classes, lower ones are evicted first
+PACKAGES = 0
+STALE_METADATA = 1
+METADATA = 2
+CLASS_NAMES = {PACKAGES: 'packages', STALE_METADATA: 'stale metadata', METADATA: 'metadata'}
+
+# Downloaded packages and stale metadata not used for this many seconds are always removed
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+# Metadata older than this is refreshed by dnf anyway (dnf's default metadata_expire is 48 hours)
+DEFAULT_METADATA_EXPIRE = 48 * 3600
+# The cache is pruned down to this many bytes, least recently used files of the lowest class first
+DEFAULT_SIZE_BUDGET = 1024 * 1024 * 1024
+# Number of threads deleting files
+DELETE_WORKERS = 8
+
+CacheFile = namedtuple('CacheFile', ['path', 'size', 'last_used', 'eviction_class'])
+PruneReport = namedtuple('PruneReport', ['files_removed', 'bytes_freed', 'bytes_remaining', 'errors', 'seconds'])
+
+
+def referenced_metadata(repo_dir):
+    """
+    Returns the paths of the metadata files the current repomd.xml of a repository refers to.
+    """
+    try:
+        root = ElementTree.parse(os.path.join(repo_dir, 'repodata', 'repomd.xml')).getroot()
+    except (OSError, ElementTree.ParseError):
+        return set()
+    return {os.path.join(repo_dir, location.get('href', '')) for location in root.iter(f'{REPO_NS}location')}
+
+
+def walk_files(directory):
+    """
+    Yields the os.DirEntry of every file below directory.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from walk_files(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+    except OSError as e:
+        message = f'dnf cache prune: Could not read {directory}: {e}'
+        logging.warning(message)
+
+
+def to_cache_file(entry, eviction_class):
+    """
+    Returns the CacheFile of a directory entry, or None if the file is gone, e.g. removed by dnf during the scan.
+    """
+    try:
+        stat_result = entry.stat(follow_symlinks=False)
+    except OSError as e:
+        message = f'dnf cache prune: Could not read {entry.path}: {e}'
+        logging.debug(message)
+        return None
+    return CacheFile(entry.path, stat_result.st_size, max(stat_result.st_atime, stat_result.st_mtime), eviction_class)
+
+
+def collect_cache_files(cache_dir=DNF_CACHE_DIR, metadata_expire=DEFAULT_METADATA_EXPIRE, now=None):
+    """
+    Classifies the files of the dnf cache: downloaded packages, stale metadata and current metadata.
+    Metadata is stale when its repository was not refreshed for metadata_expire seconds
+    or when the current repomd.xml no longer refers to it.
+    """
+    now = time.time() if now is None else now
+    cache_files = []
+    try:
+        with os.scandir(cache_dir) as entries:
+            entries = list(entries)
+    except OSError as e:
+        message = f'dnf cache prune: Could not read {cache_dir}: {e}'
+        logging.error(message)
+        return cache_files
+    for entry in entries:
+        if entry.is_file(follow_symlinks=False):
+            # Solv files and dnf's own state in the top directory are rebuilt from the repository metadata
+            cache_file = to_cache_file(entry, METADATA)
+            if cache_file:
+                cache_files.append(cache_file)
+        elif entry.is_dir(follow_symlinks=False):
+            repomd_path = os.path.join(entry.path, 'repodata', 'repomd.xml')
+            try:
+                stale_repo = now - os.stat(repomd_path).st_mtime > metadata_expire
+            except OSError:
+                stale_repo = True
+            referenced = referenced_metadata(entry.path) | {repomd_path}
+            packages_dir = os.path.join(entry.path, 'packages') + os.sep
+            for file_entry in walk_files(entry.path):
+                if file_entry.path.startswith(packages_dir):
+                    eviction_class = PACKAGES
+                elif stale_repo or (file_entry.path not in referenced and '/repodata/' in file_entry.path):
+                    eviction_class = STALE_METADATA
+                else:
+                    eviction_class = METADATA
+                cache_file = to_cache_file(file_entry, eviction_class)
+                if cache_file:
+                    cache_files.append(cache_file)
+    return cache_files
+
+
+def plan_eviction(cache_files, max_age=DEFAULT_MAX_AGE, size_budget=DEFAULT_SIZE_BUDGET, now=None):
+    """
+    Returns the files to remove: packages and stale metadata unused for max_age seconds,
+    then the least recently used files of the lowest class until the cache fits into size_budget.
+    """
+    now = time.time() if now is None else now
+    evict = []
+    kept = []
+    for cache_file in cache_files:
+        if cache_file.eviction_class != METADATA and now - cache_file.last_used > max_age:
+            evict.append(cache_file)
+        else:
+            kept.append(cache_file)
+    remaining = sum(cache_file.size for cache_file in kept)
+    if size_budget is not None and remaining > size_budget:
+        for cache_file in sorted(kept, key=lambda cache_file: (cache_file.eviction_class, cache_file.last_used)):
+            if remaining <= size_budget:
+                break
+            evict.append(cache_file)
+            remaining -= cache_file.size
+    return evict
+
+
+def remove_file(cache_file):
+    try:
+        os.remove(cache_file.path)
+        return cache_file.size, None
+    except FileNotFoundError:
+        return 0, None
+    except OSError as e:
+        return 0, e
+
+
+def remove_empty_dirs(paths, cache_dir=DNF_CACHE_DIR):
+    """
+    Removes the directories below cache_dir which are empty after paths were removed, e.g. the repodata directory
+    of a repository whose metadata was evicted, which would otherwise look like a broken repository.
+    """
+    cache_dir = os.path.abspath(cache_dir)
+    for directory in {os.path.dirname(os.path.abspath(path)) for path in paths}:
+        while directory.startswith(cache_dir + os.sep):
+            try:
+                os.rmdir(directory)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Not empty, and neither are its parents
+                break
+            directory = os.path.dirname(directory)
+
+
+def plan_prune(cache_dir=DNF_CACHE_DIR, max_age=DEFAULT_MAX_AGE, size_budget=DEFAULT_SIZE_BUDGET,
+               metadata_expire=DEFAULT_METADATA_EXPIRE):
+    """
+    Scans the dnf cache and returns (all cache files, files to remove).
+    """
+    now = time.time()
+    cache_files = collect_cache_files(cache_dir, metadata_expire, now)
+    return cache_files, plan_eviction(cache_files, max_age, size_budget, now)
+
+
+def execute_prune(cache_files, evict, dry_run=False, workers=DELETE_WORKERS, cache_dir=DNF_CACHE_DIR):
+    """
+    Removes the planned files with workers threads, and the directories below cache_dir left empty.
+    Returns a PruneReport.
+    """
+    start = time.monotonic()
+    for eviction_class, name in CLASS_NAMES.items():
+        selected = [cache_file for cache_file in evict if cache_file.eviction_class == eviction_class]
+        if selected:
+            message = (f'dnf cache prune: {"Would remove" if dry_run else "Removing"} {len(selected)} {name} files, '
+                       f'{sum(cache_file.size for cache_file in selected)} bytes.')
+            logging.info(message)
+    bytes_freed = 0
+    errors = 0
+    if dry_run:
+        bytes_freed = sum(cache_file.size for cache_file in evict)
+    elif evict:
+        removed = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for cache_file, (size, error) in zip(evict, executor.map(remove_file, evict)):
+                bytes_freed += size
+                if error:
+                    errors += 1
+                    message = f'dnf cache prune: Could not remove {cache_file.path}: {error}'
+                    logging.error(message)
+                else:
+                    removed.append(cache_file.path)
+        remove_empty_dirs(removed, cache_dir)
+    total = sum(cache_file.size for cache_file in cache_files)
+    report = PruneReport(len(evict) - errors, bytes_freed, total - bytes_freed, errors, time.monotonic() - start)
+    message = (f'dnf cache prune: Freed {report.bytes_freed} bytes in {report.files_removed} files '
+               f'in {report.seconds:.3f}s, {report.bytes_remaining} bytes remaining.')
+    logging.info(message)
+    return report
+
+
+def prune_dnf_cache(cache_dir=DNF_CACHE_DIR, max_age=DEFAULT_MAX_AGE, size_budget=DEFAULT_SIZE_BUDGET,
+                    metadata_expire=DEFAULT_METADATA_EXPIRE, dry_run=False, workers=DELETE_WORKERS):
+    """
+    Removes old packages and metadata from the dnf cache, keeping fresh metadata as long as the budget allows,
+    so that the next update check does not have to download everything again. Returns a PruneReport.
+    The scan is included in the reported time.
+    """
+    start = time.monotonic()
+    cache_files, evict = plan_prune(cache_dir, max_age, size_budget, metadata_expire)
+    report = execute_prune(cache_files, evict, dry_run, workers, cache_dir)
+    return report._replace(seconds=time.monotonic() - start)
@@ -1,7 +1,20 @@
-import subprocess
+import argparse
+import os
+import shutil
 import logging
 
+import command_runner
+import dnf_cache_pruner
+import dnf_lock
+import metrics
+import script_logging
+import task_graph
+import update_engine
+import update_history
+
 log_file = "dnf_clean.log"
+# Seconds dnf clean all may run before it is terminated
+DNF_CLEAN_TIMEOUT = 300
 
 
 def configure_logging():
@@ -23,154 +36,165 @@ logging.WARNING  30 An indication that something unexpected happened, or that a
 logging.ERROR    40 Due to a more serious problem, the software has not been able to perform some function.
 logging.CRITICAL 50 A serious error, indicating that the program itself may be unable to continue running.
     """
-    logging.basicConfig(filename=log_file,
-                        level=logging.INFO,
-                        format="%(asctime)s %(levelname)s: %(message)s")
+    script_logging.configure_logging(log_file, logging.INFO, "%(asctime)s %(levelname)s: %(message)s",
+                                     max_bytes=script_logging.MAX_BYTES)
 
 
 def run_dnf_clean():
     try:
-        # Run the dnf clean all command and capture the output
-        result = subprocess.run(["dnf", "clean", "all"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        stdout_message = result.stdout.decode()
-        stderr_message = result.stderr.decode()
-
-        # Return values taken from the man entry of the dnf command
-        # 0   : Operation was successful
-        # 1   : An error occurred, which was handled by dnf
-        # 3   : An unknown unhandled error occurred during operation
-        # 200 : There was a problem with acquiring or releasing of locks
-
-        # Check the return code to determine if updates are available
-        if result.returncode == 0:
-            message = f"dnf clean all: Operation was successful."
-            logging.info(message)
-        elif result.returncode == 1:
-            message = (f"dnf clean all: An error occurred, which was handled by dnf."
-                       f"\nSTDOUT: {stdout_message}"
-                       f"\nSTDERR: {stderr_message}")
-            logging.error(message)
-        elif result.returncode == 3:
-            message = (f"dnf clean all: An unknown unhandled error occurred during operation."
-                       f"\nSTDOUT: {stdout_message}"
-                       f"\nSTDERR: {stderr_message}")
-            logging.critical(message)
-        elif result.returncode == 200:
-            message = f"dnf clean all: There was a problem with acquiring or releasing of locks."
-            logging.warning(message)
-        else:
-            message = (f"dnf clean all: Unexpected return code: {result.returncode}"
-                       f"\nSTDOUT: {stdout_message}"
-                       f"\nSTDERR: {stderr_message}")
-            logging.error(message)
-    except subprocess.CalledProcessError as e:
-        # Print any error that occurs during the subprocess call
-        message = f"dnf clean all: An error occurred while dnf clean call: {e.stderr.strip()}"
-        logging.error(message)
-    except subprocess.TimeoutExpired as e:
-        # Handle timeout exception
-        message = f"dnf clean all: The command timed out: {e.stderr.strip() if e.stderr else 'No stderr'}"
-        logging.error(message)
-    except subprocess.SubprocessError as e:
-        # Handle other subprocess errors
-        message = f"dnf clean all: A subprocess error occurred: {str(e)}"
-        logging.error(message)
+        result = dnf_lock.run_serialized(lambda: command_runner.run_command(["dnf", "clean", "all"],
+                                                                            timeout=DNF_CLEAN_TIMEOUT),
+                                         "clean", is_locked=lambda result: result.outcome.name == "locked")
+        command_runner.log_result(result, "dnf clean all")
     except Exception as e:
         # Handle any other exceptions that occur during the subprocess run
         message = f"dnf clean all: An error occurred while running dnf clean: {str(e)}"
         logging.critical(message)
 
 
+def remove_cache_entries():
+    with os.scandir(dnf_cache_pruner.DNF_CACHE_DIR) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+
+
 def remove_all_dnf_cache():
     """
     Removes all files in the /var/cache/dnf directory.
+    Holds the dnf lock meanwhile, so that no dnf run of another script is refreshing the cache.
     Logs the operation.
     """
     try:
-        subprocess.run(["rm", "-rf", "/var/cache/dnf/*"], check=True)
+        dnf_lock.run_serialized(remove_cache_entries, "remove cache")
         message = f"dnf clear cache: Successfully removed all files in /var/cache/dnf"
         logging.info(message)
-    except subprocess.CalledProcessError as e:
-        message = f"dnf clear cache: Failed to remove files: {e.stderr.strip() if e.stderr else str(e)}"
-        logging.error(message)
-    except subprocess.TimeoutExpired as e:
-        message = f"dnf clear cache: Command timed out: {e.stderr.strip() if e.stderr else 'No stderr'}"
-        logging.error(message)
-    except subprocess.SubprocessError as e:
-        message = f"dnf clear cache: A subprocess error occurred: {str(e)}"
+    except OSError as e:
+        message = f"dnf clear cache: Failed to remove files: {str(e)}"
         logging.error(message)
     except Exception as e:
         message = f"dnf clear cache: An unexpected error occurred: {str(e)}"
         logging.critical(message)
 
 
-def are_updates_available():
-    try:
-        # Run the dnf check-update command and capture the output
-        result = subprocess.run(["dnf", "check-update"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        stdout_message = result.stdout.decode()
-        stderr_message = result.stderr.decode()
-
-        # Return values taken from the man entry of the dnf command
-        # 0   : Operation was successful, No updates available
-        # 1   : An error occurred, which was handled by dnf
-        # 3   : An unknown unhandled error occurred during operation
-        # 100 : Updates are available and a list of the updates will be printed
-        # 200 : There was a problem with acquiring or releasing of locks
-
-        # Check the return code to determine if updates are available
-        if result.returncode == 0:
-            message = f"dnf check-update: Operation was successful, No updates available."
-            logging.info(message)
-        elif result.returncode == 1:
-            message = (f"dnf check-update: An error occurred, which was handled by dnf."
-                       f"\nSTDOUT: {stdout_message}"
-                       f"\nSTDERR: {stderr_message}")
-            logging.error(message)
-        elif result.returncode == 3:
-            message = (f"dnf check-update: An unknown unhandled error occurred during operation."
-                       f"\nSTDOUT: {stdout_message}"
-                       f"\nSTDERR: {stderr_message}")
+def prune_cache(cache_files, evict):
+    """
+    Removes the planned cache files while holding the dnf lock, see remove_all_dnf_cache.
+    """
+    return dnf_lock.run_serialized(lambda: dnf_cache_pruner.execute_prune(cache_files, evict), "prune")
+
+
+def are_updates_available(engine='dnf', installed=None):
+    if engine == 'native':
+        try:
+            updates_available, updates = update_engine.check_updates_native(installed=installed)
+            metrics.REGISTRY.set('pending_updates', len(updates))
+            update_history.record_check(updates)
+            return updates_available
+        except Exception as e:
+            message = f"native update check: An error occurred while reading the cached metadata: {str(e)}"
             logging.critical(message)
-        elif result.returncode == 100:
-            message = f"dnf check-update: Updates are available."
+            return False
+    try:
+        # Run the dnf check-update command and parse the updates while they are printed
+        result, updates = update_engine.run_check_update_coordinated()
+        if result.outcome.name in ('updates', 'success'):
+            update_history.record_check(updates)
+        if result.outcome.name == 'updates':
+            update_count = sum(1 for update in updates if update.obsoletes is None)
+            message = f"dnf check-update: {update_count} updates are available."
             logging.info(message)
+            metrics.REGISTRY.set('pending_updates', update_count)
             return True
-        elif result.returncode == 200:
-            message = f"dnf check-update: There was a problem with acquiring or releasing of locks."
-            logging.warning(message)
-        else:
-            message = (f"dnf check-update: Unexpected return code: {result.returncode}"
-                       f"\nSTDOUT: {stdout_message}"
-                       f"\nSTDERR: {stderr_message}")
-            logging.error(message)
-    except subprocess.CalledProcessError as e:
-        # Print any error that occurs during the subprocess call
-        message = f"dnf check-update: An error occurred while checking for updates call: {e.stderr.strip()}"
-        logging.error(message)
-    except subprocess.TimeoutExpired as e:
-        # Handle timeout exception
-        message = f"dnf check-update: The command timed out: {e.stderr.strip() if e.stderr else 'No stderr'}"
-        logging.error(message)
-    except subprocess.SubprocessError as e:
-        # Handle other subprocess errors
-        message = f"dnf check-update: A subprocess error occurred: {str(e)}"
-        logging.error(message)
+        if result.outcome.name == 'success':
+            metrics.REGISTRY.set('pending_updates', 0)
+        command_runner.log_result(result, "dnf check-update")
     except Exception as e:
         # Handle any other exceptions that occur during the subprocess run
         message = f"dnf check-update: An error occurred while checking for updates: {str(e)}"
         logging.critical(message)
-    finally:
-        return False
-
-
-def main():
+    return False
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Clean the dnf cache and check whether updates are available.')
+    parser.add_argument('--engine', choices=['dnf', 'native'], default='dnf',
+                        help='Run dnf check-update or compare the rpmdb with the cached metadata (default: %(default)s)')
+    parser.add_argument('--clean-all', action='store_true',
+                        help='Run dnf clean all and remove the whole cache instead of pruning it')
+    parser.add_argument('--max-age-days', type=float, default=dnf_cache_pruner.DEFAULT_MAX_AGE / 86400,
+                        help='Remove packages and stale metadata unused for this many days (default: %(default)s)')
+    parser.add_argument('--size-budget-mb', type=float, default=dnf_cache_pruner.DEFAULT_SIZE_BUDGET / 1024 ** 2,
+                        help='Prune the cache down to this size, least recently used first (default: %(default)s)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only print the planned schedule of the maintenance steps')
+    parser.add_argument('--textfile-dir', default=metrics.TEXTFILE_DIR,
+                        help='node_exporter textfile collector directory the metrics are written to '
+                             '(default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def build_maintenance_tasks(args):
+    """
+    Declares the maintenance flow as a task graph. Independent steps, like reading the rpmdb for the native
+    engine and scanning the cache, run concurrently.
+    """
+    if args.clean_all:
+        tasks = [
+            task_graph.Task('dnf_clean', lambda inputs: run_dnf_clean()),
+            task_graph.Task('remove_cache', lambda inputs: remove_all_dnf_cache(), ('dnf_clean',)),
+        ]
+        check_after = ('remove_cache',)
+    else:
+        max_age = args.max_age_days * 86400
+        size_budget = int(args.size_budget_mb * 1024 ** 2)
+        tasks = [
+            task_graph.Task('scan_cache', lambda inputs: dnf_cache_pruner.plan_prune(max_age=max_age,
+                                                                                     size_budget=size_budget)),
+            # Nothing to prune when the cache is within the budget and nothing expired
+            task_graph.Task('prune_cache', lambda inputs: prune_cache(*inputs['scan_cache']),
+                            ('scan_cache',), lambda inputs: bool(inputs['scan_cache'][1])),
+        ]
+        check_after = ('prune_cache',)
+    check_inputs = ()
+    if args.engine == 'native':
+        tasks.append(task_graph.Task('query_installed',
+                                     lambda inputs: list(update_engine.get_installed_packages())))
+        check_inputs = ('query_installed',)
+    # The check runs after the cache maintenance even if that failed, as it did before the task graph
+    tasks.append(task_graph.Task('check_updates',
+                                 lambda inputs: are_updates_available(args.engine, inputs.get('query_installed')),
+                                 check_inputs, after=check_after))
+    return tasks
+
+
+def record_task_metrics(runs):
+    for run in runs.values():
+        if run.status != 'skipped':
+            metrics.REGISTRY.observe('stage_duration_seconds', run.end - run.start, {'stage': run.name})
+    prune = runs.get('prune_cache')
+    if prune is not None and prune.status == 'done':
+        metrics.REGISTRY.set('dnf_cache_freed_bytes', prune.result.bytes_freed)
+        metrics.REGISTRY.inc('dnf_cache_freed_bytes_total', prune.result.bytes_freed)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
     configure_logging()
-    run_dnf_clean()
-    remove_all_dnf_cache()
-    are_updates_available()
+    tasks = build_maintenance_tasks(args)
+    if args.dry_run:
+        print(task_graph.format_plan(tasks))
+        return
+    metrics.enable()
+    runs = task_graph.run_graph(tasks)
+    record_task_metrics(runs)
+    report = task_graph.format_report(tasks, runs)
+    message = f"Maintenance run:\n{report}"
+    logging.info(message)
+    print(report)
+    metrics.write_textfile('dnf_clean_and_update_check', args.textfile_dir)
 
 
 if __name__ == "__main__":
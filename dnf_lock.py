@@ -0,0 +1,172 @@
+import fcntl
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+import state_files
+
+# Directory of the lock and the shared results, only root may create files in it
+LOCK_DIR = '/run/lock/python_scripts'
+# Lock file shared by all scripts which run dnf, only one of them runs dnf at a time
+LOCK_FILE = os.path.join(LOCK_DIR, 'dnf_scripts.lock')
+# Directory the results of coalescable dnf commands are shared through
+RESULT_DIR = LOCK_DIR
+# Seconds a caller waits for the lock before giving up
+DEFAULT_WAIT_TIMEOUT = 1800
+# Backoff between attempts, in seconds: a random time up to BACKOFF_BASE * 2 ** attempt, at most BACKOFF_MAX
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# Attempts of a command which failed because dnf's own lock was held, e.g. by an interactive dnf
+LOCKED_RETRIES = 5
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, maximum=BACKOFF_MAX):
+    """
+    Returns a random delay with exponential backoff, the jitter spreads out callers which started together.
+    """
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class DnfLock:
+    """
+    Exclusive lock of the shared lock file, acquired with jittered backoff.
+
+        with DnfLock():
+            run dnf
+
+    Raises TimeoutError if the lock is not acquired within wait_timeout seconds.
+    A caller which may not write the lock file, e.g. a monitoring probe not running as root, runs without
+    the lock, locked is then False. lock_file defaults to LOCK_FILE at the time the lock is created.
+    """
+
+    def __init__(self, lock_file=None, wait_timeout=DEFAULT_WAIT_TIMEOUT):
+        self.lock_file = lock_file or LOCK_FILE
+        self.wait_timeout = wait_timeout
+        self.fd = None
+
+    @property
+    def locked(self):
+        return self.fd is not None
+
+    def open_lock_file(self):
+        """
+        Returns a file descriptor of the lock file, or None if it may not be used by this caller.
+        """
+        if not state_files.ensure_private_dir(os.path.dirname(os.path.abspath(self.lock_file))):
+            return None
+        try:
+            fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        except PermissionError:
+            return None
+        if not state_files.is_trusted(os.fstat(fd)):
+            os.close(fd)
+            return None
+        # Other users must not open the lock file at all, flock() on a read-only descriptor would block dnf
+        os.fchmod(fd, 0o600)
+        return fd
+
+    def __enter__(self):
+        self.fd = self.open_lock_file()
+        if self.fd is None:
+            logging.debug('%s: The lock file may not be used, running without the lock.', self.lock_file)
+            return self
+        deadline = time.monotonic() + self.wait_timeout
+        attempt = 0
+        while True:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    os.close(self.fd)
+                    self.fd = None
+                    raise TimeoutError(f'{self.lock_file}: Lock not acquired within {self.wait_timeout}s')
+                if attempt == 0:
+                    message = f'{self.lock_file}: Another dnf command is running, waiting for it.'
+                    logging.info(message)
+                time.sleep(min(backoff_delay(attempt), max(0.0, deadline - time.monotonic())))
+                attempt += 1
+        os.ftruncate(self.fd, 0)
+        os.write(self.fd, f'{os.getpid()}\n'.encode())
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.fd is None:
+            return False
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+        return False
+
+
+def result_file(name, result_dir=None):
+    return os.path.join(result_dir or RESULT_DIR, f'dnf_scripts_{name}.json')
+
+
+def load_shared_result(name, finished_after, result_dir=None):
+    """
+    Returns the shared result of the command name if it finished after finished_after, otherwise None.
+    Results written by another user, or finishing in the future, e.g. after the clock was stepped back, are ignored.
+    """
+    try:
+        with state_files.open_trusted(result_file(name, result_dir)) as file:
+            shared = json.load(file)
+        finished = float(shared['finished'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if not finished_after <= finished <= time.time():
+        return None
+    return shared['result']
+
+
+def store_shared_result(name, result, result_dir=None):
+    result_dir = result_dir or RESULT_DIR
+    path = result_file(name, result_dir)
+    try:
+        with tempfile.NamedTemporaryFile('w', dir=result_dir, prefix=f'.dnf_scripts_{name}.', delete=False) as file:
+            json.dump({'finished': time.time(), 'pid': os.getpid(), 'result': result}, file)
+        os.replace(file.name, path)
+    except OSError as e:
+        message = f'{path}: Could not share the result: {e}'
+        logging.warning(message)
+
+
+def run_serialized(action, name, coalesce=False, is_locked=None, encode=None, decode=None, lock_file=None,
+                   result_dir=None, wait_timeout=DEFAULT_WAIT_TIMEOUT, retries=LOCKED_RETRIES):
+    """
+    Runs action() while holding the shared dnf lock, so that concurrent scripts queue up instead of failing.
+    With coalesce, a caller which arrives while the same command is running gets that command's result
+    instead of running it again. encode and decode convert the result to and from JSON for sharing,
+    encode returns None for a result which should not be shared.
+    is_locked(result) tells whether dnf failed on its own lock (exit code 200), the action is then
+    retried with jittered backoff up to retries times.
+    Without the lock, see DnfLock, results are neither shared nor taken from other callers.
+    lock_file and result_dir default to LOCK_FILE and RESULT_DIR at the time of the call.
+    """
+    arrived = time.time()
+    with DnfLock(lock_file, wait_timeout) as lock:
+        coalesce = coalesce and lock.locked
+        if coalesce:
+            shared = load_shared_result(name, arrived, result_dir)
+            if shared is not None:
+                message = f'dnf {name}: Using the result of the run which finished while waiting for the lock.'
+                logging.info(message)
+                return decode(shared) if decode else shared
+        attempt = 0
+        while True:
+            result = action()
+            if is_locked is None or not is_locked(result) or attempt >= retries:
+                break
+            delay = backoff_delay(attempt)
+            message = f'dnf {name}: dnf is locked by another process, retrying in {delay:.1f}s.'
+            logging.warning(message)
+            time.sleep(delay)
+            attempt += 1
+        shared = encode(result) if encode else result
+        # encode returns None for results which must not be shared, e.g. failures
+        if coalesce and shared is not None:
+            store_shared_result(name, shared, result_dir)
+        return result
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import json
+import logging
+import shlex
+import statistics
+import sys
+import time
+
+import command_runner
+import host_facts
+import list_sessions
+import script_logging
+import update_engine
+import update_history
+
+log_file = "fleet.log"
+
+# Default transport, '{host}' is replaced by the host name and the remote command is appended
+SSH_TRANSPORT = 'ssh -o BatchMode=yes -o ConnectTimeout=10 {host}'
+# Remote commands run per job, their output is parsed locally with the parsers of the single-host scripts
+JOB_COMMANDS = {
+    'sessions': ("ids=$(loginctl list-sessions --no-legend | awk '{print $1}'); "
+                 "[ -z \"$ids\" ] || loginctl show-session $ids --property="
+                 + ','.join(list_sessions.SESSION_PROPERTIES)),
+    'updates': 'dnf check-update',
+    'release': 'cat /etc/os-release 2>/dev/null || head -n 1 /etc/redhat-release',
+}
+# ssh exits with 255 when it could not connect or authenticate
+SSH_ERROR = 255
+UNREACHABLE_OUTCOME = command_runner.Outcome('unreachable', logging.ERROR, 'The host could not be reached')
+# Seconds a job may take on a single host
+DEFAULT_TIMEOUT = 300
+# Jobs running at the same time across the fleet
+DEFAULT_CONCURRENCY = 32
+# A host is a straggler when it took longer than this many times the median host
+STRAGGLER_FACTOR = 3
+
+
+def configure_logging():
+    script_logging.configure_logging(log_file, logging.INFO, '%(asctime)s %(levelname)s: %(message)s',
+                                     max_bytes=script_logging.MAX_BYTES)
+
+
+def build_command(transport, host, remote_command):
+    """
+    Returns the local command which runs remote_command on host through the transport template.
+    """
+    command = [part.replace('{host}', host) for part in shlex.split(transport)]
+    if '{host}' not in transport:
+        command.append(host)
+    return command + [remote_command]
+
+
+def parse_sessions(stdout):
+    return [details.as_dict() for details in list_sessions.parse_show_session_output(stdout)]
+
+
+def parse_updates(stdout):
+    return [update._asdict() for update in update_engine.parse_check_update_output(stdout)]
+
+
+def parse_release(stdout):
+    facts = host_facts.facts_from_text(stdout)
+    if facts is None:
+        raise ValueError('unrecognized OS release format')
+    return facts._asdict()
+
+
+JOB_PARSERS = {
+    'sessions': parse_sessions,
+    'updates': parse_updates,
+    'release': parse_release,
+}
+JOB_OUTCOMES = {
+    'sessions': command_runner.EXIT_CODE_OUTCOMES[('loginctl',)],
+    'updates': command_runner.EXIT_CODE_OUTCOMES[('dnf', 'check-update')],
+    'release': command_runner.DEFAULT_OUTCOMES,
+}
+# Outcomes whose output is parsed, any other outcome (e.g. dnf 'locked') is reported as an error
+PARSED_OUTCOMES = {'success', 'updates'}
+
+
+async def run_job(host, job, transport, timeout, semaphore):
+    """
+    Runs one job on one host and returns its record, failures are reported in the record and never raised.
+    """
+    command = build_command(transport, host, JOB_COMMANDS[job])
+    result = await command_runner.run_command_async(command, timeout=timeout, semaphore=semaphore,
+                                                    outcomes=JOB_OUTCOMES[job])
+    outcome = result.outcome
+    if result.returncode == SSH_ERROR and command[0] == 'ssh':
+        outcome = UNREACHABLE_OUTCOME
+    record = {
+        'host': host,
+        'job': job,
+        'status': outcome.name,
+        'returncode': result.returncode,
+        'seconds': round(result.seconds, 3),
+    }
+    if outcome.name in PARSED_OUTCOMES and not result.timed_out:
+        try:
+            record['result'] = JOB_PARSERS[job](result.stdout)
+        except Exception as e:
+            record['status'] = 'error'
+            record['error'] = f'Could not parse the output: {e}'
+    else:
+        record['error'] = outcome.description
+        if result.stderr.strip():
+            record['error'] += f': {result.stderr.strip()}'
+
+    level = logging.INFO if 'error' not in record else logging.ERROR
+    message = f'{host} {job}: {record["status"]} in {record["seconds"]}s'
+    logging.log(level, message)
+    return record
+
+
+def straggler_report(host_seconds, factor=STRAGGLER_FACTOR):
+    """
+    Returns the hosts which took more than factor times the median host, slowest first.
+    """
+    if not host_seconds:
+        return {'median_seconds': None, 'stragglers': []}
+    median = statistics.median(host_seconds.values())
+    stragglers = sorted(((seconds, host) for host, seconds in host_seconds.items() if seconds > median * factor),
+                        reverse=True)
+    return {
+        'median_seconds': round(median, 3),
+        'stragglers': [{'host': host, 'seconds': round(seconds, 3)} for seconds, host in stragglers],
+    }
+
+
+async def run_fleet(hosts, jobs, transport=SSH_TRANSPORT, timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY,
+                    output=None, history_db=None):
+    """
+    Runs the jobs on all hosts, at most concurrency at a time, and writes every record as a JSON line as soon
+    as it is finished. With history_db, the updates of every host are recorded in that update history.
+    Returns the straggler report.
+    """
+    output = output or sys.stdout
+    semaphore = asyncio.Semaphore(concurrency)
+    # The jobs of a host run concurrently, the slowest one is the time of the host
+    host_seconds = dict.fromkeys(hosts, 0.0)
+    tasks = [asyncio.ensure_future(run_job(host, job, transport, timeout, semaphore)) for host in hosts for job in jobs]
+    for task in asyncio.as_completed(tasks):
+        record = await task
+        host_seconds[record['host']] = max(host_seconds[record['host']], record['seconds'])
+        if history_db and record['job'] == 'updates' and 'error' not in record:
+            updates = [update_engine.Update(**update) for update in record['result']]
+            update_history.record_check(updates, record['host'], history_db)
+        print(json.dumps(record), file=output, flush=True)
+    return straggler_report(host_seconds)
+
+
+def read_hosts(path):
+    with open(path, 'r') as file:
+        return [line.split('#', 1)[0].strip() for line in file if line.split('#', 1)[0].strip()]
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Collect sessions, updates and the release of many hosts.')
+    parser.add_argument('hosts', nargs='*', help='Host names')
+    parser.add_argument('--hosts-file', help='File with one host per line, # starts a comment')
+    parser.add_argument('--jobs', default=','.join(JOB_COMMANDS),
+                        help='Comma separated jobs to run (default: %(default)s)')
+    parser.add_argument('--transport', default=SSH_TRANSPORT,
+                        help='Command template reaching a host, {host} is replaced (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='Seconds a job may take per host (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Jobs running at the same time (default: %(default)s)')
+    parser.add_argument('--history', action='store_true',
+                        help='Record the updates of every host in the update history database')
+    parser.add_argument('--history-db', default=update_history.HISTORY_DB,
+                        help='Update history database used with --history (default: %(default)s)')
+    args = parser.parse_args(argv)
+    args.jobs = [job.strip() for job in args.jobs.split(',') if job.strip()]
+    unknown = set(args.jobs) - set(JOB_COMMANDS)
+    if unknown:
+        parser.error(f'unknown jobs: {", ".join(sorted(unknown))}')
+    if args.hosts_file:
+        args.hosts += read_hosts(args.hosts_file)
+    if not args.hosts:
+        parser.error('no hosts given')
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    configure_logging()
+    start = time.monotonic()
+    report = asyncio.run(run_fleet(args.hosts, args.jobs, args.transport, args.timeout, args.concurrency,
+                                     history_db=args.history_db if args.history else None))
+    report['report'] = 'stragglers'
+    report['total_seconds'] = round(time.monotonic() - start, 3)
+    print(json.dumps(report), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import re
+import shlex
+import tempfile
+from collections import namedtuple
+
+import state_files
+
+# os-release files in the order systemd reads them
+OS_RELEASE_FILES = ('/etc/os-release', '/usr/lib/os-release')
+# Fallback for old releases without os-release
+REDHAT_RELEASE_FILE = '/etc/redhat-release'
+# On-disk cache of the facts, valid as long as the release files are unchanged
+CACHE_FILE = os.path.join(state_files.STATE_DIR, 'host_facts_cache.json')
+
+# Matches e.g. 'Rocky Linux release 9.3 (Blue Onyx)' and 'Fedora release 39 (Thirty Nine)'
+REDHAT_RELEASE_PATTERN = re.compile(r'(.+?) release (\d+)(?:\.(\d+))?')
+# os-release ID of the distribution names printed in redhat-release
+REDHAT_RELEASE_IDS = {
+    'CentOS Linux': 'centos',
+    'CentOS Stream': 'centos',
+    'Rocky Linux': 'rocky',
+    'AlmaLinux': 'almalinux',
+    'Red Hat Enterprise Linux': 'rhel',
+    'Red Hat Enterprise Linux Server': 'rhel',
+    'Oracle Linux Server': 'ol',
+    'Fedora': 'fedora',
+}
+# ID_LIKE of the IDs derived from redhat-release, which do not state it
+REDHAT_RELEASE_ID_LIKE = {
+    'centos': ('rhel', 'fedora'),
+    'rocky': ('rhel', 'centos', 'fedora'),
+    'almalinux': ('rhel', 'centos', 'fedora'),
+    'rhel': ('fedora',),
+    'ol': ('fedora',),
+    'fedora': (),
+}
+
+HostFacts = namedtuple('HostFacts', ['id', 'name', 'version_id', 'id_like', 'major', 'minor', 'package_manager',
+                                     'source'])
+
+# Facts read in this process by the release files they were read from, see get_host_facts
+_facts = {}
+
+
+def parse_os_release(content):
+    """
+    Parses the KEY=value lines of an os-release file into a dict, values may be shell quoted.
+    """
+    fields = {}
+    for line in content.splitlines():
+        key, separator, value = line.strip().partition('=')
+        if not separator or key.startswith('#'):
+            continue
+        try:
+            words = shlex.split(value)
+        except ValueError:
+            words = [value]
+        fields[key] = ' '.join(words)
+    return fields
+
+
+def split_version(version_id):
+    """
+    Returns (major, minor) as ints of a version like '9.3', missing or non-numeric parts are None.
+    """
+    parts = (version_id or '').split('.')
+    major = int(parts[0]) if parts[0].isdigit() else None
+    minor = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+    return major, minor
+
+
+def package_manager(distribution_id, id_like, major):
+    family = {distribution_id, *id_like}
+    if family & {'fedora', 'rhel', 'centos'}:
+        if distribution_id == 'fedora':
+            return 'dnf' if major is None or major >= 22 else 'yum'
+        return 'dnf' if major is None or major >= 8 else 'yum'
+    if family & {'debian', 'ubuntu'}:
+        return 'apt'
+    if family & {'suse', 'opensuse'}:
+        return 'zypper'
+    return None
+
+
+def facts_from_os_release(fields, source):
+    distribution_id = fields.get('ID', 'linux').lower()
+    id_like = tuple(fields.get('ID_LIKE', '').lower().split())
+    version_id = fields.get('VERSION_ID')
+    major, minor = split_version(version_id)
+    return HostFacts(distribution_id, fields.get('NAME', distribution_id), version_id, id_like, major, minor,
+                     package_manager(distribution_id, id_like, major), source)
+
+
+def facts_from_redhat_release(line, source):
+    """
+    Returns the HostFacts of the first line of a redhat-release file, or None if it is not recognized.
+    """
+    match = REDHAT_RELEASE_PATTERN.match(line.strip())
+    if not match or match.group(1) not in REDHAT_RELEASE_IDS:
+        return None
+    distribution_id = REDHAT_RELEASE_IDS[match.group(1)]
+    id_like = REDHAT_RELEASE_ID_LIKE[distribution_id]
+    major = int(match.group(2))
+    minor = int(match.group(3)) if match.group(3) else None
+    version_id = match.group(2) if minor is None else f'{major}.{minor}'
+    return HostFacts(distribution_id, match.group(1), version_id, id_like, major, minor,
+                     package_manager(distribution_id, id_like, major), source)
+
+
+def facts_from_text(text, source=None):
+    """
+    Returns the HostFacts of the content of either an os-release or a redhat-release file, or None.
+    """
+    fields = parse_os_release(text)
+    if 'ID' in fields:
+        return facts_from_os_release(fields, source)
+    first_line = text.strip().split('\n', 1)[0]
+    return facts_from_redhat_release(first_line, source)
+
+
+def read_host_facts(os_release_files=OS_RELEASE_FILES, redhat_release_file=REDHAT_RELEASE_FILE):
+    """
+    Reads the facts from the first os-release file, or from redhat-release. Returns None if neither is usable.
+    """
+    for path in (*os_release_files, redhat_release_file):
+        try:
+            with open(path, 'r') as file:
+                facts = facts_from_text(file.read(), path)
+        except OSError:
+            continue
+        if facts is not None:
+            return facts
+        logging.warning('%s: Unrecognized OS release format.', path)
+    return None
+
+
+def release_files_signature(paths):
+    """
+    Returns the modification time and size of each existing release file, it changes when one of them changes.
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        signature.append([path, stat.st_mtime_ns, stat.st_size])
+    return signature
+
+
+def load_cached_facts(signature, cache_file=CACHE_FILE):
+    try:
+        with state_files.open_trusted(cache_file) as file:
+            cached = json.load(file)
+        if cached['signature'] != signature:
+            return None
+        facts = cached['facts']
+        facts['id_like'] = tuple(facts['id_like'])
+        return HostFacts(**facts)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        message = f'{cache_file}: Could not read the cached host facts: {e}'
+        logging.warning(message)
+        return None
+
+
+def store_facts(facts, signature, cache_file=CACHE_FILE):
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    if not state_files.ensure_private_dir(directory):
+        return
+    try:
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.host_facts.', delete=False) as file:
+            json.dump({'signature': signature, 'facts': facts._asdict()}, file)
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, cache_file)
+    except OSError as e:
+        message = f'{cache_file}: Could not cache the host facts: {e}'
+        logging.warning(message)
+
+
+def get_host_facts(refresh=False, os_release_files=OS_RELEASE_FILES, redhat_release_file=REDHAT_RELEASE_FILE,
+                   cache_file=CACHE_FILE):
+    """
+    Returns the HostFacts of this host, or None if the release could not be determined.
+    The facts are read once per process and kept in cache_file until one of the release files changes,
+    refresh reads them again.
+    """
+    key = (tuple(os_release_files), redhat_release_file, cache_file)
+    if key in _facts and not refresh:
+        return _facts[key]
+    signature = release_files_signature((*os_release_files, redhat_release_file))
+    facts = None if refresh else load_cached_facts(signature, cache_file)
+    if facts is None:
+        facts = read_host_facts(os_release_files, redhat_release_file)
+        if facts is not None:
+            store_facts(facts, signature, cache_file)
+    _facts[key] = facts
+    return facts
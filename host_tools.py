@@ -0,0 +1,76 @@
+import argparse
+import importlib
+import logging
+import sys
+
+# Subcommands and the module implementing each, a module is only imported when its subcommand runs
+SUBCOMMANDS = {
+    'sessions': ('list_sessions', 'List the logind sessions and their details'),
+    'updates': ('check_updates', 'Check whether package updates are available'),
+    'release': ('release', 'Determine the distribution of this host'),
+    'maintain': ('dnf_clean_and_update_check', 'Clean the dnf cache and check whether updates are available'),
+}
+# Separates the subcommands run one after the other in the same process
+SEPARATOR = '+'
+
+
+def split_invocations(arguments):
+    """
+    Splits ['sessions', '--backend', 'statefiles', '+', 'updates'] into
+    [('sessions', ['--backend', 'statefiles']), ('updates', [])].
+    """
+    invocations = [[]]
+    for argument in arguments:
+        if argument == SEPARATOR:
+            invocations.append([])
+        else:
+            invocations[-1].append(argument)
+    return [(invocation[0], invocation[1:]) for invocation in invocations if invocation]
+
+
+def run_subcommand(name, arguments):
+    """
+    Imports the module of a subcommand and runs its main. Returns the exit status of the subcommand.
+    """
+    module = importlib.import_module(SUBCOMMANDS[name][0])
+    try:
+        module.main(arguments)
+        return 0
+    except SystemExit as e:
+        # argparse exits for --help and for invalid options
+        return e.code if isinstance(e.code, int) else 1
+    except Exception as e:
+        message = f'{name}: An unexpected error occurred: {e}'
+        logging.error(message)
+        print(message, file=sys.stderr)
+        return 1
+
+
+def parse_arguments(argv=None):
+    epilog = '\n'.join(f'  {name:<10} {description}' for name, (_, description) in SUBCOMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description='Run the host maintenance scripts, several subcommands may run in one process.',
+        usage=f'%(prog)s SUBCOMMAND [options] [{SEPARATOR} SUBCOMMAND [options] ...]',
+        epilog=f'subcommands:\n{epilog}\n\nRun "%(prog)s SUBCOMMAND --help" for the options of a subcommand.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('invocations', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    args.invocations = split_invocations(args.invocations)
+    if not args.invocations:
+        parser.error('no subcommand given')
+    unknown = [name for name, _ in args.invocations if name not in SUBCOMMANDS]
+    if unknown:
+        parser.error(f'unknown subcommands: {", ".join(unknown)}')
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    status = 0
+    for name, arguments in args.invocations:
+        status = max(status, run_subcommand(name, arguments))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
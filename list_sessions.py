@@ -1,9 +1,66 @@
-import subprocess
+import argparse
+import csv
+import json
+import os
+import select
 import re
 import logging
+import sys
+import time
+from datetime import datetime
+
+import command_runner
+import metrics
+import script_logging
 
 log_file = "sessions.log"
 
+# Directory where systemd-logind keeps one key=value state file per session
+SESSIONS_DIR = '/run/systemd/sessions'
+# Keys of a logind session state file and the details key each one maps to
+STATE_FILE_KEYS = {
+    'LEADER': 'Leader',
+    'SEAT': 'Seat',
+    'DISPLAY': 'Display',
+    'SERVICE': 'Service',
+    'DESKTOP': 'Desktop',
+    'STATE': 'State',
+    'SCOPE': 'Unit',
+}
+
+# Properties requested from 'loginctl show-session' and the details key each one maps to
+SESSION_PROPERTIES = {
+    'Id': 'SessionID',
+    'Timestamp': 'Since',
+    'Leader': 'Leader',
+    'Seat': 'Seat',
+    'Display': 'Display',
+    'Service': 'Service',
+    'Desktop': 'Desktop',
+    'State': 'State',
+    'IdleHint': 'Idle',
+    'Scope': 'Unit',
+    # Microseconds since the epoch, 0 when the session is not idle
+    'IdleSinceHint': 'IdleSince',
+}
+# Fields of a session record, in the order they are printed
+SESSION_FIELDS = ('SessionID', 'Since', 'Leader', 'Seat', 'Display', 'Service', 'Desktop', 'State', 'Idle', 'Unit',
+                  'IdleSince')
+# Matches the 'Field: value' lines of 'loginctl session-status', which prints the fields from Since to Unit
+SESSION_STATUS_PATTERN = re.compile(r'(' + '|'.join(SESSION_FIELDS[1:10]) + r'): +(.+)')
+# Fields of the exported session records, IdleSeconds is computed from Idle and IdleSince
+EXPORT_FIELDS = SESSION_FIELDS + ('IdleSeconds',)
+# Fields only loginctl knows, the logind state files have no idle information
+IDLE_FIELDS = ('Idle', 'IdleSince', 'IdleSeconds')
+# Sessions requested per 'loginctl show-session' call while exporting, bounds the output held in memory
+EXPORT_CHUNK_SIZE = 1000
+# Upper bound of concurrent 'loginctl session-status' calls when batching is not possible
+MAX_WORKERS = 8
+# Seconds a loginctl call may take before it is terminated
+LOGINCTL_TIMEOUT = 30
+# Bytes of output kept from the batched 'loginctl show-session', enough for tens of thousands of sessions
+LOGINCTL_MAX_OUTPUT = 64 * 1024 * 1024
+
 
 def configure_logging():
     """
@@ -24,79 +81,441 @@ logging.WARNING  30 An indication that something unexpected happened, or that a
 logging.ERROR    40 Due to a more serious problem, the software has not been able to perform some function.
 logging.CRITICAL 50 A serious error, indicating that the program itself may be unable to continue running.
     """
-    logging.basicConfig(filename=log_file,
-                        level=logging.DEBUG,
-                        format='%(asctime)s %(levelname)s: %(message)s')
+    script_logging.configure_logging(log_file, logging.DEBUG, '%(asctime)s %(levelname)s: %(message)s',
+                                     max_bytes=script_logging.MAX_BYTES)
+
+
+class SessionDetails:
+    """
+    Compact record of the details of one session. Fields missing from the source are None.
+    Supports the dict-style access (details['Service'], details.get(), details.items()) of the printing helpers.
+    """
+    __slots__ = SESSION_FIELDS
+
+    def __init__(self, SessionID=None, Since=None, Leader=None, Seat=None, Display=None, Service=None, Desktop=None,
+                 State=None, Idle=None, Unit=None, IdleSince=None):
+        self.SessionID = SessionID
+        self.Since = Since
+        self.Leader = Leader
+        self.Seat = Seat
+        self.Display = Display
+        self.Service = Service
+        self.Desktop = Desktop
+        self.State = State
+        self.Idle = Idle
+        self.Unit = Unit
+        self.IdleSince = IdleSince
+
+    def __getitem__(self, key):
+        if key not in SESSION_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __eq__(self, other):
+        if not isinstance(other, SessionDetails):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in SESSION_FIELDS)
+
+    def __repr__(self):
+        return f'SessionDetails({self.as_dict()})'
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in SESSION_FIELDS else None
+        return default if value is None else value
+
+    def items(self):
+        return ((name, getattr(self, name)) for name in SESSION_FIELDS)
+
+    def as_dict(self):
+        return dict(self.items())
 
 
 def get_session_ids():
     try:
-        message = f'Running loginctl command: loginctl list-session --no-legend'
-        logging.debug(message)
-        result = subprocess.run(['loginctl', 'list-sessions', '--no-legend'],
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
-        message = f'Command output:\n{result.stdout}'
-        logging.debug(message)
-        output = result.stdout.strip()
-        session_ids = re.findall(r'^\S+', output, re.MULTILINE)
-        message = f'Extracted session IDs: {session_ids}'
-        logging.info(message)
+        logging.debug('Running loginctl command: loginctl list-session --no-legend')
+        result = command_runner.run_command(['loginctl', 'list-sessions', '--no-legend'], timeout=LOGINCTL_TIMEOUT)
+        if result.outcome is not command_runner.SUCCESS:
+            command_runner.log_result(result, 'loginctl list-session')
+            return None
+        logging.debug('Command output:\n%s', script_logging.Payload(result.stdout))
+        # loginctl right-aligns the session IDs, so every line may start with spaces
+        session_ids = re.findall(r'^\s*(\S+)', result.stdout, re.MULTILINE)
+        logging.info('Extracted %d session IDs: %s', len(session_ids), script_logging.Payload(session_ids))
         return session_ids
-    except subprocess.CalledProcessError as e:
-        # Print any error that occurs during the subprocess call
-        error_message = (f'loginctl list-session: '
-                         f'An error occurred while checking the state of the login manager call: {e.stderr.strip()}')
-        logging.error(error_message)
     except Exception as e:
         # Handle any exceptions that occur during the subprocess run
         error_message = (f'loginctl list-session: '
-                         f'An error occurred while checking the state of the login manager: {e.stderr.strip()}')
+                         f'An error occurred while checking the state of the login manager: {e}')
         logging.critical(error_message)
 
 
+def parse_session_status_output(session_id, output):
+    """
+    Parses the output of 'loginctl session-status' in a single pass of one precompiled pattern.
+    Fields which are not printed (e.g. Seat and Display of SSH sessions) are left as None.
+    """
+    fields = {}
+    for key, value in SESSION_STATUS_PATTERN.findall(output):
+        # The first occurrence wins, later ones may come from the command lines of the cgroup tree
+        if key not in fields:
+            fields[key] = value
+    # Keep only the first part of e.g. 'Leader: 1234 (sshd)', 'Service: sshd; type tty' and 'Unit: session-2.scope'
+    if 'Leader' in fields:
+        fields['Leader'] = fields['Leader'].split(None, 1)[0]
+    if 'Service' in fields:
+        fields['Service'] = fields['Service'].split(';', 1)[0]
+    if 'Unit' in fields:
+        fields['Unit'] = fields['Unit'].split(None, 1)[0]
+    return SessionDetails(SessionID=session_id, **fields)
+
+
+def session_status_command(session_id):
+    return ['loginctl', 'session-status', session_id, '-o', 'short']
+
+
+def session_details_from_result(session_id, result):
+    """
+    Parses the result of a 'loginctl session-status' command, returns None if the command failed.
+    """
+    if result.outcome is not command_runner.SUCCESS:
+        command_runner.log_result(result, f'loginctl session-status {session_id}')
+        return None
+    logging.debug('Session details output:\n%s', script_logging.Payload(result.stdout))
+    with metrics.timed('parse_session_status'):
+        details = parse_session_status_output(session_id, result.stdout)
+    logging.debug('Extracted details: %s', details)
+    return details
+
+
 def get_session_details(session_id):
     try:
-        message = f'Getting details for session ID: {session_id}'
-        logging.debug(message)
-        result = subprocess.run(['loginctl', 'session-status', session_id, '-o', 'short'],
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
-        message = f'Session details output:\n{result.stdout}'
-        logging.debug(message)
-        output = result.stdout.strip()
-        details = {
-            'SessionID': session_id,
-            'Since': re.search(r'Since:\s+(.+)', output).group(1),
-            'Leader': re.search(r'Leader:\s+(\d+)', output).group(1),
-            'Seat': re.search(r'Seat:\s+(.+)', output).group(1),
-            'Display': re.search(r'Display:\s+(.+)', output).group(1),
-            'Service': re.search(r'Service:\s+(.+)', output).group(1),
-            'Desktop': re.search(r'Desktop:\s+(.+)', output).group(1),
-            'State': re.search(r'State:\s+(.+)', output).group(1),
-            'Idle': re.search(r'Idle:\s+(.+)', output).group(1),
-            'Unit': re.search(r'Unit:\s+(\S+)', output).group(1),
-        }
-        message = f'Extracted details: {details}'
-        logging.debug(message)
-        return details
-    except subprocess.CalledProcessError as e:
-        # Print any error that occurs during the subprocess call
-        error_message = (f'loginctl session-status: '
-                         f'An unexpected error occurred while processing session call: {e.stderr.strip()}')
-        logging.error(error_message)
-        return None
+        logging.debug('Getting details for session ID: %s', session_id)
+        result = command_runner.run_command(session_status_command(session_id), timeout=LOGINCTL_TIMEOUT)
+        return session_details_from_result(session_id, result)
     except Exception as e:
         # Handle any exceptions that occur during the subprocess run
         error_message = (f'loginctl session-status: '
-                         f'An unexpected error occurred while processing session: {e.stderr.strip()}')
+                         f'An unexpected error occurred while processing session: {e}')
         logging.critical(error_message)
         return None
 
 
+def parse_show_session_output(output):
+    """
+    Parses the key=value blocks printed by 'loginctl show-session' for one or more sessions.
+    Blocks are separated by an empty line. Returns a list of SessionDetails.
+    """
+    sessions = []
+    fields = {}
+    for line in output.splitlines():
+        if not line.strip():
+            if fields:
+                sessions.append(SessionDetails(**fields))
+                fields = {}
+            continue
+        key, _, value = line.partition('=')
+        if key in SESSION_PROPERTIES and value:
+            fields[SESSION_PROPERTIES[key]] = value
+    if fields:
+        sessions.append(SessionDetails(**fields))
+    return sessions
+
+
+def get_all_session_details_batched(session_ids):
+    """
+    Gets the details of all sessions with a single 'loginctl show-session' call.
+    Returns None if loginctl fails, e.g. when a session disappeared meanwhile.
+    """
+    properties = ','.join(SESSION_PROPERTIES)
+    logging.debug('Running loginctl command: loginctl show-session %d sessions --property=%s', len(session_ids),
+                  properties)
+    result = command_runner.run_command(['loginctl', 'show-session', *session_ids, f'--property={properties}'],
+                                        timeout=LOGINCTL_TIMEOUT, max_output=LOGINCTL_MAX_OUTPUT)
+    if result.outcome is not command_runner.SUCCESS or result.truncated:
+        command_runner.log_result(result, 'loginctl show-session')
+        return None
+    with metrics.timed('parse_show_session'):
+        sessions = parse_show_session_output(result.stdout)
+    if len(sessions) != len(session_ids):
+        message = f'loginctl show-session: Expected {len(session_ids)} sessions, got {len(sessions)}'
+        logging.warning(message)
+        return None
+    return sessions
+
+
+def get_all_session_details(session_ids, max_workers=MAX_WORKERS):
+    """
+    Gets the details of all sessions in one batched loginctl call.
+    Falls back to at most max_workers concurrent 'loginctl session-status' calls when batching fails.
+    Sessions which could not be read are returned as None, in the order of session_ids.
+    """
+    if not session_ids:
+        return []
+    try:
+        sessions = get_all_session_details_batched(session_ids)
+        if sessions is not None:
+            return sessions
+    except Exception as e:
+        message = f'loginctl show-session: An unexpected error occurred: {e}'
+        logging.critical(message)
+    message = f'loginctl show-session: Batched call failed, falling back to per-session calls'
+    logging.warning(message)
+    results = command_runner.run_commands([session_status_command(session_id) for session_id in session_ids],
+                                          concurrency=max_workers, timeout=LOGINCTL_TIMEOUT)
+    return [session_details_from_result(session_id, result) for session_id, result in zip(session_ids, results)]
+
+
+def get_session_ids_from_state_files(sessions_dir=SESSIONS_DIR):
+    """
+    Lists the session IDs from the logind state directory without calling loginctl.
+    Entries with a dot in their name (e.g. the '<id>.ref' FIFOs) are not sessions and are skipped.
+    """
+    try:
+        with os.scandir(sessions_dir) as entries:
+            session_ids = sorted((entry.name for entry in entries if '.' not in entry.name and entry.is_file()),
+                                 key=lambda session_id: (len(session_id), session_id))
+        logging.info('Extracted %d session IDs from %s: %s', len(session_ids), sessions_dir,
+                     script_logging.Payload(session_ids))
+        return session_ids
+    except OSError as e:
+        error_message = f'{sessions_dir}: An error occurred while reading the session state files: {e}'
+        logging.error(error_message)
+
+
+def parse_session_state_file(session_id, content):
+    """
+    Parses the content of a logind session state file into a SessionDetails.
+    The state file has no idle information, so 'Idle' is always None.
+    """
+    fields = {}
+    for line in content.splitlines():
+        key, _, value = line.partition('=')
+        if key in STATE_FILE_KEYS and value:
+            fields[STATE_FILE_KEYS[key]] = value
+        elif key == 'REALTIME' and value.isdigit():
+            fields['Since'] = datetime.fromtimestamp(int(value) / 1000000).strftime('%a %Y-%m-%d %H:%M:%S')
+    return SessionDetails(SessionID=session_id, **fields)
+
+
+def get_session_details_from_state_file(session_id, sessions_dir=SESSIONS_DIR):
+    try:
+        with open(os.path.join(sessions_dir, session_id), 'r') as file:
+            details = parse_session_state_file(session_id, file.read())
+        logging.debug('Extracted details: %s', details)
+        return details
+    except OSError as e:
+        # The session may have ended between listing and reading
+        error_message = f'{sessions_dir}: An error occurred while reading session {session_id}: {e}'
+        logging.error(error_message)
+        return None
+
+
+def select_backend(backend='auto', sessions_dir=SESSIONS_DIR, needs_idle=False):
+    """
+    Returns 'statefiles' or 'loginctl'. With 'auto', the state files are used when the logind state directory exists,
+    unless needs_idle asks for the idle information only loginctl has.
+    """
+    if backend == 'auto':
+        backend = 'statefiles' if os.path.isdir(sessions_dir) and not needs_idle else 'loginctl'
+    logging.debug('Using the %s session backend.', backend)
+    return backend
+
+
+# inotify event mask for the session state directory: logind replaces state files by renaming a temporary file
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0x00000800
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+def open_inotify(sessions_dir):
+    """
+    Returns an inotify file descriptor watching sessions_dir, or None when inotify is not available.
+    """
+    # Only watch mode needs ctypes, importing it is left out of the start of the script
+    import ctypes
+    import ctypes.util
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(fd, os.fsencode(sessions_dir), WATCH_MASK) < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed')
+        return fd
+    except (OSError, AttributeError) as e:
+        message = f'inotify is not available, falling back to mtime polling: {e}'
+        logging.warning(message)
+        return None
+
+
+def wait_for_change(inotify_fd, interval):
+    """
+    Blocks until the watched directory changes or interval seconds have passed.
+    Without inotify it just sleeps, and the caller compares the mtimes.
+    """
+    if inotify_fd is None:
+        time.sleep(interval)
+        return
+    readable, _, _ = select.select([inotify_fd], [], [], interval)
+    if readable:
+        # The events themselves are not needed, the directory is rescanned
+        try:
+            while os.read(inotify_fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+
+def scan_session_mtimes(sessions_dir):
+    """
+    Returns {session_id: mtime_ns} of the session state files, using only the scandir entries.
+    """
+    mtimes = {}
+    try:
+        with os.scandir(sessions_dir) as entries:
+            for entry in entries:
+                if '.' not in entry.name and entry.is_file():
+                    mtimes[entry.name] = entry.stat().st_mtime_ns
+    except FileNotFoundError:
+        pass
+    return mtimes
+
+
+def apply_session_changes(sessions, mtimes, new_mtimes, sessions_dir):
+    """
+    Updates the in-memory session table for the state files which were added, removed or modified.
+    Only new and changed sessions are read and checked for lightdm. Returns the change events.
+    """
+    events = []
+    for session_id in mtimes.keys() - new_mtimes.keys():
+        sessions.pop(session_id, None)
+        events.append({'event': 'removed', 'SessionID': session_id})
+    for session_id, mtime in new_mtimes.items():
+        if mtimes.get(session_id) == mtime:
+            continue
+        details = get_session_details_from_state_file(session_id, sessions_dir)
+        if details is None:
+            continue
+        old_details = sessions.get(session_id)
+        if old_details is None:
+            events.append({'event': 'added', 'details': details.as_dict()})
+        else:
+            changes = {key: value for key, value in details.items() if old_details.get(key) != value}
+            if not changes:
+                continue
+            events.append({'event': 'changed', 'SessionID': session_id, 'changes': changes})
+        sessions[session_id] = details
+        it_is_lightdm_service(details)
+    return events
+
+
+def watch_sessions(sessions_dir=SESSIONS_DIR, interval=5.0, output=None):
+    """
+    Keeps a table of the sessions and prints the changes as JSON lines until interrupted.
+    The first scan reports every existing session as added.
+    """
+    inotify_fd = open_inotify(sessions_dir)
+    sessions = {}
+    mtimes = {}
+    try:
+        while True:
+            new_mtimes = scan_session_mtimes(sessions_dir)
+            for event in apply_session_changes(sessions, mtimes, new_mtimes, sessions_dir):
+                print(json.dumps(event), file=output, flush=True)
+            mtimes = new_mtimes
+            wait_for_change(inotify_fd, interval)
+    finally:
+        if inotify_fd is not None:
+            os.close(inotify_fd)
+
+
+def iter_session_details(session_ids, backend='loginctl', sessions_dir=SESSIONS_DIR, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the SessionDetails of session_ids one at a time, None for sessions which could not be read.
+    loginctl is called for chunk_size sessions at a time, so that only one chunk of output is held in memory.
+    """
+    if backend == 'statefiles':
+        for session_id in session_ids:
+            yield get_session_details_from_state_file(session_id, sessions_dir)
+        return
+    for start in range(0, len(session_ids), chunk_size):
+        yield from get_all_session_details(session_ids[start:start + chunk_size])
+
+
+def idle_seconds(details, now=None):
+    """
+    Returns the seconds the session has been idle, 0 for an active session, or None if it is not known.
+    """
+    if details.Idle == 'no':
+        return 0.0
+    if details.IdleSince and details.IdleSince.isdigit() and int(details.IdleSince) > 0:
+        return max(0.0, round((now or time.time()) - int(details.IdleSince) / 1000000, 3))
+    return None
+
+
+def filter_sessions(sessions, service=None, state=None, idle_over=None, now=None):
+    """
+    Yields the sessions with the given service and state which have been idle for more than idle_over seconds.
+    Sessions which could not be read are dropped.
+    """
+    for details in sessions:
+        if details is None:
+            continue
+        if service is not None and details.Service != service:
+            continue
+        if state is not None and details.State != state:
+            continue
+        if idle_over is not None and (idle_seconds(details, now) or 0) <= idle_over:
+            continue
+        yield details
+
+
+def session_records(sessions, fields=EXPORT_FIELDS, now=None):
+    """
+    Yields a dict with the selected fields of every session.
+    """
+    for details in sessions:
+        yield {field: idle_seconds(details, now) if field == 'IdleSeconds' else details[field] for field in fields}
+
+
+def write_jsonl(records, output):
+    for record in records:
+        output.write(json.dumps(record) + '\n')
+
+
+def write_csv(records, fields, output):
+    writer = csv.DictWriter(output, fieldnames=fields)
+    writer.writeheader()
+    # writerows consumes the records one at a time
+    writer.writerows(records)
+
+
+def count_sessions(sessions, counts):
+    """
+    Passes the sessions through, logging their service and counting them by service and state.
+    Sessions which could not be read are passed on without being counted.
+    """
+    for details in sessions:
+        if details is None:
+            yield details
+            continue
+        it_is_lightdm_service(details)
+        key = (details.Service or '', details.State or '')
+        counts[key] = counts.get(key, 0) + 1
+        yield details
+
+
 def print_session_details(details):
     if details:
         print(f"Session {details['SessionID']} details:")
         for key, value in details.items():
-            if key != 'Session ID':
+            # IdleSince is only exported, see EXPORT_FIELDS
+            if key not in ('Session ID', 'IdleSince'):
                 print(f"  {key}: {value}")
 
 
@@ -113,26 +532,95 @@ def it_is_lightdm_service(details):
         return False
 
 
-def main():
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='List the logind sessions and their details.')
+    parser.add_argument('--backend', choices=['auto', 'loginctl', 'statefiles'], default='auto',
+                        help='Where to read the sessions from (default: %(default)s)')
+    parser.add_argument('--sessions-dir', default=SESSIONS_DIR,
+                        help='logind session state directory used by the statefiles backend (default: %(default)s)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and print session changes as JSON lines')
+    parser.add_argument('--interval', type=float, default=5.0,
+                        help='Seconds between rescans in watch mode when no change is signalled (default: %(default)s)')
+    parser.add_argument('--format', choices=['text', 'jsonl', 'csv'], default='text',
+                        help='Output format, jsonl and csv write one record per session (default: %(default)s)')
+    parser.add_argument('--fields', help='Comma separated fields of the jsonl and csv records '
+                                         f'(default: {",".join(EXPORT_FIELDS)})')
+    parser.add_argument('--service', help='Only sessions of this service, e.g. lightdm')
+    parser.add_argument('--state', help='Only sessions in this state, e.g. active')
+    parser.add_argument('--idle-over', type=float, metavar='SECONDS',
+                        help='Only sessions idle for more than this many seconds')
+    parser.add_argument('--textfile-dir', default=metrics.TEXTFILE_DIR,
+                        help='node_exporter textfile collector directory the metrics are written to '
+                             '(default: %(default)s)')
+    args = parser.parse_args(argv)
+    fields_given = args.fields is not None
+    args.fields = ([field.strip() for field in args.fields.split(',') if field.strip()] if fields_given
+                   else list(EXPORT_FIELDS))
+    if args.watch and args.backend == 'loginctl':
+        parser.error('--watch reads the logind state files and cannot be used with --backend loginctl')
+    unknown = set(args.fields) - set(EXPORT_FIELDS)
+    if unknown:
+        parser.error(f'unknown fields: {", ".join(sorted(unknown))}')
+    exported_idle = args.format != 'text' and set(args.fields) & set(IDLE_FIELDS)
+    # Only loginctl knows whether and since when a session is idle, the text output prints Idle for every session
+    args.needs_idle = args.idle_over is not None or args.format == 'text' or bool(exported_idle)
+    if args.backend == 'statefiles' and (args.idle_over is not None or (fields_given and exported_idle)):
+        parser.error('--idle-over and the fields Idle, IdleSince and IdleSeconds need --backend loginctl or auto')
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
     configure_logging()
-    print("Starting main function...")
-    session_ids = get_session_ids()
+    if args.watch:
+        try:
+            watch_sessions(args.sessions_dir, args.interval)
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.format == 'text':
+        print("Starting main function...")
+    metrics.enable()
+    backend = select_backend(args.backend, args.sessions_dir, args.needs_idle)
+    with metrics.timed('get_session_ids'):
+        if backend == 'statefiles':
+            session_ids = get_session_ids_from_state_files(args.sessions_dir)
+        else:
+            session_ids = get_session_ids()
     if session_ids:
-        message = f'SESSION IDs: {session_ids}.'
-        logging.debug(message)
-        logging.debug(f'==========================================================================================')
-        it_is_lightdm_service(details)
-        for session_id in session_ids:
-            details = get_session_details(session_id)
-            print_session_details(details)
+        logging.debug('SESSION IDs: %s.', script_logging.Payload(session_ids))
+        logging.debug('==========================================================================================')
+        # Every stage is a generator, a single session at a time goes through the pipeline
+        sessions = iter_session_details(session_ids, backend, args.sessions_dir)
+        # Counted before filtering, the sessions gauge covers every session
+        counts = {}
+        sessions = count_sessions(sessions, counts)
+        sessions = filter_sessions(sessions, args.service, args.state, args.idle_over)
+        with metrics.timed('get_session_details'):
+            try:
+                if args.format == 'jsonl':
+                    write_jsonl(session_records(sessions, args.fields), sys.stdout)
+                elif args.format == 'csv':
+                    write_csv(session_records(sessions, args.fields), args.fields, sys.stdout)
+                else:
+                    for details in sessions:
+                        print_session_details(details)
+                sys.stdout.flush()
+            except BrokenPipeError:
+                # The consumer of the stream stopped reading, e.g. head, drop the rest of the output
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+                logging.info('Output closed by its reader, stopped listing the sessions.')
+        for (service, state), count in counts.items():
+            metrics.REGISTRY.set('sessions', count, {'service': service, 'state': state})
     else:
-        message = f'No session IDs found or an error occurred.'
-        logging.debug(message)
+        logging.debug('No session IDs found or an error occurred.')
+    metrics.write_textfile('list_sessions', args.textfile_dir)
 
 
 if __name__ == "__main__":
     try:
         main()
     except Exception as e:
-        error_message = f'An unexpected error occurred: {e.stderr.strip()}'
+        error_message = f'An unexpected error occurred: {e}'
         logging.error(error_message)
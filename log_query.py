@@ -0,0 +1,216 @@
+import argparse
+import bisect
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+
+# The sidecar index of a log file is the log file name with this suffix
+INDEX_SUFFIX = '.idx'
+# Header of the sidecar: magic, inode of the indexed log file, offset up to which the log file is indexed
+INDEX_MAGIC = b'LOGIDX01'
+INDEX_HEADER = struct.Struct('<8sQQ')
+# Entry of the sidecar: timestamp key and offset of the first record starting after a stride boundary
+INDEX_ENTRY = struct.Struct('<qQ')
+# Bytes of log between index entries, a query reads at most this much before the first matching record
+INDEX_STRIDE = 64 * 1024
+
+# Start of a record in both log formats of the scripts:
+#   '2024-05-14 08:00:00,123 ERROR: message'            (sessions.log, dnf_clean.log, fleet.log)
+#   '2024-05-14 08:00:00,123 - name - ERROR - message'  (file.log)
+RECORD_PATTERN = re.compile(rb'(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d),(\d{3})(?: - .*? - ([A-Z]+) - | ([A-Z]+): )')
+RECORD_START_PATTERN = re.compile(rb'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} ', re.MULTILINE)
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'TRACE': 25, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+
+def timestamp_key(match):
+    """
+    Returns the timestamp of a record as an int like 20240514080000123, which sorts like the timestamp.
+    """
+    return int(b''.join(match.group(1, 2, 3, 4, 5, 6, 7)))
+
+
+def parse_time_bound(text, upper=False):
+    """
+    Returns the timestamp key of a time like '2024-05-14', '2024-05-14 08:00' or '2024-05-14 08:00:00'.
+    An upper bound includes the whole given minute, day, etc.
+    """
+    digits = re.sub(r'\D', '', text)
+    if len(digits) not in (8, 10, 12, 14, 17):
+        raise ValueError(f'invalid time: {text}')
+    return int(digits.ljust(17, '9' if upper else '0'))
+
+
+def read_index(index_path, inode):
+    """
+    Returns (entries, indexed offset) of the sidecar, or ([], 0) if it is missing, broken or of another log file,
+    e.g. after the log file was rotated.
+    """
+    try:
+        with open(index_path, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return [], 0
+    if len(data) < INDEX_HEADER.size:
+        return [], 0
+    magic, indexed_inode, indexed_offset = INDEX_HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC or indexed_inode != inode:
+        return [], 0
+    body = data[INDEX_HEADER.size:]
+    body = body[:len(body) - len(body) % INDEX_ENTRY.size]
+    return list(INDEX_ENTRY.iter_unpack(body)), indexed_offset
+
+
+def index_tail(log, start, end, entries, stride=INDEX_STRIDE):
+    """
+    Appends an entry for the first record after every stride bytes of log[start:end] to entries.
+    Only the lines at the stride boundaries are read, not the lines in between.
+    """
+    next_mark = entries[-1][1] + stride if entries else 0
+    position = start
+    while position < end:
+        if position < next_mark:
+            newline = log.find(b'\n', next_mark - 1, end)
+            if newline < 0:
+                break
+            position = newline + 1
+            continue
+        match = RECORD_PATTERN.match(log, position)
+        if match:
+            entries.append((timestamp_key(match), position))
+            next_mark = position + stride
+            continue
+        # A continuation line of a multi-line record
+        newline = log.find(b'\n', position, end)
+        if newline < 0:
+            break
+        position = newline + 1
+
+
+def write_index(index_path, inode, entries, indexed_offset, new_from):
+    """
+    Writes the entries from index new_from on and the header. An index of the same log file is appended to.
+    """
+    header = INDEX_HEADER.pack(INDEX_MAGIC, inode, indexed_offset)
+    new_entries = b''.join(INDEX_ENTRY.pack(*entry) for entry in entries[new_from:])
+    if new_from == 0:
+        with open(index_path, 'wb') as file:
+            file.write(header + new_entries)
+        return
+    with open(index_path, 'r+b') as file:
+        file.seek(INDEX_HEADER.size + new_from * INDEX_ENTRY.size)
+        file.write(new_entries)
+        file.truncate()
+        file.seek(0)
+        file.write(header)
+
+
+def update_index(log_path, log, inode, save=True):
+    """
+    Returns the entries of the index of the log file, indexing only the part appended since the last run.
+    """
+    index_path = log_path + INDEX_SUFFIX
+    entries, indexed_offset = read_index(index_path, inode)
+    if indexed_offset > len(log):
+        # The log file was truncated
+        entries, indexed_offset = [], 0
+    # Only complete lines are indexed, the last line may still be written
+    end = log.rfind(b'\n') + 1
+    if end <= indexed_offset:
+        return entries
+    known = len(entries)
+    index_tail(log, indexed_offset, end, entries)
+    if save:
+        try:
+            write_index(index_path, inode, entries, end, known if indexed_offset else 0)
+        except OSError as e:
+            message = f'{index_path}: Could not store the index: {e}'
+            logging.warning(message)
+    return entries
+
+
+def iter_records(log, start):
+    """
+    Yields (timestamp key, level, record) of the records from offset start on, a record includes its
+    continuation lines.
+    """
+    match = RECORD_START_PATTERN.search(log, start)
+    while match:
+        position = match.start()
+        match = RECORD_START_PATTERN.search(log, position + 1)
+        end = match.start() if match else len(log)
+        record = RECORD_PATTERN.match(log, position)
+        if record:
+            yield timestamp_key(record), (record.group(8) or record.group(9)).decode(), log[position:end]
+
+
+def query(log_path, since=None, until=None, levels=None, min_level=None, pattern=None, save_index=True):
+    """
+    Yields the records of the log file between since and until (timestamp keys), with one of levels or at least
+    min_level, containing pattern (bytes). Reading starts at the index entry before since and stops at the first
+    record after until, the log file is never read as a whole.
+    """
+    with open(log_path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        if stat.st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            entries = update_index(log_path, log, stat.st_ino, save_index)
+            start = 0
+            if since is not None and entries:
+                # The last entry before since, the records between it and since are skipped below
+                position = bisect.bisect_left([key for key, _ in entries], since) - 1
+                start = entries[position][1] if position >= 0 else 0
+            for key, level, record in iter_records(log, start):
+                if since is not None and key < since:
+                    continue
+                if until is not None and key > until:
+                    break
+                if levels and level not in levels:
+                    continue
+                if min_level is not None and LEVELS.get(level, 0) < min_level:
+                    continue
+                if pattern and pattern not in record:
+                    continue
+                yield record.decode(errors='replace')
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Query the log files of the scripts by time range and level.')
+    parser.add_argument('log_files', nargs='+', help='Log files, e.g. dnf_clean.log.1 dnf_clean.log')
+    parser.add_argument('--since', help='First time, e.g. "2024-05-14 08:00"')
+    parser.add_argument('--until', help='Last time, inclusive, e.g. "2024-05-14 09"')
+    parser.add_argument('--level', help='Comma separated levels, e.g. ERROR,CRITICAL')
+    parser.add_argument('--min-level', choices=list(LEVELS), help='Lowest level shown')
+    parser.add_argument('--grep', help='Text the record must contain, e.g. "dnf check-update"')
+    parser.add_argument('--no-save-index', action='store_true', help='Do not write the sidecar index files')
+    args = parser.parse_args(argv)
+    try:
+        args.since = parse_time_bound(args.since) if args.since else None
+        args.until = parse_time_bound(args.until, upper=True) if args.until else None
+    except ValueError as e:
+        parser.error(str(e))
+    args.level = {level.strip().upper() for level in args.level.split(',')} if args.level else None
+    args.min_level = LEVELS[args.min_level] if args.min_level else None
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    pattern = args.grep.encode() if args.grep else None
+    status = 0
+    for log_path in args.log_files:
+        try:
+            for record in query(log_path, args.since, args.until, args.level, args.min_level, pattern,
+                                not args.no_save_index):
+                sys.stdout.write(record)
+        except OSError as e:
+            print(f'{log_path}: {e}', file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import command_runner
+import state_files
+
+# Directory node_exporter's textfile collector reads *.prom files from
+TEXTFILE_DIR = '/var/lib/node_exporter/textfile_collector'
+# Directory the counters and histograms are kept in between runs, so that they are cumulative
+STATE_DIR = state_files.STATE_DIR
+PREFIX = 'python_scripts_'
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float('inf'))
+
+METRIC_HELP = {
+    'stage_duration_seconds': ('histogram', 'Duration of the instrumented stages of the scripts.'),
+    'command_duration_seconds': ('histogram', 'Duration of the commands run by the scripts.'),
+    'command_exit_total': ('counter', 'Commands run by the scripts by return code and outcome.'),
+    'pending_updates': ('gauge', 'Package updates available at the last check.'),
+    'sessions': ('gauge', 'Login sessions by service and state at the last run.'),
+    'dnf_cache_freed_bytes': ('gauge', 'Bytes freed in the dnf cache by the last run.'),
+    'dnf_cache_freed_bytes_total': ('counter', 'Bytes freed in the dnf cache.'),
+    'last_run_timestamp_seconds': ('gauge', 'Time the script last wrote its metrics.'),
+}
+
+
+class Registry:
+    """
+    Metrics of the current run. Safe to update from the threads of the task graph and the command runner.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, value=1, labels=None):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, value, labels=None):
+        key = self.key(name, labels)
+        with self.lock:
+            buckets, total, count = self.histograms.get(key, ([0] * len(DURATION_BUCKETS), 0.0, 0))
+            buckets = [bucket + (value <= bound) for bucket, bound in zip(buckets, DURATION_BUCKETS)]
+            self.histograms[key] = (buckets, total + value, count + 1)
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+
+REGISTRY = Registry()
+
+
+@contextmanager
+def timed(stage):
+    """
+    Records the duration of the block in the stage duration histogram.
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        REGISTRY.observe('stage_duration_seconds', time.monotonic() - start, {'stage': stage})
+
+
+def command_label(command):
+    # 'dnf check-update', 'loginctl session-status', without host names or session IDs
+    words = [command[0]] + [word for word in command[1:2] if not word.startswith('-')]
+    return ' '.join(words)
+
+
+def observe_command(result):
+    labels = {'command': command_label(result.command)}
+    REGISTRY.observe('command_duration_seconds', result.seconds, labels)
+    REGISTRY.inc('command_exit_total', labels={**labels, 'code': str(result.returncode),
+                                              'outcome': result.outcome.name})
+
+
+def enable():
+    """
+    Instruments every command run through command_runner.
+    """
+    if observe_command not in command_runner.RESULT_HOOKS:
+        command_runner.RESULT_HOOKS.append(observe_command)
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + '}'
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def load_state(path):
+    try:
+        with state_files.open_trusted(path) as file:
+            state = json.load(file)
+        counters = {(name, tuple(map(tuple, labels))): value for name, labels, value in state['counters']}
+        histograms = {(name, tuple(map(tuple, labels))): (buckets, total, count)
+                      for name, labels, buckets, total, count in state['histograms']}
+        return counters, histograms
+    except FileNotFoundError:
+        return {}, {}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        message = f'{path}: Could not read the metrics state, starting from zero: {e}'
+        logging.warning(message)
+        return {}, {}
+
+
+def merge_state(registry, counters, histograms):
+    """
+    Adds the counters and histograms of the current run to the ones of the earlier runs.
+    """
+    with registry.lock:
+        for key, value in registry.counters.items():
+            counters[key] = counters.get(key, 0) + value
+        for key, (buckets, total, count) in registry.histograms.items():
+            old_buckets, old_total, old_count = histograms.get(key, ([0] * len(buckets), 0.0, 0))
+            histograms[key] = ([old + new for old, new in zip(old_buckets, buckets)], old_total + total,
+                               old_count + count)
+        gauges = dict(registry.gauges)
+    return counters, gauges, histograms
+
+
+def format_metrics(counters, gauges, histograms):
+    """
+    Formats the metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for short_name, (metric_type, help_text) in METRIC_HELP.items():
+        source = {'counter': counters, 'gauge': gauges, 'histogram': histograms}[metric_type]
+        series = sorted((labels, value) for (name, labels), value in source.items() if name == short_name)
+        if not series:
+            continue
+        name = PREFIX + short_name
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in series:
+            if metric_type != 'histogram':
+                lines.append(f'{name}{format_labels(labels)} {value}')
+                continue
+            buckets, total, count = value
+            for bound, bucket in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", format_bound(bound))])} {bucket}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def atomic_write(path, content):
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix=f'.{os.path.basename(path)}.', delete=False) as file:
+        file.write(content)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+
+
+def write_textfile(job, textfile_dir=TEXTFILE_DIR, state_dir=STATE_DIR, registry=REGISTRY):
+    """
+    Writes the metrics of the job to <textfile_dir>/python_scripts_<job>.prom, atomically so that
+    node_exporter never reads a partial file. Nothing is written if textfile_dir does not exist.
+    The registry is cleared, so that the next job run in the same process starts from zero.
+    """
+    try:
+        write_job_metrics(job, textfile_dir, state_dir, registry)
+    finally:
+        registry.clear()
+
+
+def write_job_metrics(job, textfile_dir, state_dir, registry):
+    if not os.path.isdir(textfile_dir):
+        message = f'{textfile_dir}: No textfile collector directory, metrics are not written.'
+        logging.debug(message)
+        return
+    state_path = os.path.join(state_dir, f'{PREFIX}{job}_metrics.json')
+    # Without a private state directory the counters only hold the current run
+    keep_state = state_files.ensure_private_dir(state_dir)
+    registry.set('last_run_timestamp_seconds', round(time.time(), 3))
+    counters, gauges, histograms = merge_state(registry, *(load_state(state_path) if keep_state else ({}, {})))
+    try:
+        if keep_state:
+            atomic_write(state_path, json.dumps({
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                'histograms': [[name, labels, *value] for (name, labels), value in histograms.items()],
+            }))
+        atomic_write(os.path.join(textfile_dir, f'{PREFIX}{job}.prom'), format_metrics(counters, gauges, histograms))
+    except OSError as e:
+        message = f'{textfile_dir}: Could not write the metrics: {e}'
+        logging.error(message)
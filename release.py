@@ -1,84 +1,72 @@
+import argparse
 import logging
-import re
 
-# Path to the OS release file
+import host_facts
+import script_logging
+
+# Path to the OS release file read when there is no /etc/os-release
 os_release_file_path = '/etc/redhat-release'
 
-# Define a custom log level TRACE
-TRACE_LEVEL_NUM = 25
+# Distribution names of the os-release IDs
+DISTRIBUTION_NAMES = {
+    'centos': 'CentOS',
+    'rocky': 'Rocky',
+    'almalinux': 'AlmaLinux',
+    'rhel': 'RHEL',
+    'fedora': 'Fedora',
+}
+SUPPORTED_DISTRIBUTIONS = list(DISTRIBUTION_NAMES.values())
+
 # Log file
 LOG_FILE = 'file.log'
 
 
-def trace(self, message, *args, **kws):
-    if self.isEnabledFor(TRACE_LEVEL_NUM):
-        self._log(TRACE_LEVEL_NUM, message, args, **kws)
-
-
-# Extend the Logger class with the trace method
-class CustomLogger(logging.getLoggerClass()):
-    def trace(self, message, *args, **kws):
-        if self.isEnabledFor(TRACE_LEVEL_NUM):
-            self._log(TRACE_LEVEL_NUM, message, args, **kws)
-
-
-# Set the custom logger class
-logging.setLoggerClass(CustomLogger)
-
-# Add TRACE level to the logging module
-logging.addLevelName(TRACE_LEVEL_NUM, "TRACE")
-
-
 def configure_logging():
-    # Configure logging
-    logging.basicConfig(level=logging.DEBUG,
-                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                        handlers=[
-                            logging.FileHandler(LOG_FILE),
-                            logging.StreamHandler()
-                        ])
+    # Log to the file and to the console, with the TRACE level available
+    script_logging.configure_logging(LOG_FILE, logging.DEBUG, '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                                     console=True)
 
 
-def get_distribution(file_path, logger):
+def get_distribution(file_path, logger, refresh=False):
+    """
+    Returns the distribution name, e.g. 'Rocky', read from /etc/os-release or else from file_path.
+    Returns 'Unknown' if neither is recognized.
+    """
     try:
-        with open(file_path, 'r') as file:
-            # Read the first line from the file
-            line = file.readline().strip()
-            logger.debug('Read line: {}'.format(line))
-
-            # Use regular expression to match the OS release format
-            match = re.match(r'(CentOS|Rocky) Linux release (\d+\.\d+)', line)
-            if match:
-                distro = match.group(1)
-                version = match.group(2)
-                logger.debug('Distribution: {}, Version: {}'.format(distro, version))
-                return distro
-            else:
-                logger.error('Unrecognized OS release format found in file: {}. Content: "{}"'.format(file_path, line))
-                return 'Unknown'
-
-    except FileNotFoundError:
-        logger.error('File not found: {}'.format(file_path))
-        return 'Unknown'
-
+        facts = host_facts.get_host_facts(refresh, redhat_release_file=file_path)
     except Exception as error_distribution:
         logger.error('An error occurred: {}'.format(error_distribution))
         return 'Unknown'
 
+    if facts is None:
+        logger.error('No recognized OS release file found, last tried: {}'.format(file_path))
+        return 'Unknown'
+    logger.debug('Distribution: %s, Version: %s, Package manager: %s, read from %s', facts.id, facts.version_id,
+                 facts.package_manager, facts.source)
+    return DISTRIBUTION_NAMES.get(facts.id, facts.name)
+
 
 def next_func(distribution, logger):
     # Placeholder for the next function that uses the distribution variable
     logger.info('OS Release determined: {}'.format(distribution))
 
 
-def main():
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Determine the distribution of this host.')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Read the release files again instead of using the cached host facts')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
     # Call the function to configure logging and log messages
     configure_logging()
     # Create logger
     logger = logging.getLogger(__name__)
 
-    distribution = get_distribution(os_release_file_path, logger)
-    if distribution in ['CentOS', 'Rocky']:
+    distribution = get_distribution(os_release_file_path, logger, args.refresh)
+    if distribution in SUPPORTED_DISTRIBUTIONS:
         next_func(distribution, logger)
     else:
         logger.warning('Unsupported distribution: {}'.format(distribution))
@@ -0,0 +1,116 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+# Custom log level TRACE, between INFO and WARNING
+TRACE_LEVEL_NUM = 25
+# Size at which a log file written by a single process is rotated by that process, see file_handler
+MAX_BYTES = 10 * 1024 * 1024
+# Rotated files kept when a log file is rotated by its process
+BACKUP_COUNT = 5
+# Characters of a large payload, e.g. command output, which are logged
+MAX_PAYLOAD = 4096
+
+# Listener writing the queued records of this process, see configure_logging
+_listener = None
+
+
+class CustomLogger(logging.getLoggerClass()):
+    def trace(self, message, *args, **kws):
+        if self.isEnabledFor(TRACE_LEVEL_NUM):
+            self._log(TRACE_LEVEL_NUM, message, args, **kws)
+
+
+def install_trace_level():
+    """
+    Adds the TRACE level and the logger.trace() method, for loggers created afterwards.
+    """
+    logging.addLevelName(TRACE_LEVEL_NUM, 'TRACE')
+    if not issubclass(logging.getLoggerClass(), CustomLogger):
+        logging.setLoggerClass(CustomLogger)
+
+
+class Payload:
+    """
+    Log argument which is converted to text and cut to max_length characters, only when the record is actually
+    formatted:
+
+        logging.debug('Command output:\n%s', Payload(result.stdout))
+        logging.info('Session IDs: %s', Payload(session_ids))
+    """
+    __slots__ = ('value', 'max_length')
+
+    def __init__(self, value, max_length=MAX_PAYLOAD):
+        self.value = value
+        self.max_length = max_length
+
+    def __str__(self):
+        text = str(self.value)
+        if len(text) <= self.max_length:
+            return text
+        return f'{text[:self.max_length]}... [{len(text) - self.max_length} more characters]'
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records without formatting them, the message is built by the listener thread.
+    The records stay in this process, so they do not need to be made picklable. Arguments must not be
+    changed after the logging call.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def file_handler(log_file, max_bytes=None, backup_count=BACKUP_COUNT, when=None):
+    """
+    Returns a handler for log_file. By default the file is rotated externally, by logrotate.d/python_scripts, and
+    the handler reopens it once it was moved. This is safe with several processes writing the same file, like
+    check_updates.py and release.py writing file.log from separate cron jobs.
+    max_bytes (e.g. MAX_BYTES) or the interval when (e.g. 'midnight') rotate the file in this process instead,
+    which is only safe for a log file no other script writes to.
+    """
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(log_file, when=when, backupCount=backup_count)
+    if max_bytes:
+        return logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count)
+    return logging.handlers.WatchedFileHandler(log_file)
+
+
+def stop_logging():
+    """
+    Writes the queued records and stops the background writer.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(log_file, level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s', console=False,
+                      max_bytes=None, backup_count=BACKUP_COUNT, when=None):
+    """
+    Configures the root logger to hand records to a background thread, which formats them and writes them to
+    log_file, and to stderr with console. The callers never wait for the disk. See file_handler for the rotation.
+    """
+    global _listener
+    stop_logging()
+    install_trace_level()
+    formatter = logging.Formatter(format)
+    handlers = [file_handler(log_file, max_bytes, backup_count, when)]
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.unregister(stop_logging)
+    atexit.register(stop_logging)
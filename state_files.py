@@ -0,0 +1,50 @@
+import errno
+import logging
+import os
+import stat
+
+# Directory the caches, the update history and the metrics state of the scripts are kept in.
+# Unlike /var/tmp, no other user can plant or replace files in it.
+STATE_DIR = '/var/lib/python_scripts'
+
+
+def is_trusted(file_stat):
+    """
+    Returns True if a file or directory is owned by root or by the current user.
+    """
+    return file_stat.st_uid in (0, os.geteuid())
+
+
+def ensure_private_dir(path):
+    """
+    Creates the directory path if it is missing. Returns True if files can be kept in it: it is owned by root
+    or by the current user, and only its owner may write to it.
+    """
+    try:
+        os.makedirs(path, 0o755, exist_ok=True)
+        dir_stat = os.lstat(path)
+    except PermissionError:
+        # Scripts run by other users than root simply go without the state
+        logging.debug('%s: Not permitted to create the state directory.', path)
+        return False
+    except OSError as e:
+        message = f'{path}: Could not create the state directory: {e}'
+        logging.warning(message)
+        return False
+    writable_by_others = dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    if not stat.S_ISDIR(dir_stat.st_mode) or not is_trusted(dir_stat) or writable_by_others:
+        message = f'{path}: Not used, the directory may be written by other users.'
+        logging.warning(message)
+        return False
+    return True
+
+
+def open_trusted(path, mode='r'):
+    """
+    Opens a file like open(), but raises PermissionError if it is owned by another user than root or the current user.
+    """
+    file = open(path, mode)
+    if not is_trusted(os.fstat(file.fileno())):
+        file.close()
+        raise PermissionError(errno.EPERM, 'File is owned by another user', path)
+    return file
@@ -0,0 +1,127 @@
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# A step of a task graph. action(inputs) gets the results of the tasks named in inputs as a dict and
+# returns the result of the step. The step is skipped when precondition(inputs) returns False.
+# The tasks named in after only order the step: it runs once they finished, whether or not they failed.
+Task = namedtuple('Task', ['name', 'action', 'inputs', 'precondition', 'after'], defaults=[(), None, ()])
+# What happened to a task: status is 'done', 'skipped', 'failed' or 'upstream failed'
+TaskRun = namedtuple('TaskRun', ['name', 'status', 'start', 'end', 'result'])
+
+
+def plan(tasks):
+    """
+    Orders the tasks into waves, every task only depends on tasks of earlier waves.
+    Raises ValueError for unknown inputs and for cycles.
+    """
+    names = {task.name for task in tasks}
+    for task in tasks:
+        unknown = set(task.inputs + task.after) - names
+        if unknown:
+            raise ValueError(f'Task {task.name} depends on unknown tasks: {sorted(unknown)}')
+    waves = []
+    planned = set()
+    remaining = list(tasks)
+    while remaining:
+        wave = [task for task in remaining if planned.issuperset(task.inputs + task.after)]
+        if not wave:
+            raise ValueError(f'Tasks depend on each other in a cycle: {[task.name for task in remaining]}')
+        waves.append(wave)
+        planned.update(task.name for task in wave)
+        remaining = [task for task in remaining if task.name not in planned]
+    return waves
+
+
+def run_task(task, inputs):
+    start = time.monotonic()
+    if task.precondition is not None and not task.precondition(inputs):
+        message = f'Task {task.name}: Precondition not met, skipped.'
+        logging.info(message)
+        return TaskRun(task.name, 'skipped', start, time.monotonic(), None)
+    return TaskRun(task.name, 'done', start, None, task.action(inputs))
+
+
+def run_graph(tasks, max_workers=4):
+    """
+    Runs every task as soon as all of its inputs and after tasks are finished, independent tasks run concurrently.
+    A task whose input failed is not run, a failed after task does not stop it. Returns a dict of TaskRun by task name.
+    """
+    plan(tasks)
+    runs = {}
+    pending = list(tasks)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for task in list(pending):
+                if not all(name in runs for name in task.inputs + task.after):
+                    continue
+                pending.remove(task)
+                if any(runs[name].status in ('failed', 'upstream failed') for name in task.inputs):
+                    now = time.monotonic()
+                    runs[task.name] = TaskRun(task.name, 'upstream failed', now, now, None)
+                    continue
+                inputs = {name: runs[name].result for name in task.inputs}
+                running[executor.submit(run_task, task, inputs)] = (task, time.monotonic())
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, start = running.pop(future)
+                end = time.monotonic()
+                try:
+                    run = future.result()
+                    runs[task.name] = run._replace(end=end)
+                except Exception as e:
+                    message = f'Task {task.name}: Failed: {e}'
+                    logging.error(message)
+                    runs[task.name] = TaskRun(task.name, 'failed', start, end, e)
+    return runs
+
+
+def critical_path(tasks, runs):
+    """
+    Returns (task names, seconds) of the chain of dependent tasks which took the longest.
+    """
+    finish = {}
+    previous = {}
+    for wave in plan(tasks):
+        for task in wave:
+            run = runs.get(task.name)
+            duration = run.end - run.start if run else 0.0
+            before = max(task.inputs + task.after, key=lambda name: finish[name], default=None)
+            finish[task.name] = duration + (finish[before] if before else 0.0)
+            previous[task.name] = before
+    if not finish:
+        return [], 0.0
+    name = max(finish, key=finish.get)
+    total = finish[name]
+    path = []
+    while name:
+        path.append(name)
+        name = previous[name]
+    return path[::-1], total
+
+
+def format_plan(tasks):
+    lines = []
+    for number, wave in enumerate(plan(tasks), 1):
+        for task in wave:
+            inputs = f' after {", ".join(task.inputs + task.after)}' if task.inputs or task.after else ''
+            condition = ' if its precondition holds' if task.precondition else ''
+            lines.append(f'wave {number}: {task.name}{inputs}{condition}')
+    return '\n'.join(lines)
+
+
+def format_report(tasks, runs):
+    started = min((run.start for run in runs.values()), default=0.0)
+    lines = []
+    for wave in plan(tasks):
+        for task in wave:
+            run = runs[task.name]
+            lines.append(f'{task.name:<20} {run.status:<16} start {run.start - started:8.3f}s  '
+                         f'duration {run.end - run.start:8.3f}s')
+    path, total = critical_path(tasks, runs)
+    lines.append(f'critical path: {" -> ".join(path)} ({total:.3f}s)')
+    return '\n'.join(lines)
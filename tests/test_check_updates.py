@@ -0,0 +1,26 @@
+import logging
+import os
+import unittest
+from unittest import mock
+
+import check_updates
+import metrics
+import update_engine
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class PendingUpdatesTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.REGISTRY.clear()
+
+    def tearDown(self):
+        metrics.REGISTRY.clear()
+
+    def test_obsoleting_packages_are_not_counted(self):
+        with open(os.path.join(FIXTURES, 'dnf_check_update.txt'), 'r') as file:
+            updates = update_engine.parse_check_update_output(file.read())
+        with mock.patch.object(check_updates, 'get_updates', return_value=(True, updates)):
+            self.assertTrue(check_updates.check_updates(logging.getLogger(__name__), history=False))
+        self.assertEqual(metrics.REGISTRY.gauges[metrics.REGISTRY.key('pending_updates', None)], 4)
@@ -0,0 +1,96 @@
+import logging
+import time
+import unittest
+from unittest import mock
+
+import command_runner
+
+
+def sh(script):
+    return ['sh', '-c', script]
+
+
+class RunCommandTest(unittest.TestCase):
+
+    def test_output_and_outcome(self):
+        result = command_runner.run_command(sh('echo out; echo err >&2; exit 0'))
+        self.assertEqual((result.stdout, result.stderr), ('out\n', 'err\n'))
+        self.assertIs(result.outcome, command_runner.SUCCESS)
+        self.assertFalse(result.timed_out or result.truncated or result.stopped)
+
+    def test_unexpected_return_code(self):
+        result = command_runner.run_command(sh('exit 7'))
+        self.assertEqual(result.returncode, 7)
+        self.assertIs(result.outcome, command_runner.UNEXPECTED_OUTCOME)
+
+    def test_command_which_cannot_start(self):
+        result = command_runner.run_command(['/nonexistent/command'])
+        self.assertIsNone(result.returncode)
+        self.assertEqual(result.outcome.level, logging.CRITICAL)
+
+    def test_timeout_terminates(self):
+        start = time.monotonic()
+        result = command_runner.run_command(sh('sleep 30'), timeout=0.2)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(result.timed_out)
+        self.assertIs(result.outcome, command_runner.TIMEOUT_OUTCOME)
+
+    def test_timeout_kills_a_command_ignoring_term(self):
+        start = time.monotonic()
+        with self.assertLogs(level='WARNING') as logs:
+            result = command_runner.run_command(sh("trap '' TERM; echo ready; while :; do sleep 0.05; done"),
+                                                timeout=0.5, kill_after=0.3)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(result.stdout, 'ready\n')
+        self.assertIn('killing it', logs.output[0])
+
+    def test_output_cap(self):
+        result = command_runner.run_command(sh('head -c 100000 /dev/zero | tr "\\0" x; echo done >&2'),
+                                            max_output=1000)
+        self.assertEqual(result.stdout, 'x' * 1000)
+        self.assertEqual(result.stderr, 'done\n')
+        self.assertTrue(result.truncated)
+        self.assertIs(result.outcome, command_runner.SUCCESS)
+
+    def test_line_handler_stops_the_command(self):
+        lines = []
+
+        def handler(line):
+            lines.append(line)
+            return line.startswith('stop')
+
+        start = time.monotonic()
+        result = command_runner.run_command(sh('echo a; echo stop; echo b; sleep 30'), line_handler=handler)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(lines, ['a\n', 'stop\n'])
+        self.assertTrue(result.stopped)
+        self.assertIs(result.outcome, command_runner.STOPPED_OUTCOME)
+        self.assertEqual(result.stdout, '')
+
+    def test_result_hooks(self):
+        results = []
+        with mock.patch.object(command_runner, 'RESULT_HOOKS', [results.append]):
+            result = command_runner.run_command(sh('true'))
+        self.assertEqual(results, [result])
+
+    def test_run_commands_keeps_the_order(self):
+        commands = [sh(f'sleep {delay}; echo {number}') for number, delay in enumerate((0.3, 0, 0.15))]
+        results = command_runner.run_commands(commands, concurrency=3)
+        self.assertEqual([result.stdout for result in results], ['0\n', '1\n', '2\n'])
+        self.assertEqual([result.command for result in results], commands)
+
+
+class LookupOutcomeTest(unittest.TestCase):
+
+    def test_longest_prefix_wins(self):
+        self.assertEqual(command_runner.lookup_outcome(['dnf', 'check-update', '-q'], 100).name, 'updates')
+        self.assertEqual(command_runner.lookup_outcome(['dnf', 'clean', 'all'], 200).name, 'locked')
+        # 100 is only defined for check-update
+        self.assertIs(command_runner.lookup_outcome(['dnf', 'clean', 'all'], 100), command_runner.UNEXPECTED_OUTCOME)
+        self.assertEqual(command_runner.lookup_outcome(['dnf', 'check-update'], 200).name, 'locked')
+
+    def test_unknown_commands(self):
+        self.assertIs(command_runner.lookup_outcome(['true'], 0), command_runner.SUCCESS)
+        self.assertIs(command_runner.lookup_outcome(['false'], 1), command_runner.UNEXPECTED_OUTCOME)
+        self.assertIs(command_runner.lookup_outcome(['loginctl', 'list-sessions'], 0), command_runner.SUCCESS)
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import time
+import unittest
+
+import dnf_cache_pruner
+from dnf_cache_pruner import METADATA, PACKAGES, STALE_METADATA, CacheFile
+
+REPOMD_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo">
+  <data type="primary">
+    <location href="repodata/abc-primary.xml.gz"/>
+  </data>
+</repomd>
+'''
+DAY = 24 * 3600
+
+
+class DnfCachePrunerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = self.directory.name
+        self.now = time.time()
+        # A repository refreshed an hour ago, with a primary.xml its repomd.xml no longer refers to
+        self.write('baseos-0123456789abcdef/repodata/repomd.xml', REPOMD_XML, age=3600)
+        self.write('baseos-0123456789abcdef/repodata/abc-primary.xml.gz', 100, age=3600)
+        self.write('baseos-0123456789abcdef/repodata/old-primary.xml.gz', 100, age=3 * DAY)
+        self.write('baseos-0123456789abcdef/packages/bash-5.1.8-6.el9.x86_64.rpm', 100, age=2 * DAY)
+        self.write('baseos-0123456789abcdef/packages/vim-8.2-1.el9.x86_64.rpm', 100, age=40 * DAY)
+        # A repository not refreshed for longer than metadata_expire
+        self.write('epel-fedcba9876543210/repodata/repomd.xml', REPOMD_XML, age=5 * DAY)
+        self.write('epel-fedcba9876543210/repodata/abc-primary.xml.gz', 100, age=5 * DAY)
+        self.write('baseos.solv', 100, age=3600)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, relative_path):
+        return os.path.join(self.cache_dir, relative_path)
+
+    def write(self, relative_path, content, age):
+        path = self.path(relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content if isinstance(content, str) else 'x' * content)
+        os.utime(path, (self.now - age, self.now - age))
+
+    def collect(self):
+        # Reading repomd.xml during the scan may update its atime, use the ages set by write
+        return [cache_file._replace(last_used=os.stat(cache_file.path).st_mtime)
+                for cache_file in dnf_cache_pruner.collect_cache_files(self.cache_dir, now=self.now)]
+
+    def classes(self):
+        return {os.path.relpath(cache_file.path, self.cache_dir): cache_file.eviction_class
+                for cache_file in self.collect()}
+
+    def test_classification(self):
+        self.assertEqual(self.classes(), {
+            'baseos-0123456789abcdef/repodata/repomd.xml': METADATA,
+            'baseos-0123456789abcdef/repodata/abc-primary.xml.gz': METADATA,
+            # Not referenced by the current repomd.xml
+            'baseos-0123456789abcdef/repodata/old-primary.xml.gz': STALE_METADATA,
+            'baseos-0123456789abcdef/packages/bash-5.1.8-6.el9.x86_64.rpm': PACKAGES,
+            'baseos-0123456789abcdef/packages/vim-8.2-1.el9.x86_64.rpm': PACKAGES,
+            'epel-fedcba9876543210/repodata/repomd.xml': STALE_METADATA,
+            'epel-fedcba9876543210/repodata/abc-primary.xml.gz': STALE_METADATA,
+            'baseos.solv': METADATA,
+        })
+
+    def test_eviction_order_is_packages_then_stale_then_fresh_metadata(self):
+        evict = dnf_cache_pruner.plan_eviction(self.collect(), max_age=365 * DAY, size_budget=0, now=self.now)
+        self.assertEqual(len(evict), 8)
+        self.assertEqual([cache_file.eviction_class for cache_file in evict],
+                         [PACKAGES] * 2 + [STALE_METADATA] * 3 + [METADATA] * 3)
+        # Least recently used first within a class
+        self.assertTrue(evict[0].path.endswith('vim-8.2-1.el9.x86_64.rpm'))
+        self.assertTrue(evict[2].path.endswith('epel-fedcba9876543210/repodata/repomd.xml')
+                        or evict[2].path.endswith('epel-fedcba9876543210/repodata/abc-primary.xml.gz'))
+
+    def test_max_age_evicts_old_packages_and_stale_metadata_only(self):
+        old_metadata = CacheFile(self.path('baseos.solv'), 100, self.now - 90 * DAY, METADATA)
+        evict = dnf_cache_pruner.plan_eviction(self.collect() + [old_metadata], max_age=4 * DAY, size_budget=None,
+                                               now=self.now)
+        self.assertEqual(sorted(os.path.relpath(cache_file.path, self.cache_dir) for cache_file in evict), [
+            'baseos-0123456789abcdef/packages/vim-8.2-1.el9.x86_64.rpm',
+            'epel-fedcba9876543210/repodata/abc-primary.xml.gz',
+            'epel-fedcba9876543210/repodata/repomd.xml',
+        ])
+
+    def test_stops_at_the_size_budget(self):
+        cache_files = [CacheFile(f'/cache/{number}', 100, self.now - number, PACKAGES) for number in range(5)]
+        for size_budget, evicted in ((500, 0), (400, 1), (300, 2), (250, 3), (0, 5)):
+            with self.subTest(size_budget=size_budget):
+                evict = dnf_cache_pruner.plan_eviction(cache_files, max_age=DAY, size_budget=size_budget,
+                                                       now=self.now)
+                self.assertEqual(len(evict), evicted)
+                self.assertEqual([cache_file.path for cache_file in evict],
+                                 [f'/cache/{number}' for number in range(4, 4 - evicted, -1)])
+
+    def test_dry_run_removes_nothing(self):
+        cache_files = self.collect()
+        report = dnf_cache_pruner.execute_prune(cache_files, cache_files, dry_run=True, cache_dir=self.cache_dir)
+        self.assertEqual(report.bytes_freed, sum(cache_file.size for cache_file in cache_files))
+        self.assertTrue(all(os.path.exists(cache_file.path) for cache_file in cache_files))
+
+    def test_report_and_errors(self):
+        cache_files = self.collect()
+        packages = [cache_file for cache_file in cache_files if cache_file.eviction_class == PACKAGES]
+        # A directory cannot be removed like a file, a file which is already gone is not an error
+        failing = CacheFile(self.path('baseos-0123456789abcdef/repodata'), 4096, self.now, STALE_METADATA)
+        gone = CacheFile(self.path('baseos-0123456789abcdef/packages/gone.rpm'), 100, self.now, PACKAGES)
+        report = dnf_cache_pruner.execute_prune(cache_files, packages + [failing, gone], cache_dir=self.cache_dir)
+        self.assertEqual(report.bytes_freed, 200)
+        self.assertEqual(report.errors, 1)
+        self.assertEqual(report.files_removed, 3)
+        self.assertEqual(report.bytes_remaining, sum(cache_file.size for cache_file in cache_files) - 200)
+        self.assertFalse(any(os.path.exists(cache_file.path) for cache_file in packages))
+
+    def test_emptied_directories_are_removed(self):
+        cache_files = self.collect()
+        evict = [cache_file for cache_file in cache_files if cache_file.eviction_class != METADATA]
+        dnf_cache_pruner.execute_prune(cache_files, evict, cache_dir=self.cache_dir)
+        self.assertFalse(os.path.exists(self.path('epel-fedcba9876543210')))
+        self.assertFalse(os.path.exists(self.path('baseos-0123456789abcdef/packages')))
+        self.assertTrue(os.path.exists(self.path('baseos-0123456789abcdef/repodata/repomd.xml')))
+        self.assertTrue(os.path.isdir(self.cache_dir))
+
+        dnf_cache_pruner.execute_prune(cache_files, cache_files, cache_dir=self.cache_dir)
+        self.assertEqual(os.listdir(self.cache_dir), [])
@@ -0,0 +1,100 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import dnf_lock
+
+
+class RunSerializedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.lock_file = os.path.join(self.directory.name, 'dnf_scripts.lock')
+        self.result_dir = self.directory.name
+        self.calls = 0
+        # No waiting between attempts
+        patcher = mock.patch.object(dnf_lock, 'backoff_delay', return_value=0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def action(self, result='ran'):
+        def action():
+            self.calls += 1
+            return result
+        return action
+
+    def run_serialized(self, action=None, **kwargs):
+        kwargs.setdefault('coalesce', True)
+        return dnf_lock.run_serialized(action or self.action(), 'check-update', lock_file=self.lock_file,
+                                       result_dir=self.result_dir, **kwargs)
+
+    def result_path(self):
+        return dnf_lock.result_file('check-update', self.result_dir)
+
+    def test_result_finished_while_waiting_is_reused(self):
+        results = []
+        with dnf_lock.DnfLock(self.lock_file) as lock:
+            self.assertTrue(lock.locked)
+            waiter = threading.Thread(target=lambda: results.append(self.run_serialized()))
+            waiter.start()
+            # The waiter arrived before the result of the running command is stored
+            time.sleep(0.2)
+            dnf_lock.store_shared_result('check-update', 'shared', self.result_dir)
+        waiter.join()
+        self.assertEqual(results, ['shared'])
+        self.assertEqual(self.calls, 0)
+
+    def test_older_result_is_not_reused(self):
+        dnf_lock.store_shared_result('check-update', 'shared', self.result_dir)
+        time.sleep(0.01)
+        self.assertEqual(self.run_serialized(), 'ran')
+        self.assertEqual(self.calls, 1)
+        with open(self.result_path()) as file:
+            self.assertEqual(json.load(file)['result'], 'ran')
+
+    def test_result_finishing_in_the_future_is_rejected(self):
+        with open(self.result_path(), 'w') as file:
+            json.dump({'finished': time.time() + 3600, 'pid': 1, 'result': 'planted'}, file)
+        self.assertIsNone(dnf_lock.load_shared_result('check-update', time.time(), self.result_dir))
+        self.assertEqual(self.run_serialized(), 'ran')
+
+    def test_result_encoded_as_none_is_not_shared(self):
+        self.assertEqual(self.run_serialized(encode=lambda result: None), 'ran')
+        self.assertFalse(os.path.exists(self.result_path()))
+
+    def test_encode_and_decode(self):
+        dnf_lock.store_shared_result('check-update', ['ran'], self.result_dir)
+        self.assertEqual(self.run_serialized(encode=lambda result: [result], decode=lambda shared: shared[0]), 'ran')
+        with open(self.result_path()) as file:
+            self.assertEqual(json.load(file)['result'], ['ran'])
+
+    def test_locked_retries_stop_at_retries(self):
+        self.assertEqual(self.run_serialized(is_locked=lambda result: True, retries=2), 'ran')
+        self.assertEqual(self.calls, 3)
+
+    def test_retry_until_dnf_is_free(self):
+        results = iter(['locked', 'locked', 'ran'])
+        self.assertEqual(self.run_serialized(lambda: next(results), is_locked=lambda result: result == 'locked'),
+                         'ran')
+
+    def test_lock_wait_timeout(self):
+        with dnf_lock.DnfLock(self.lock_file):
+            errors = []
+
+            def wait():
+                try:
+                    self.run_serialized(wait_timeout=0.1)
+                except TimeoutError as e:
+                    errors.append(e)
+            waiter = threading.Thread(target=wait)
+            waiter.start()
+            waiter.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.calls, 0)
@@ -0,0 +1,102 @@
+import asyncio
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import fleet
+import update_history
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+CHECK_UPDATE_OUTPUT = os.path.join(FIXTURES, 'dnf_check_update.txt')
+
+# Local stand-in for ssh: called as "sh fake_transport.sh MODE HOST REMOTE_COMMAND"
+FAKE_TRANSPORT = f'''
+mode=$1 host=$2 remote=$3
+case $host in
+    slow*) sleep 1 ;;
+    hang*) exec sleep 30 ;;
+esac
+case $remote in
+    dnf*)
+        [ "$mode" = locked ] && {{ echo "Waiting for process with pid 1 to finish." >&2; exit 200; }}
+        cat {CHECK_UPDATE_OUTPUT}
+        exit 100 ;;
+    cat*)
+        echo 'ID="rocky"'
+        echo 'VERSION_ID="9.3"' ;;
+esac
+'''
+
+
+class RunFleetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.script = os.path.join(self.directory.name, 'fake_transport.sh')
+        with open(self.script, 'w') as file:
+            file.write(FAKE_TRANSPORT)
+        self.history_db = os.path.join(self.directory.name, 'update_history.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_fleet(self, hosts, jobs, mode='ok', timeout=10, history_db=None):
+        output = io.StringIO()
+        report = asyncio.run(fleet.run_fleet(hosts, jobs, f'sh {self.script} {mode} {{host}}', timeout,
+                                             output=output, history_db=history_db))
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        return {(record['host'], record['job']): record for record in records}, report
+
+    def test_json_lines_per_host_and_job(self):
+        records, report = self.run_fleet(['h1', 'h2'], ['updates', 'release'])
+        self.assertEqual(len(records), 4)
+        updates = records['h1', 'updates']
+        self.assertEqual(updates['status'], 'updates')
+        self.assertEqual(updates['returncode'], 100)
+        self.assertEqual(updates['result'][0]['name'], 'NetworkManager')
+        self.assertNotIn('error', updates)
+        release = records['h2', 'release']
+        self.assertEqual(release['status'], 'success')
+        self.assertEqual(release['result']['name'], 'rocky')
+        self.assertEqual(report['stragglers'], [])
+
+    def test_timeouts_and_stragglers(self):
+        hosts = ['h1', 'h2', 'h3', 'slow1', 'hang1']
+        records, report = self.run_fleet(hosts, ['release'], timeout=3)
+        hang = records['hang1', 'release']
+        self.assertEqual(hang['status'], 'timeout')
+        self.assertNotIn('result', hang)
+        self.assertIn('error', hang)
+        self.assertEqual(records['slow1', 'release']['status'], 'success')
+        self.assertEqual([straggler['host'] for straggler in report['stragglers']], ['hang1', 'slow1'])
+
+    def test_locked_check_is_an_error_and_not_recorded(self):
+        records, _ = self.run_fleet(['h1'], ['updates'], history_db=self.history_db)
+        self.assertEqual(records['h1', 'updates']['status'], 'updates')
+
+        records, _ = self.run_fleet(['h1'], ['updates'], mode='locked', history_db=self.history_db)
+        locked = records['h1', 'updates']
+        self.assertEqual(locked['status'], 'locked')
+        self.assertNotIn('result', locked)
+        self.assertIn('Waiting for process', locked['error'])
+
+        connection = sqlite3.connect(self.history_db)
+        try:
+            self.assertEqual(connection.execute('SELECT COUNT(*) FROM snapshots').fetchone()[0], 1)
+            pending = update_history.query_pending(connection, 0, 'h1')
+        finally:
+            connection.close()
+        self.assertEqual(len(pending), 4)
+
+
+class ParseArgumentsTest(unittest.TestCase):
+
+    def test_history_flag_and_database(self):
+        args = fleet.parse_arguments(['h1', 'h2', '--history', '--jobs', 'updates'])
+        self.assertEqual(args.hosts, ['h1', 'h2'])
+        self.assertTrue(args.history)
+        self.assertEqual(args.history_db, update_history.HISTORY_DB)
+        self.assertEqual(args.jobs, ['updates'])
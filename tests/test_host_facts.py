@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import unittest
+
+import host_facts
+
+ROCKY_OS_RELEASE = '''NAME="Rocky Linux"
+VERSION="9.3 (Blue Onyx)"
+ID="rocky"
+ID_LIKE="rhel centos fedora"
+VERSION_ID="9.3"
+PRETTY_NAME='Rocky Linux 9.3 (Blue Onyx)'
+# A comment=with an equals sign
+HOME_URL="https://rockylinux.org/"
+'''
+
+
+class ParseOsReleaseTest(unittest.TestCase):
+
+    def test_quoted_values(self):
+        fields = host_facts.parse_os_release(ROCKY_OS_RELEASE)
+        self.assertEqual(fields['NAME'], 'Rocky Linux')
+        self.assertEqual(fields['ID_LIKE'], 'rhel centos fedora')
+        self.assertEqual(fields['PRETTY_NAME'], 'Rocky Linux 9.3 (Blue Onyx)')
+        self.assertEqual(fields['HOME_URL'], 'https://rockylinux.org/')
+        self.assertNotIn('# A comment', fields)
+
+    def test_unquoted_and_escaped_values(self):
+        fields = host_facts.parse_os_release('ID=fedora\nVERSION_ID=39\nNAME="Fedora \\"Linux\\""\nBROKEN="open\n')
+        self.assertEqual(fields['ID'], 'fedora')
+        self.assertEqual(fields['VERSION_ID'], '39')
+        self.assertEqual(fields['NAME'], 'Fedora "Linux"')
+        self.assertEqual(fields['BROKEN'], '"open')
+
+    def test_facts_from_os_release(self):
+        facts = host_facts.facts_from_text(ROCKY_OS_RELEASE, '/etc/os-release')
+        self.assertEqual(facts, host_facts.HostFacts('rocky', 'Rocky Linux', '9.3', ('rhel', 'centos', 'fedora'), 9, 3,
+                                                     'dnf', '/etc/os-release'))
+
+
+class RedhatReleaseTest(unittest.TestCase):
+
+    def test_every_known_name(self):
+        for name, distribution_id in host_facts.REDHAT_RELEASE_IDS.items():
+            with self.subTest(name=name):
+                facts = host_facts.facts_from_redhat_release(f'{name} release 8.9 (Codename)', '/etc/redhat-release')
+                self.assertEqual((facts.id, facts.name, facts.version_id, facts.major, facts.minor),
+                                 (distribution_id, name, '8.9', 8, 9))
+                self.assertEqual(facts.id_like, host_facts.REDHAT_RELEASE_ID_LIKE[distribution_id])
+                # Fedora switched to dnf in release 22
+                self.assertEqual(facts.package_manager, 'yum' if distribution_id == 'fedora' else 'dnf')
+
+    def test_major_version_only(self):
+        facts = host_facts.facts_from_redhat_release('Fedora release 39 (Thirty Nine)', None)
+        self.assertEqual((facts.version_id, facts.major, facts.minor), ('39', 39, None))
+
+    def test_unknown_release(self):
+        self.assertIsNone(host_facts.facts_from_redhat_release('Scientific Linux release 7.9 (Nitrogen)', None))
+        self.assertIsNone(host_facts.facts_from_redhat_release('not a release line', None))
+
+
+class PackageManagerTest(unittest.TestCase):
+
+    def test_package_managers(self):
+        cases = [
+            ('rhel', (), 9, 'dnf'),
+            ('centos', ('rhel', 'fedora'), 7, 'yum'),
+            ('rocky', ('rhel', 'centos', 'fedora'), 8, 'dnf'),
+            ('rocky', ('rhel', 'centos', 'fedora'), None, 'dnf'),
+            ('fedora', (), 21, 'yum'),
+            ('fedora', (), 22, 'dnf'),
+            ('ubuntu', ('debian',), 22, 'apt'),
+            ('opensuse-leap', ('suse', 'opensuse'), 15, 'zypper'),
+            ('arch', (), None, None),
+        ]
+        for distribution_id, id_like, major, expected in cases:
+            with self.subTest(distribution_id=distribution_id, major=major):
+                self.assertEqual(host_facts.package_manager(distribution_id, id_like, major), expected)
+
+
+class HostFactsCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.os_release = os.path.join(self.directory.name, 'os-release')
+        self.redhat_release = os.path.join(self.directory.name, 'redhat-release')
+        self.cache_file = os.path.join(self.directory.name, 'state', 'host_facts_cache.json')
+        host_facts._facts.clear()
+
+    def tearDown(self):
+        host_facts._facts.clear()
+        self.directory.cleanup()
+
+    def write(self, path, content, mtime):
+        with open(path, 'w') as file:
+            file.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def get_host_facts(self, **kwargs):
+        return host_facts.get_host_facts(os_release_files=(self.os_release,), redhat_release_file=self.redhat_release,
+                                         cache_file=self.cache_file, **kwargs)
+
+    def test_cached_facts_are_used_until_the_release_file_changes(self):
+        self.write(self.os_release, ROCKY_OS_RELEASE, 1700000000)
+        self.assertEqual(self.get_host_facts().version_id, '9.3')
+        # A new process reads the facts from the cache file
+        with open(self.cache_file) as file:
+            cached = json.load(file)
+        cached['facts']['name'] = 'Rocky Linux (cached)'
+        with open(self.cache_file, 'w') as file:
+            json.dump(cached, file)
+        host_facts._facts.clear()
+        self.assertEqual(self.get_host_facts().name, 'Rocky Linux (cached)')
+        self.assertEqual(self.get_host_facts(refresh=True).name, 'Rocky Linux')
+
+        # After an upgrade, same size but a new modification time
+        self.write(self.os_release, ROCKY_OS_RELEASE.replace('9.3', '9.4'), 1710000000)
+        host_facts._facts.clear()
+        facts = self.get_host_facts()
+        self.assertEqual((facts.version_id, facts.minor), ('9.4', 4))
+
+    def test_redhat_release_fallback(self):
+        self.write(self.redhat_release, 'CentOS Linux release 7.9.2009 (Core)\n', 1700000000)
+        facts = self.get_host_facts()
+        self.assertEqual((facts.id, facts.major, facts.minor, facts.package_manager), ('centos', 7, 9, 'yum'))
+        self.assertEqual(facts.source, self.redhat_release)
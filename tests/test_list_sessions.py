@@ -0,0 +1,141 @@
+import os
+import unittest
+from datetime import datetime
+
+import list_sessions
+from list_sessions import SessionDetails
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+SESSIONS_DIR = os.path.join(FIXTURES, 'sessions')
+
+
+def read_fixture(*path):
+    with open(os.path.join(FIXTURES, *path), 'r') as file:
+        return file.read()
+
+
+class ParseShowSessionOutputTest(unittest.TestCase):
+
+    def test_one_record_per_block(self):
+        sessions = list_sessions.parse_show_session_output(read_fixture('show_session.txt'))
+        self.assertEqual([details.SessionID for details in sessions], ['3', '12', 'c1'])
+        self.assertEqual(sessions[0], SessionDetails(
+            SessionID='3', Since='Tue 2024-05-14 08:20:13 CEST', Leader='1234', Seat='seat0', Display=':0',
+            Service='lightdm', Desktop='xfce', State='active', Idle='no', Unit='session-3.scope', IdleSince='0'))
+
+    def test_empty_properties_are_none(self):
+        ssh_session = list_sessions.parse_show_session_output(read_fixture('show_session.txt'))[1]
+        self.assertIsNone(ssh_session.Seat)
+        self.assertIsNone(ssh_session.Display)
+        self.assertIsNone(ssh_session.Desktop)
+        self.assertEqual(ssh_session.Service, 'sshd')
+        self.assertEqual(ssh_session.IdleSince, '1715670104000000')
+
+    def test_without_trailing_empty_line(self):
+        output = read_fixture('show_session.txt').rstrip('\n')
+        self.assertEqual(len(list_sessions.parse_show_session_output(output)), 3)
+
+    def test_idle_seconds(self):
+        active, idle, _ = list_sessions.parse_show_session_output(read_fixture('show_session.txt'))
+        self.assertEqual(list_sessions.idle_seconds(active), 0.0)
+        self.assertEqual(list_sessions.idle_seconds(idle, now=1715670164), 60.0)
+
+
+LIGHTDM_SESSION_STATUS = """3 - alice (1000)
+           Since: Tue 2024-05-14 08:20:13 CEST; 3h 12min ago
+          Leader: 1234 (lightdm)
+            Seat: seat0; vc7
+         Display: :0
+         Service: lightdm; type x11; class user
+         Desktop: xfce
+           State: active
+            Unit: session-3.scope
+                  ├─1234 lightdm --session-child 14 23
+                  ├─1301 xfce4-session
+                  └─1322 sh -c 'echo State: closing; echo Service: sshd'
+"""
+
+SSH_SESSION_STATUS = """12 - bob (1001)
+           Since: Tue 2024-05-14 09:01:44 CEST; 2h 31min ago
+          Leader: 5678 (sshd)
+          Remote: 10.0.0.12
+         Service: sshd; type tty; class user
+           State: active
+            Unit: session-12.scope
+                  ├─5678 sshd: bob [priv]
+                  └─5690 -bash
+"""
+
+
+class ParseSessionStatusOutputTest(unittest.TestCase):
+
+    def test_graphical_session(self):
+        details = list_sessions.parse_session_status_output('3', LIGHTDM_SESSION_STATUS)
+        self.assertEqual((details.SessionID, details.Leader, details.Display, details.Desktop, details.Unit),
+                         ('3', '1234', ':0', 'xfce', 'session-3.scope'))
+        self.assertEqual(details.Since, 'Tue 2024-05-14 08:20:13 CEST; 3h 12min ago')
+
+    def test_service_type_is_cut_off(self):
+        details = list_sessions.parse_session_status_output('3', LIGHTDM_SESSION_STATUS)
+        self.assertEqual(details.Service, 'lightdm')
+        with self.assertLogs(level='INFO'):
+            self.assertTrue(list_sessions.it_is_lightdm_service(details))
+
+    def test_cgroup_tree_does_not_override_fields(self):
+        details = list_sessions.parse_session_status_output('3', LIGHTDM_SESSION_STATUS)
+        self.assertEqual((details.State, details.Service), ('active', 'lightdm'))
+
+    def test_ssh_session_without_seat_and_display(self):
+        details = list_sessions.parse_session_status_output('12', SSH_SESSION_STATUS)
+        self.assertIsNone(details.Seat)
+        self.assertIsNone(details.Display)
+        self.assertIsNone(details.Desktop)
+        self.assertIsNone(details.Idle)
+        self.assertEqual((details.Leader, details.Service, details.State), ('5678', 'sshd', 'active'))
+        with self.assertLogs(level='INFO'):
+            self.assertFalse(list_sessions.it_is_lightdm_service(details))
+
+
+class SessionStateFileTest(unittest.TestCase):
+
+    def test_parse_state_file(self):
+        details = list_sessions.parse_session_state_file('3', read_fixture('sessions', '3'))
+        since = datetime.fromtimestamp(1715667613).strftime('%a %Y-%m-%d %H:%M:%S')
+        self.assertEqual(details, SessionDetails(
+            SessionID='3', Since=since, Leader='1234', Seat='seat0', Display=':0', Service='lightdm', Desktop='xfce',
+            State='active', Unit='session-3.scope'))
+
+    def test_remote_session_has_no_seat(self):
+        details = list_sessions.parse_session_state_file('12', read_fixture('sessions', '12'))
+        self.assertIsNone(details.Seat)
+        self.assertIsNone(details.Display)
+        self.assertIsNone(details.Idle)
+        self.assertEqual((details.Service, details.State, details.Leader), ('sshd', 'online', '5678'))
+
+    def test_session_ids_skip_ref_files(self):
+        self.assertEqual(list_sessions.get_session_ids_from_state_files(SESSIONS_DIR), ['3', '12'])
+
+    def test_missing_session(self):
+        self.assertIsNone(list_sessions.get_session_details_from_state_file('99', SESSIONS_DIR))
+
+
+class SelectBackendTest(unittest.TestCase):
+
+    def select_backend(self, *argv):
+        args = list_sessions.parse_arguments(['--sessions-dir', SESSIONS_DIR, *argv])
+        return list_sessions.select_backend(args.backend, args.sessions_dir, args.needs_idle)
+
+    def test_text_output_needs_the_idle_state(self):
+        self.assertEqual(self.select_backend(), 'loginctl')
+
+    def test_export_without_idle_fields_reads_the_state_files(self):
+        self.assertEqual(self.select_backend('--format', 'jsonl', '--fields', 'SessionID,Service,State'),
+                         'statefiles')
+
+    def test_idle_filter_needs_loginctl(self):
+        self.assertEqual(self.select_backend('--format', 'jsonl', '--fields', 'SessionID', '--idle-over', '60'),
+                         'loginctl')
+
+
+if __name__ == '__main__':
+    unittest.main()
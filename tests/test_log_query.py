@@ -0,0 +1,106 @@
+import mmap
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import log_query
+
+START = datetime(2024, 5, 14, 8, 0, 0)
+
+
+def log_lines(first, count):
+    """
+    Returns count records one second apart from record number first on, every tenth with a continuation line.
+    """
+    lines = []
+    for number in range(first, first + count):
+        timestamp = (START + timedelta(seconds=number)).strftime('%Y-%m-%d %H:%M:%S')
+        level = 'ERROR' if number % 10 == 0 else 'INFO'
+        lines.append(f'{timestamp},{number % 1000:03d} {level}: record {number} {"x" * 80}\n')
+        if number % 10 == 0:
+            lines.append(f'STDERR: details of record {number}\n')
+    return ''.join(lines)
+
+
+class LogQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.directory.name, 'dnf_clean.log')
+        self.index_path = self.log_path + log_query.INDEX_SUFFIX
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_log(self, text, mode='w'):
+        with open(self.log_path, mode) as file:
+            file.write(text)
+
+    def update_index(self):
+        with open(self.log_path, 'rb') as file:
+            inode = os.fstat(file.fileno()).st_ino
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                return log_query.update_index(self.log_path, log, inode)
+
+    def query(self, since=None, until=None, **kwargs):
+        since = log_query.parse_time_bound(since) if since else None
+        until = log_query.parse_time_bound(until, upper=True) if until else None
+        return list(log_query.query(self.log_path, since, until, **kwargs))
+
+    def test_time_range_with_continuation_lines(self):
+        self.write_log(log_lines(0, 5000))
+        records = self.query('2024-05-14 08:30:00', '2024-05-14 08:30:10')
+        self.assertEqual(len(records), 11)
+        self.assertTrue(records[0].startswith('2024-05-14 08:30:00,800 ERROR: record 1800 '))
+        self.assertTrue(records[0].endswith('STDERR: details of record 1800\n'))
+        self.assertTrue(records[-1].startswith('2024-05-14 08:30:10,810 ERROR: record 1810 '))
+
+    def test_level_filters(self):
+        self.write_log(log_lines(0, 100))
+        self.assertEqual(len(self.query(levels={'ERROR'})), 10)
+        self.assertEqual(len(self.query(min_level=log_query.LEVELS['INFO'])), 100)
+        self.assertEqual(len(self.query(pattern=b'record 42 ')), 1)
+
+    def test_resumed_index_equals_a_full_index(self):
+        self.write_log(log_lines(0, 3000))
+        first_entries = self.update_index()
+        self.write_log(log_lines(3000, 3000), 'a')
+        resumed_entries = self.update_index()
+        self.assertEqual(resumed_entries[:len(first_entries)], first_entries)
+        self.assertGreater(len(resumed_entries), len(first_entries))
+
+        os.remove(self.index_path)
+        self.assertEqual(self.update_index(), resumed_entries)
+        # The stored index is the resumed one as well
+        inode = os.stat(self.log_path).st_ino
+        self.assertEqual(log_query.read_index(self.index_path, inode),
+                         (resumed_entries, os.path.getsize(self.log_path)))
+
+    def test_incomplete_last_line_is_not_indexed(self):
+        self.write_log(log_lines(0, 2000) + '2024-05-14 09:00:00,000 INFO: still being writ')
+        self.update_index()
+        _, indexed_offset = log_query.read_index(self.index_path, os.stat(self.log_path).st_ino)
+        self.assertEqual(indexed_offset, len(log_lines(0, 2000)))
+
+    def test_truncated_log_is_indexed_again(self):
+        self.write_log(log_lines(0, 3000))
+        self.update_index()
+        # e.g. logrotate's copytruncate, keeps the inode
+        self.write_log(log_lines(5000, 100))
+        entries = self.update_index()
+        self.assertEqual(entries[0][1], 0)
+        self.assertEqual(len(self.query('2024-05-14 08:00', '2024-05-14 08:59')), 0)
+        self.assertEqual(len(self.query('2024-05-14 09:23:20', '2024-05-14 09:23:29')), 10)
+
+    def test_rotated_log_is_indexed_again(self):
+        self.write_log(log_lines(0, 3000))
+        self.update_index()
+        os.rename(self.log_path, self.log_path + '.1')
+        self.write_log(log_lines(3000, 10))
+        self.assertEqual(len(self.query()), 10)
+        self.assertEqual(len(self.query('2024-05-14 08:00', '2024-05-14 08:49')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
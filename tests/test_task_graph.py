@@ -0,0 +1,83 @@
+import unittest
+
+import task_graph
+from task_graph import Task, TaskRun
+
+
+def fail(inputs):
+    raise OSError('cache directory gone')
+
+
+class PlanTest(unittest.TestCase):
+
+    def test_waves(self):
+        tasks = [Task('check', lambda inputs: None, ('scan',), after=('prune',)),
+                 Task('prune', lambda inputs: None, ('scan',)),
+                 Task('scan', lambda inputs: None)]
+        self.assertEqual([[task.name for task in wave] for wave in task_graph.plan(tasks)],
+                         [['scan'], ['prune'], ['check']])
+
+    def test_unknown_inputs(self):
+        with self.assertRaisesRegex(ValueError, 'unknown tasks'):
+            task_graph.plan([Task('check', lambda inputs: None, ('scan',))])
+        with self.assertRaisesRegex(ValueError, 'unknown tasks'):
+            task_graph.plan([Task('check', lambda inputs: None, after=('prune',))])
+
+    def test_cycles(self):
+        with self.assertRaisesRegex(ValueError, 'cycle'):
+            task_graph.plan([Task('a', lambda inputs: None, ('b',)), Task('b', lambda inputs: None, after=('a',)),
+                             Task('c', lambda inputs: None)])
+
+
+class RunGraphTest(unittest.TestCase):
+
+    def test_inputs_are_passed(self):
+        runs = task_graph.run_graph([Task('scan', lambda inputs: 3),
+                                     Task('double', lambda inputs: inputs['scan'] * 2, ('scan',))])
+        self.assertEqual((runs['double'].status, runs['double'].result), ('done', 6))
+
+    def test_skipped_precondition(self):
+        with self.assertLogs(level='INFO'):
+            runs = task_graph.run_graph([Task('scan', lambda inputs: []),
+                                         Task('prune', lambda inputs: 'pruned', ('scan',),
+                                              lambda inputs: bool(inputs['scan'])),
+                                         Task('check', lambda inputs: inputs['prune'], ('prune',))])
+        self.assertEqual(runs['prune'].status, 'skipped')
+        self.assertIsNone(runs['prune'].result)
+        # A skipped task is not a failure, the tasks after it still run
+        self.assertEqual(runs['check'].status, 'done')
+
+    def test_failure_propagates_through_inputs_only(self):
+        with self.assertLogs(level='ERROR'):
+            runs = task_graph.run_graph([Task('scan', fail),
+                                         Task('prune', lambda inputs: None, ('scan',)),
+                                         Task('report', lambda inputs: None, ('prune',)),
+                                         Task('check', lambda inputs: 'checked', after=('prune',))])
+        self.assertEqual(runs['scan'].status, 'failed')
+        self.assertIsInstance(runs['scan'].result, OSError)
+        self.assertEqual(runs['prune'].status, 'upstream failed')
+        self.assertEqual(runs['report'].status, 'upstream failed')
+        self.assertEqual((runs['check'].status, runs['check'].result), ('done', 'checked'))
+
+    def test_after_orders_the_tasks(self):
+        order = []
+        task_graph.run_graph([Task('check', lambda inputs: order.append('check'), after=('prune',)),
+                              Task('prune', lambda inputs: order.append('prune'))])
+        self.assertEqual(order, ['prune', 'check'])
+
+
+class CriticalPathTest(unittest.TestCase):
+
+    def test_longest_chain(self):
+        tasks = [Task('scan', None), Task('query_installed', None),
+                 Task('prune', None, ('scan',)), Task('check', None, ('query_installed',), after=('prune',))]
+        runs = {'scan': TaskRun('scan', 'done', 0.0, 1.0, None),
+                'query_installed': TaskRun('query_installed', 'done', 0.0, 2.5, None),
+                'prune': TaskRun('prune', 'done', 1.0, 2.0, None),
+                'check': TaskRun('check', 'done', 2.5, 4.0, None)}
+        self.assertEqual(task_graph.critical_path(tasks, runs), (['query_installed', 'check'], 4.0))
+        runs['prune'] = TaskRun('prune', 'done', 1.0, 3.0, None)
+        self.assertEqual(task_graph.critical_path(tasks, runs), (['scan', 'prune', 'check'], 4.5))
+
+    def test_empty_graph(self):
+        self.assertEqual(task_graph.critical_path([], {}), ([], 0.0))
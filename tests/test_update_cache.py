@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import unittest
+
+import update_cache
+from update_engine import Update
+
+UPDATES = [Update('kernel-core', 'x86_64', '5.14.0-362.24.1.el9_3', 'baseos')]
+
+
+class CachedUpdateCheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.directory.name, 'dnf')
+        self.repomd = os.path.join(self.cache_dir, 'baseos-0123456789abcdef', 'repodata', 'repomd.xml')
+        self.rpmdb_dir = os.path.join(self.directory.name, 'rpm')
+        self.rpmdb = os.path.join(self.rpmdb_dir, 'rpmdb.sqlite')
+        self.cache_file = os.path.join(self.directory.name, 'state', 'check_updates_cache.json')
+        os.makedirs(os.path.dirname(self.repomd))
+        os.makedirs(self.rpmdb_dir)
+        self.write(self.repomd, '<repomd/>')
+        self.write(self.rpmdb, 'rpmdb')
+        self.checks = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @staticmethod
+    def write(path, text):
+        with open(path, 'w') as file:
+            file.write(text)
+
+    def check(self, result=(True, UPDATES)):
+        def check():
+            self.checks += 1
+            return result
+        return check
+
+    def cached_check(self, result=(True, UPDATES), **kwargs):
+        return update_cache.cached_update_check(self.check(result), self.cache_file, cache_dir=self.cache_dir,
+                                                rpmdb_dir=self.rpmdb_dir, **kwargs)
+
+    def test_result_is_reused_while_nothing_changed(self):
+        self.assertEqual(self.cached_check(), (True, UPDATES))
+        self.assertEqual(self.cached_check(), (True, UPDATES))
+        self.assertEqual(self.checks, 1)
+
+    def test_repomd_change_invalidates(self):
+        self.cached_check()
+        self.write(self.repomd, '<repomd revision="2"/>')
+        self.cached_check()
+        self.assertEqual(self.checks, 2)
+
+    def test_rpmdb_change_invalidates(self):
+        self.cached_check()
+        self.write(self.rpmdb, 'rpmdb after an install')
+        self.cached_check()
+        self.assertEqual(self.checks, 2)
+
+    def test_expired_result_is_not_used(self):
+        self.cached_check()
+        with open(self.cache_file) as file:
+            cached = json.load(file)
+        cached['timestamp'] -= update_cache.DEFAULT_TTL + 1
+        self.write(self.cache_file, json.dumps(cached))
+        self.cached_check()
+        self.assertEqual(self.checks, 2)
+
+    def test_refresh_runs_the_check(self):
+        self.cached_check()
+        self.assertEqual(self.cached_check((False, []), refresh=True), (False, []))
+        self.assertEqual(self.cached_check(), (False, []))
+        self.assertEqual(self.checks, 2)
+
+    def test_failed_check_is_not_cached(self):
+        self.assertIsNone(self.cached_check(None))
+        self.assertFalse(os.path.exists(self.cache_file))
+        self.assertIsNone(self.cached_check(None))
+        self.assertEqual(self.checks, 2)
+
+    def test_result_of_another_key_is_not_used(self):
+        self.cached_check(key='native')
+        self.assertEqual(self.cached_check((False, []), key='dnf'), (False, []))
+        self.assertEqual(self.checks, 2)
+        self.assertEqual(self.cached_check(key='dnf'), (False, []))
+        self.assertEqual(self.checks, 2)
@@ -0,0 +1,199 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+import metrics
+import update_engine
+from update_engine import Package, Update
+
+REPOMD_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo">
+  <data type="primary">
+    <location href="repodata/abc-primary.xml.gz"/>
+  </data>
+</repomd>
+'''
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+CHECK_UPDATE_OUTPUT = os.path.join(FIXTURES, 'dnf_check_update.txt')
+CHECK_UPDATE_UPDATES = [
+    Update('NetworkManager', 'x86_64', '1:1.44.0-5.el9_3', 'baseos'),
+    Update('kernel-core', 'x86_64', '5.14.0-362.24.1.el9_3', 'baseos'),
+    Update('python3-azure-mgmt-recoveryservicesbackup', 'noarch', '9.0.0-1.el9', 'appstream'),
+    Update('openssl-libs', 'x86_64', '1:3.0.7-25.el9_3', 'baseos'),
+    Update('grub2-tools', 'x86_64', '1:2.06-70.el9_3.2', 'baseos', 'grub2-tools.x86_64'),
+    Update('grub2-tools-efi', 'x86_64', '1:2.06-70.el9_3.2', 'baseos', 'grub2-tools.x86_64'),
+    Update('grub2-tools-efi', 'x86_64', '1:2.06-70.el9_3.2', 'baseos', 'grub2-tools-extra.x86_64'),
+]
+
+PRIMARY_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://linux.duke.edu/metadata/common" packages="4">
+  <package type="rpm">
+    <name>kernel-core</name><arch>x86_64</arch><version epoch="0" ver="5.14.0" rel="362.13.1.el9_3"/>
+  </package>
+  <package type="rpm">
+    <name>kernel-core</name><arch>x86_64</arch><version epoch="0" ver="5.14.0" rel="362.8.1.el9_3"/>
+  </package>
+  <package type="rpm">
+    <name>bash</name><arch>x86_64</arch><version epoch="0" ver="5.1.8" rel="6.el9"/>
+  </package>
+  <package type="rpm">
+    <name>openssl</name><arch>x86_64</arch><version epoch="1" ver="3.0.7" rel="25.el9_3"/>
+  </package>
+</metadata>
+'''
+
+
+class CompareVersionStringsTest(unittest.TestCase):
+    """
+    Cases of rpm's own rpmvercmp tests.
+    """
+
+    def assert_order(self, cases):
+        for first, second, expected in cases:
+            with self.subTest(first=first, second=second):
+                self.assertEqual(update_engine.compare_version_strings(first, second), expected)
+                self.assertEqual(update_engine.compare_version_strings(second, first), -expected)
+
+    def test_numeric_and_alphabetic_segments(self):
+        self.assert_order([
+            ('1.0', '1.0', 0),
+            ('1.0', '2.0', -1),
+            ('2.0.1', '2.0', 1),
+            ('2.0.1a', '2.0.1', 1),
+            ('5.5p1', '5.5p2', -1),
+            ('5.5p10', '5.5p1', 1),
+            ('1.01', '1.001', 0),
+            ('20101121', '20101121.0', -1),
+            ('xyz', 'abc', 1),
+        ])
+
+    def test_numeric_segment_is_newer_than_alphabetic(self):
+        self.assert_order([
+            ('10xyz', '10.1xyz', -1),
+            ('xyz10', 'xyz10.1', -1),
+            ('2a', '2.0', -1),
+        ])
+
+    def test_separators_are_ignored(self):
+        self.assert_order([
+            ('1.0', '1_0', 0),
+            ('fc4', 'fc.4', 0),
+        ])
+
+    def test_tilde_sorts_before_everything(self):
+        self.assert_order([
+            ('1.0~rc1', '1.0', -1),
+            ('1.0~rc1', '1.0~rc2', -1),
+            ('1.0~rc1~git123', '1.0~rc1', -1),
+            ('1.0~', '1.0', -1),
+        ])
+
+    def test_caret_sorts_after_the_end_only(self):
+        self.assert_order([
+            ('1.0^', '1.0', 1),
+            ('1.0^git1', '1.0', 1),
+            ('1.0^git1', '1.0.1', -1),
+            ('1.0^git1', '1.0^git2', -1),
+            ('1.0~rc1^git1', '1.0~rc1', 1),
+            ('1.0^git1~pre', '1.0^git1', -1),
+        ])
+
+    def test_epoch_wins_over_version(self):
+        old = Package('openssl', '1', '1.1.1k', '9.el8', 'x86_64')
+        new = Package('openssl', None, '3.0.7', '25.el9', 'x86_64')
+        self.assertEqual(update_engine.compare_evr(old, new), 1)
+        self.assertEqual(update_engine.compare_evr(new, new._replace(epoch='0')), 0)
+
+
+class CheckUpdateParserTest(unittest.TestCase):
+
+    def read_fixture(self):
+        with open(CHECK_UPDATE_OUTPUT, 'r') as file:
+            return file.read()
+
+    def test_wrapped_and_obsoleting_lines(self):
+        self.assertEqual(update_engine.parse_check_update_output(self.read_fixture()), CHECK_UPDATE_UPDATES)
+
+    def test_wrapped_line_completes_on_its_continuation(self):
+        parser = update_engine.CheckUpdateParser()
+        self.assertEqual(parser.feed('python3-azure-mgmt-recoveryservicesbackup.noarch\n'), [])
+        self.assertEqual(parser.feed('                    9.0.0-1.el9        appstream\n'), [CHECK_UPDATE_UPDATES[2]])
+
+    def test_obsoleting_package_is_not_an_update_by_itself(self):
+        parser = update_engine.CheckUpdateParser()
+        parser.feed('Obsoleting Packages\n')
+        self.assertEqual(parser.feed('grub2-tools.x86_64      1:2.06-70.el9_3.2      baseos\n'), [])
+        self.assertEqual(parser.feed('    grub2-tools.x86_64  1:2.06-70.el9_3.1      @baseos\n'), [CHECK_UPDATE_UPDATES[4]])
+
+    def test_no_updates(self):
+        self.assertEqual(update_engine.parse_check_update_output(
+            'Last metadata expiration check: 0:00:01 ago on Tue 14 May 2024 08:00:00 AM CEST.\n'), [])
+
+
+class CheckUpdateStreamTest(unittest.TestCase):
+
+    def test_stream_yields_every_update(self):
+        with update_engine.CheckUpdateStream(command=['cat', CHECK_UPDATE_OUTPUT]) as stream:
+            updates = list(stream)
+        self.assertEqual(updates, CHECK_UPDATE_UPDATES)
+        self.assertFalse(stream.stopped_early)
+        self.assertEqual(stream.result.returncode, 0)
+
+    def test_parse_time_is_recorded(self):
+        metrics.REGISTRY.clear()
+        self.addCleanup(metrics.REGISTRY.clear)
+        with update_engine.CheckUpdateStream(command=['cat', CHECK_UPDATE_OUTPUT]) as stream:
+            list(stream)
+        _, total, count = metrics.REGISTRY.histograms[
+            metrics.REGISTRY.key('stage_duration_seconds', {'stage': 'parse_check_update'})]
+        self.assertEqual(count, 1)
+        self.assertEqual(total, stream.parse_seconds)
+        self.assertGreater(total, 0)
+
+    def test_leaving_early_stops_the_command(self):
+        command = ['sh', '-c', f'cat {CHECK_UPDATE_OUTPUT}; sleep 60']
+        with update_engine.CheckUpdateStream(command=command) as stream:
+            update = next(iter(stream))
+        self.assertEqual(update, CHECK_UPDATE_UPDATES[0])
+        self.assertTrue(stream.stopped_early)
+        self.assertFalse(stream.thread.is_alive())
+
+
+class CheckUpdatesNativeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        repodata = os.path.join(self.cache_dir.name, 'baseos-0123456789abcdef', 'repodata')
+        os.makedirs(repodata)
+        with open(os.path.join(repodata, 'repomd.xml'), 'w') as file:
+            file.write(REPOMD_XML)
+        with gzip.open(os.path.join(repodata, 'abc-primary.xml.gz'), 'wt') as file:
+            file.write(PRIMARY_XML)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_newest_update_of_installed_packages(self):
+        installed = [
+            Package('kernel-core', '0', '5.14.0', '284.11.1.el9_2', 'x86_64'),
+            Package('kernel-core', '0', '5.14.0', '362.8.1.el9_3', 'x86_64'),
+            Package('bash', '0', '5.1.8', '6.el9', 'x86_64'),
+            Package('openssl', '1', '3.0.7', '24.el9', 'x86_64'),
+            Package('vim-minimal', '2', '8.2.2637', '20.el9_1', 'x86_64'),
+        ]
+        updates_available, updates = update_engine.check_updates_native(self.cache_dir.name, installed)
+        self.assertTrue(updates_available)
+        self.assertEqual(updates, [
+            Update('kernel-core', 'x86_64', '5.14.0-362.13.1.el9_3', 'baseos'),
+            Update('openssl', 'x86_64', '1:3.0.7-25.el9_3', 'baseos'),
+        ])
+
+    def test_no_updates(self):
+        installed = [Package('bash', '0', '5.1.8', '6.el9', 'x86_64')]
+        self.assertEqual(update_engine.check_updates_native(self.cache_dir.name, installed), (False, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+
+import update_history
+from update_engine import Update
+
+DAY = 86400
+START = 1715670000
+
+
+class UpdateHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, 'update_history.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self, updates, day, host='web1'):
+        return update_history.record_snapshot(updates, host, START + day * DAY, self.db_path)
+
+    def rows(self):
+        connection = update_history.connect(self.db_path)
+        try:
+            return connection.execute(
+                "SELECT hosts.name, packages.name || '.' || packages.arch, version, first_seen, last_seen, resolved "
+                'FROM pending JOIN packages ON packages.id = pending.package_id '
+                'JOIN hosts ON hosts.id = pending.host_id ORDER BY pending.id').fetchall()
+        finally:
+            connection.close()
+
+    def query(self, function, *args, **kwargs):
+        connection = update_history.connect(self.db_path)
+        try:
+            return function(connection, *args, **kwargs)
+        finally:
+            connection.close()
+
+    def test_added_updates(self):
+        delta = self.record([Update('bash', 'x86_64', '5.1.8-9.el9', 'baseos'),
+                             Update('vim', 'x86_64', '8.2-1.el9', 'appstream')], 0)
+        self.assertEqual(delta.added, [('bash', 'x86_64', '5.1.8-9.el9', 'baseos'),
+                                       ('vim', 'x86_64', '8.2-1.el9', 'appstream')])
+        self.assertEqual((delta.removed, delta.changed), ([], []))
+        delta = self.record([Update('bash', 'x86_64', '5.1.8-9.el9', 'baseos'),
+                             Update('vim', 'x86_64', '8.2-1.el9', 'appstream')], 1)
+        self.assertEqual((delta.added, delta.removed, delta.changed), ([], [], []))
+        self.assertEqual([row[4] for row in self.rows()], [START + DAY] * 2)
+
+    def test_changed_version_keeps_first_seen(self):
+        self.record([Update('bash', 'x86_64', '5.1.8-9.el9', 'baseos')], 0)
+        delta = self.record([Update('bash', 'x86_64', '5.1.8-10.el9', 'baseos')], 2)
+        self.assertEqual(delta.changed, [('bash', 'x86_64', '5.1.8-9.el9', '5.1.8-10.el9')])
+        self.assertEqual(delta.added, [])
+        self.assertEqual(self.rows(), [('web1', 'bash.x86_64', '5.1.8-10.el9', START, START + 2 * DAY, None)])
+
+    def test_resolved_and_reappearing_updates(self):
+        self.record([Update('bash', 'x86_64', '5.1.8-9.el9', 'baseos')], 0)
+        delta = self.record([], 1)
+        self.assertEqual(delta.removed, [('bash', 'x86_64', '5.1.8-9.el9')])
+        self.assertEqual(self.rows(), [('web1', 'bash.x86_64', '5.1.8-9.el9', START, START, START + DAY)])
+
+        delta = self.record([Update('bash', 'x86_64', '5.1.8-10.el9', 'baseos')], 3)
+        self.assertEqual(delta.added, [('bash', 'x86_64', '5.1.8-10.el9', 'baseos')])
+        self.assertEqual(self.rows(), [
+            ('web1', 'bash.x86_64', '5.1.8-9.el9', START, START, START + DAY),
+            ('web1', 'bash.x86_64', '5.1.8-10.el9', START + 3 * DAY, START + 3 * DAY, None),
+        ])
+        self.assertEqual(self.query(update_history.query_first_seen, 'bash.x86_64'),
+                         [('web1', 'bash.x86_64', START, '5.1.8-9.el9', START + DAY)])
+
+    def test_obsoletes_are_not_pending_updates(self):
+        delta = self.record([Update('grub2-tools', 'x86_64', '1:2.06-70.el9_3.2', 'baseos'),
+                             Update('grub2-tools-efi', 'x86_64', '1:2.06-70.el9_3.2', 'baseos',
+                                    'grub2-tools.x86_64')], 0)
+        self.assertEqual([added[0] for added in delta.added], ['grub2-tools'])
+        connection = update_history.connect(self.db_path)
+        try:
+            self.assertEqual(connection.execute('SELECT update_count FROM snapshots').fetchall(), [(1,)])
+        finally:
+            connection.close()
+
+    def test_hosts_are_kept_apart(self):
+        self.record([Update('bash', 'x86_64', '5.1.8-9.el9', 'baseos')], 0, 'web1')
+        delta = self.record([], 1, 'web2')
+        self.assertEqual(delta.removed, [])
+        self.assertIsNone(self.rows()[0][5])
+
+    def test_pending_and_hosts_day_cutoffs(self):
+        self.record([Update('bash', 'x86_64', '5.1.8-9.el9', 'baseos')], 0, 'web1')
+        self.record([Update('bash', 'x86_64', '5.1.8-9.el9', 'baseos'),
+                     Update('vim', 'x86_64', '8.2-1.el9', 'appstream')], 5, 'web1')
+        self.record([Update('vim', 'x86_64', '8.2-1.el9', 'appstream')], 8, 'web2')
+        now = START + 10 * DAY
+        self.assertEqual(self.query(update_history.query_pending, 10, now=now),
+                         [('web1', 'bash.x86_64', '5.1.8-9.el9', START)])
+        self.assertEqual(self.query(update_history.query_pending, 5, now=now), [
+            ('web1', 'bash.x86_64', '5.1.8-9.el9', START),
+            ('web1', 'vim.x86_64', '8.2-1.el9', START + 5 * DAY),
+        ])
+        self.assertEqual(len(self.query(update_history.query_pending, 2, now=now)), 3)
+        self.assertEqual(self.query(update_history.query_pending, 0, 'web2', now=now),
+                         [('web2', 'vim.x86_64', '8.2-1.el9', START + 8 * DAY)])
+        self.assertEqual(self.query(update_history.query_hosts, 5, now=now), [('web1', 2, START)])
+        self.assertEqual(self.query(update_history.query_hosts, 2, now=now),
+                         [('web1', 2, START), ('web2', 1, START + 8 * DAY)])
+        self.assertEqual(self.query(update_history.query_hosts, 11, now=now), [])
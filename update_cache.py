@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
+import state_files
+from update_engine import DNF_CACHE_DIR, Update
+
+# File the last update check result is kept in
+CACHE_FILE = os.path.join(state_files.STATE_DIR, 'check_updates_cache.json')
+# Seconds a cached result is used at most, even if nothing changed
+DEFAULT_TTL = 3600
+# Directory of the rpm database, it changes whenever packages are installed or removed
+RPMDB_DIR = '/var/lib/rpm'
+
+
+def stat_signature(path):
+    try:
+        stat_result = os.stat(path)
+        return [path, stat_result.st_mtime_ns, stat_result.st_size]
+    except OSError:
+        return [path, None, None]
+
+
+def compute_fingerprint(cache_dir=DNF_CACHE_DIR, rpmdb_dir=RPMDB_DIR):
+    """
+    Returns the mtimes and sizes of the cached repomd.xml files and of the rpmdb files.
+    The cached result is invalid as soon as the fingerprint changes, e.g. after a metadata refresh or an install.
+    """
+    paths = [cache_dir, rpmdb_dir]
+    try:
+        with os.scandir(cache_dir) as entries:
+            paths.extend(os.path.join(entry.path, 'repodata', 'repomd.xml') for entry in entries if entry.is_dir())
+    except OSError:
+        pass
+    try:
+        with os.scandir(rpmdb_dir) as entries:
+            paths.extend(entry.path for entry in entries if entry.is_file())
+    except OSError:
+        pass
+    return [stat_signature(path) for path in sorted(paths)]
+
+
+def load_cached_result(fingerprint, cache_file=CACHE_FILE, ttl=DEFAULT_TTL, key=None):
+    """
+    Returns the cached (updates available, list of Update), or None if there is no valid cached result.
+    A result stored with another key, e.g. by another update engine, is not used.
+    A cache file written by another user is not trusted.
+    """
+    try:
+        with state_files.open_trusted(cache_file) as file:
+            cached = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        message = f'{cache_file}: Could not read the cached update check result: {e}'
+        logging.warning(message)
+        return None
+    age = time.time() - cached.get('timestamp', 0)
+    if not 0 <= age <= ttl:
+        logging.debug('%s: Cached update check result expired %.0fs ago.', cache_file, age - ttl)
+        return None
+    if cached.get('key') != key:
+        logging.debug('%s: Cached update check result is of %s, not of %s.', cache_file, cached.get('key'), key)
+        return None
+    if cached.get('fingerprint') != fingerprint:
+        logging.debug('%s: Repository metadata or rpmdb changed, cached update check result is stale.', cache_file)
+        return None
+    return cached['updates_available'], [Update(*update) for update in cached['updates']]
+
+
+def store_result(fingerprint, updates_available, updates, cache_file=CACHE_FILE, key=None):
+    """
+    Writes the result atomically, so that concurrent readers never see a partial file.
+    """
+    cached = {
+        'timestamp': time.time(),
+        'key': key,
+        'fingerprint': fingerprint,
+        'updates_available': updates_available,
+        'updates': [list(update) for update in updates],
+    }
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    if not state_files.ensure_private_dir(directory):
+        return
+    try:
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.check_updates_cache.', delete=False) as file:
+            json.dump(cached, file)
+        os.replace(file.name, cache_file)
+    except OSError as e:
+        message = f'{cache_file}: Could not store the update check result: {e}'
+        logging.warning(message)
+
+
+def cached_update_check(check, cache_file=CACHE_FILE, ttl=DEFAULT_TTL, refresh=False, cache_dir=DNF_CACHE_DIR,
+                        rpmdb_dir=RPMDB_DIR, key=None):
+    """
+    Returns the cached result of check, or runs check and caches its result.
+    check returns (updates available, list of Update), or None on failure, which is not cached.
+    key tells checks with different results apart, e.g. the update engine; a result is only used for the same key.
+    With refresh the cached result is ignored.
+    """
+    fingerprint = compute_fingerprint(cache_dir, rpmdb_dir)
+    if not refresh:
+        result = load_cached_result(fingerprint, cache_file, ttl, key)
+        if result is not None:
+            message = f'Using the cached update check result from {cache_file}.'
+            logging.info(message)
+            return result
+    result = check()
+    if result is not None:
+        # The fingerprint from before the check, a change during the check invalidates the result
+        store_result(fingerprint, *result, cache_file=cache_file, key=key)
+    return result
@@ -0,0 +1,449 @@
+import asyncio
+import bz2
+import gzip
+import logging
+import lzma
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+
+import command_runner
+import dnf_lock
+import metrics
+
+# Directory where dnf caches the metadata of the enabled repositories
+DNF_CACHE_DIR = '/var/cache/dnf'
+
+# XML namespaces of the repomd.xml index and of the primary metadata
+REPO_NS = '{http://linux.duke.edu/metadata/repo}'
+COMMON_NS = '{http://linux.duke.edu/metadata/common}'
+
+# Decompressors for the metadata file extensions the standard library can read
+OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+# Splits a version or release into alphabetic, numeric, '~' and '^' segments like rpmvercmp
+VERSION_SEGMENT_PATTERN = re.compile(r'[a-zA-Z]+|[0-9]+|~|\^')
+
+Package = namedtuple('Package', ['name', 'epoch', 'version', 'release', 'arch'])
+# One available update, 'version' is formatted like 'dnf check-update' prints it: [epoch:]version-release.
+# 'obsoletes' is the installed name.arch the package replaces, for the 'Obsoleting Packages' section of dnf.
+Update = namedtuple('Update', ['name', 'arch', 'version', 'repo', 'obsoletes'], defaults=[None])
+
+RPM_QUERY_COMMAND = ['rpm', '-qa', '--qf', '%{NAME} %{EPOCHNUM} %{VERSION} %{RELEASE} %{ARCH}\n']
+RPM_QUERY_TIMEOUT = 120
+RPM_QUERY_MAX_OUTPUT = 64 * 1024 * 1024
+
+CHECK_UPDATE_COMMAND = ['dnf', 'check-update']
+# Seconds dnf check-update may run, it may have to download the metadata of every repository first
+CHECK_UPDATE_TIMEOUT = 900
+# Parsed Updates CheckUpdateStream holds for a consumer which is behind
+STREAM_QUEUE_SIZE = 1000
+# First field of a 'dnf check-update' package line, e.g. 'kernel-core.x86_64'
+PACKAGE_NAME_ARCH_PATTERN = re.compile(r'^[^\s:]+\.[A-Za-z0-9_]+$')
+
+
+def compare_version_strings(first, second):
+    """
+    Compares two version or release strings with the rpmvercmp rules. Returns -1, 0 or 1.
+    '~' sorts before anything, even the end of the string, '^' sorts after the end but before anything else.
+    """
+    if first == second:
+        return 0
+    first_segments = VERSION_SEGMENT_PATTERN.findall(first)
+    second_segments = VERSION_SEGMENT_PATTERN.findall(second)
+    index = 0
+    while True:
+        one = first_segments[index] if index < len(first_segments) else None
+        two = second_segments[index] if index < len(second_segments) else None
+        index += 1
+        if one == '~' or two == '~':
+            if one != '~':
+                return 1
+            if two != '~':
+                return -1
+            continue
+        if one == '^' or two == '^':
+            if one is None:
+                return -1
+            if two is None:
+                return 1
+            if one != '^':
+                return 1
+            if two != '^':
+                return -1
+            continue
+        if one is None or two is None:
+            break
+        if one.isdigit():
+            # A numeric segment is newer than an alphabetic one
+            if not two.isdigit():
+                return 1
+            one_number, two_number = int(one), int(two)
+            if one_number != two_number:
+                return 1 if one_number > two_number else -1
+        elif two.isdigit():
+            return -1
+        elif one != two:
+            return 1 if one > two else -1
+    if one is None and two is None:
+        return 0
+    return -1 if one is None else 1
+
+
+def compare_evr(first, second):
+    """
+    Compares the epoch, version and release of two packages. Returns -1, 0 or 1.
+    """
+    first_epoch, second_epoch = int(first.epoch or 0), int(second.epoch or 0)
+    if first_epoch != second_epoch:
+        return 1 if first_epoch > second_epoch else -1
+    return (compare_version_strings(first.version, second.version)
+            or compare_version_strings(first.release, second.release))
+
+
+def format_evr(package):
+    evr = f'{package.version}-{package.release}'
+    if package.epoch and package.epoch != '0':
+        evr = f'{package.epoch}:{evr}'
+    return evr
+
+
+class CheckUpdateParser:
+    """
+    Parses the output of 'dnf check-update' line by line, feed() returns the Updates a line completes.
+    Names too long for their column are wrapped by dnf, the version and repo follow on an indented line.
+    In the 'Obsoleting Packages' section every indented line names an installed package obsoleted by
+    the package above it, an Update with 'obsoletes' set is returned for each of them.
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self.obsoleting = False
+        self.obsoleting_update = None
+
+    def feed(self, line):
+        indented = line[:1].isspace()
+        if line.startswith('Obsoleting Packages'):
+            self.obsoleting = True
+            self.tokens = []
+            return []
+        if self.tokens and indented:
+            # The continuation of a wrapped line
+            self.tokens.extend(line.split())
+        elif self.obsoleting and self.obsoleting_update and indented:
+            fields = line.split()
+            return [self.obsoleting_update._replace(obsoletes=fields[0])] if fields else []
+        else:
+            fields = line.split()
+            self.tokens = fields if fields and not indented and PACKAGE_NAME_ARCH_PATTERN.match(fields[0]) else []
+            self.obsoleting_update = None
+        if len(self.tokens) < 3:
+            return []
+        name, _, arch = self.tokens[0].rpartition('.')
+        update = Update(name, arch, self.tokens[1], self.tokens[2])
+        self.tokens = []
+        if self.obsoleting:
+            self.obsoleting_update = update
+            return []
+        return [update]
+
+
+def parse_check_update_lines(lines):
+    """
+    Yields an Update for every package line of 'dnf check-update' as soon as it is complete.
+    """
+    parser = CheckUpdateParser()
+    for line in lines:
+        yield from parser.feed(line)
+
+
+def parse_check_update_output(output):
+    """
+    Parses the complete output of 'dnf check-update' into a list of Update.
+    """
+    return list(parse_check_update_lines(output.splitlines()))
+
+
+class CheckUpdateStream:
+    """
+    Runs 'dnf check-update' with the command runner and yields its Updates while dnf prints them.
+
+        with CheckUpdateStream() as stream:
+            kernel_update = next((update for update in stream if update.name == 'kernel'), None)
+        print(stream.result)
+
+    At most queue_size Updates are held, dnf waits on its pipe while the consumer is behind.
+    Leaving the block before the output is complete stops dnf, stopped_early is then True and result None.
+    The time spent parsing is recorded as the parse_check_update stage, without the time waiting for dnf.
+    """
+
+    # Put in the queue after the last Update
+    END = object()
+
+    def __init__(self, timeout=CHECK_UPDATE_TIMEOUT, command=None, queue_size=STREAM_QUEUE_SIZE):
+        self.timeout = timeout
+        self.command = command or CHECK_UPDATE_COMMAND
+        self.queue = queue.Queue(queue_size)
+        self.started = threading.Event()
+        self.thread = None
+        self.loop = None
+        self.task = None
+        self.result = None
+        self.error = None
+        self.output_complete = False
+        self.stopped_early = False
+        self.parse_seconds = 0.0
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.run, name='dnf check-update', daemon=True)
+        self.thread.start()
+        self.started.wait()
+        return self
+
+    def run(self):
+        parser = CheckUpdateParser()
+
+        def handle_line(line):
+            start = time.perf_counter()
+            updates = parser.feed(line)
+            self.parse_seconds += time.perf_counter() - start
+            for update in updates:
+                self.queue.put(update)
+            return False
+
+        async def run_command():
+            self.loop = asyncio.get_running_loop()
+            self.task = asyncio.current_task()
+            self.started.set()
+            return await command_runner.run_command_async(
+                self.command, timeout=self.timeout, line_handler=handle_line,
+                outcomes=command_runner.EXIT_CODE_OUTCOMES[tuple(CHECK_UPDATE_COMMAND)])
+
+        try:
+            self.result = asyncio.run(run_command())
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            metrics.REGISTRY.observe('stage_duration_seconds', self.parse_seconds, {'stage': 'parse_check_update'})
+            self.started.set()
+            self.queue.put(self.END)
+
+    def __iter__(self):
+        while True:
+            update = self.queue.get()
+            if update is self.END:
+                break
+            yield update
+        self.output_complete = True
+        if self.error is not None:
+            raise self.error
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.output_complete:
+            self.stopped_early = True
+            try:
+                self.loop.call_soon_threadsafe(self.task.cancel)
+            except RuntimeError:
+                # dnf already finished and the loop is closed
+                pass
+            # Unblock the runner if it waits for room in the queue, until it put the end
+            while self.queue.get() is not self.END:
+                pass
+        self.thread.join()
+        return False
+
+
+def run_check_update(timeout=CHECK_UPDATE_TIMEOUT, command=None):
+    """
+    Runs 'dnf check-update' with the command runner and parses its output while it is printed.
+    Returns (CommandResult, list of Update), see CheckUpdateStream for callers which do not need the whole list.
+    """
+    with CheckUpdateStream(timeout, command) as stream:
+        updates = list(stream)
+    return stream.result, updates
+
+
+def encode_check_update(result):
+    command_result, updates = result
+    if command_result.outcome.name not in ('success', 'updates'):
+        return None
+    return {
+        'result': command_result._replace(outcome=list(command_result.outcome)),
+        'updates': [list(update) for update in updates],
+    }
+
+
+def decode_check_update(shared):
+    command_result = command_runner.CommandResult(*shared['result'])
+    command_result = command_result._replace(outcome=command_runner.Outcome(*command_result.outcome))
+    return command_result, [Update(*update) for update in shared['updates']]
+
+
+def run_check_update_coordinated(timeout=CHECK_UPDATE_TIMEOUT, command=None):
+    """
+    Runs 'dnf check-update' like run_check_update, but coordinated with the other scripts through dnf_lock:
+    callers wait for each other instead of failing on dnf's lock, and a caller arriving while a check
+    is running gets the result of that check.
+    """
+    return dnf_lock.run_serialized(lambda: run_check_update(timeout, command=command), 'check-update', coalesce=True,
+                                   is_locked=lambda result: result[0].outcome.name == 'locked',
+                                   encode=encode_check_update, decode=decode_check_update)
+
+
+def find_first_update(predicate, timeout=CHECK_UPDATE_TIMEOUT, command=None):
+    """
+    Returns the first Update of 'dnf check-update' for which predicate is true, or None.
+    dnf is stopped as soon as a match is found.
+    """
+    with CheckUpdateStream(timeout, command) as stream:
+        return next((update for update in stream if predicate(update)), None)
+
+
+def get_installed_packages():
+    """
+    Lists the installed packages with a single 'rpm -qa' call, which is much lighter than loading dnf.
+    """
+    result = command_runner.run_command(RPM_QUERY_COMMAND, timeout=RPM_QUERY_TIMEOUT, max_output=RPM_QUERY_MAX_OUTPUT)
+    if result.outcome is not command_runner.SUCCESS or result.truncated:
+        raise RuntimeError(f'rpm -qa: {result.outcome.description}: {result.stderr.strip()}')
+    for line in result.stdout.splitlines():
+        fields = line.split()
+        # gpg-pubkey entries have no arch and are not packages which can be updated
+        if len(fields) == 5 and fields[4] != '(none)':
+            yield Package(*fields)
+
+
+def find_primary_metadata(repo_dir):
+    """
+    Returns the path of the primary metadata of a cached repository from its repomd.xml, or None.
+    The XML metadata is preferred, the sqlite database is used when there is no readable XML.
+    """
+    repomd_path = os.path.join(repo_dir, 'repodata', 'repomd.xml')
+    locations = {}
+    try:
+        for data in ElementTree.parse(repomd_path).getroot().iter(f'{REPO_NS}data'):
+            location = data.find(f'{REPO_NS}location')
+            if location is not None:
+                locations[data.get('type')] = os.path.join(repo_dir, location.get('href'))
+    except (OSError, ElementTree.ParseError) as e:
+        message = f'{repomd_path}: Could not read the repository index: {e}'
+        logging.warning(message)
+        return None
+    for data_type in ('primary', 'primary_db'):
+        path = locations.get(data_type)
+        if path and os.path.exists(path) and (path.endswith('.sqlite') or os.path.splitext(path)[1] in OPENERS):
+            return path
+    message = f'{repo_dir}: No primary metadata in a supported format found'
+    logging.warning(message)
+    return None
+
+
+def find_cached_repositories(cache_dir=DNF_CACHE_DIR):
+    """
+    Yields (repo id, primary metadata path) of the repositories cached under cache_dir.
+    The cache directories are named '<repo id>-<hash>'.
+    """
+    try:
+        with os.scandir(cache_dir) as entries:
+            repo_dirs = sorted(entry.path for entry in entries
+                               if entry.is_dir() and os.path.isdir(os.path.join(entry.path, 'repodata')))
+    except OSError as e:
+        message = f'{cache_dir}: Could not read the dnf cache: {e}'
+        logging.error(message)
+        return
+    for repo_dir in repo_dirs:
+        primary_path = find_primary_metadata(repo_dir)
+        if primary_path:
+            yield os.path.basename(repo_dir).rsplit('-', 1)[0], primary_path
+
+
+def read_primary_xml(path):
+    """
+    Yields the packages of a primary.xml file, streaming so that memory stays bounded for big repositories.
+    """
+    opener = OPENERS.get(os.path.splitext(path)[1], open)
+    with opener(path, 'rb') as file:
+        events = ElementTree.iterparse(file, events=('start', 'end'))
+        _, root = next(events)
+        for event, element in events:
+            if event != 'end' or element.tag != f'{COMMON_NS}package':
+                continue
+            version = element.find(f'{COMMON_NS}version')
+            yield Package(element.findtext(f'{COMMON_NS}name'), version.get('epoch'), version.get('ver'),
+                          version.get('rel'), element.findtext(f'{COMMON_NS}arch'))
+            # Drop the parsed packages from the tree
+            root.clear()
+
+
+def read_primary_sqlite(path):
+    """
+    Yields the packages of a primary.sqlite database.
+    """
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        yield from (Package(*row) for row in
+                    connection.execute('SELECT name, epoch, version, release, arch FROM packages'))
+    finally:
+        connection.close()
+
+
+def read_primary_metadata(path):
+    if path.endswith('.sqlite'):
+        return read_primary_sqlite(path)
+    return read_primary_xml(path)
+
+
+def find_updates(installed, repositories):
+    """
+    Compares the installed packages with the packages of the repositories.
+    installed is an iterable of Package, repositories an iterable of (repo id, iterable of Package).
+    Returns the newest available Update of every installed (name, arch) which has a newer version.
+    Obsoletes, excludes and modular filtering are not taken into account.
+    """
+    # Newest installed version by name and arch, e.g. of several installed kernels
+    newest_installed = {}
+    for package in installed:
+        key = (package.name, package.arch)
+        current = newest_installed.get(key)
+        if current is None or compare_evr(package, current) > 0:
+            newest_installed[key] = package
+
+    candidates = {}
+    for repo, packages in repositories:
+        for package in packages:
+            key = (package.name, package.arch)
+            current = newest_installed.get(key)
+            if current is None or compare_evr(package, current) <= 0:
+                continue
+            candidate = candidates.get(key)
+            if candidate is None or compare_evr(package, candidate[0]) > 0:
+                candidates[key] = (package, repo)
+
+    return [Update(package.name, package.arch, format_evr(package), repo)
+            for _, (package, repo) in sorted(candidates.items())]
+
+
+def check_updates_native(cache_dir=DNF_CACHE_DIR, installed=None):
+    """
+    Computes the available updates from the cached repository metadata, without running dnf.
+    installed defaults to the packages of the rpmdb. Returns (updates available, list of Update).
+    The result is only as fresh as the metadata in the dnf cache.
+    """
+    if installed is None:
+        installed = get_installed_packages()
+    repositories = ((repo, read_primary_metadata(path)) for repo, path in find_cached_repositories(cache_dir))
+    updates = find_updates(installed, repositories)
+    message = f'native update check: {len(updates)} updates available.'
+    logging.info(message)
+    return bool(updates), updates
@@ -0,0 +1,257 @@
+import argparse
+import errno
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import state_files
+
+# sqlite database with the pending updates of every checked host
+HISTORY_DB = os.path.join(state_files.STATE_DIR, 'update_history.db')
+# Seconds a writer waits for another writer of the database
+BUSY_TIMEOUT = 30
+
+# A pending update is stored as one row per host and package, from the first check which listed an update of the
+# package until the first check which did not. The row keeps the latest version, so months of hourly checks take
+# one row per update instead of one row per update and check.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hosts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    arch TEXT NOT NULL,
+    UNIQUE (name, arch)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    host_id INTEGER NOT NULL REFERENCES hosts (id),
+    taken INTEGER NOT NULL,
+    update_count INTEGER NOT NULL,
+    PRIMARY KEY (host_id, taken)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY,
+    host_id INTEGER NOT NULL REFERENCES hosts (id),
+    package_id INTEGER NOT NULL REFERENCES packages (id),
+    version TEXT NOT NULL,
+    repo TEXT,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    resolved INTEGER
+);
+CREATE INDEX IF NOT EXISTS pending_open ON pending (host_id, resolved);
+CREATE INDEX IF NOT EXISTS pending_package ON pending (package_id, first_seen);
+CREATE INDEX IF NOT EXISTS pending_first_seen ON pending (resolved, first_seen);
+'''
+
+# Changes of the pending updates of a host since its previous snapshot. added and changed hold
+# (name, arch, version, repo) and (name, arch, old version, new version), removed holds (name, arch, version).
+Delta = namedtuple('Delta', ['host', 'added', 'removed', 'changed'])
+
+
+def check_trusted(db_path):
+    """
+    Raises PermissionError if the database exists and is owned by another user than root or the current user.
+    """
+    try:
+        trusted = state_files.is_trusted(os.stat(db_path))
+    except FileNotFoundError:
+        return
+    if not trusted:
+        raise PermissionError(errno.EPERM, 'Database is owned by another user', db_path)
+
+
+def connect(db_path=HISTORY_DB):
+    """
+    Opens the database for writing, creating it in a directory only its owner may write to.
+    """
+    directory = os.path.dirname(os.path.abspath(db_path))
+    if not state_files.ensure_private_dir(directory):
+        raise PermissionError(errno.EPERM, 'Not a private state directory', directory)
+    check_trusted(db_path)
+    connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def row_id(connection, table, **columns):
+    """
+    Returns the id of the row of table with the given columns, inserting it when it does not exist.
+    """
+    names = ', '.join(columns)
+    condition = ' AND '.join(f'{name} = ?' for name in columns)
+    values = tuple(columns.values())
+    row = connection.execute(f'SELECT id FROM {table} WHERE {condition}', values).fetchone()
+    if row:
+        return row[0]
+    return connection.execute(f'INSERT INTO {table} ({names}) VALUES ({", ".join("?" * len(columns))})',
+                              values).lastrowid
+
+
+def record_snapshot(updates, host=None, taken=None, db_path=HISTORY_DB):
+    """
+    Stores the update_engine.Updates listed by one check of host and returns the Delta to its previous snapshot.
+    Lines of the Obsoleting Packages section are not pending updates and are left out.
+    """
+    host = host or socket.gethostname()
+    taken = int(taken if taken is not None else time.time())
+    current = {(update.name, update.arch): (update.version, update.repo)
+               for update in updates if update.obsoletes is None}
+    connection = connect(db_path)
+    try:
+        with connection:
+            host_id = row_id(connection, 'hosts', name=host)
+            open_rows = {(name, arch): (pending_id, version) for pending_id, name, arch, version in connection.execute(
+                'SELECT pending.id, packages.name, packages.arch, pending.version FROM pending '
+                'JOIN packages ON packages.id = pending.package_id WHERE host_id = ? AND resolved IS NULL',
+                (host_id,))}
+            added, removed, changed = [], [], []
+            for key, (pending_id, old_version) in open_rows.items():
+                if key not in current:
+                    connection.execute('UPDATE pending SET resolved = ? WHERE id = ?', (taken, pending_id))
+                    removed.append((*key, old_version))
+            # Most updates are still pending from the previous check, only their last_seen changes
+            connection.execute('UPDATE pending SET last_seen = ? WHERE host_id = ? AND resolved IS NULL',
+                               (taken, host_id))
+            for key, (version, repo) in current.items():
+                if key not in open_rows:
+                    connection.execute('INSERT INTO pending (host_id, package_id, version, repo, first_seen, last_seen) '
+                                       'VALUES (?, ?, ?, ?, ?, ?)',
+                                       (host_id, row_id(connection, 'packages', name=key[0], arch=key[1]), version,
+                                        repo, taken, taken))
+                    added.append((*key, version, repo))
+                    continue
+                pending_id, old_version = open_rows[key]
+                if old_version != version:
+                    connection.execute('UPDATE pending SET version = ?, repo = ? WHERE id = ?',
+                                       (version, repo, pending_id))
+                    changed.append((*key, old_version, version))
+            connection.execute('INSERT OR REPLACE INTO snapshots (host_id, taken, update_count) VALUES (?, ?, ?)',
+                               (host_id, taken, len(current)))
+    finally:
+        connection.close()
+    return Delta(host, sorted(added), sorted(removed), sorted(changed))
+
+
+def format_delta(delta):
+    lines = [f'{delta.host}: {len(delta.added)} new, {len(delta.changed)} changed, '
+             f'{len(delta.removed)} no longer pending updates']
+    lines += [f'  + {name}.{arch} {version} {repo}' for name, arch, version, repo in delta.added]
+    lines += [f'  ~ {name}.{arch} {old} -> {new}' for name, arch, old, new in delta.changed]
+    lines += [f'  - {name}.{arch} {version}' for name, arch, version in delta.removed]
+    return '\n'.join(lines)
+
+
+def record_check(updates, host=None, db_path=None, logger=logging):
+    """
+    Records the result of an update check and logs its delta. Returns the Delta, or None if it could not be stored;
+    the history never fails the check itself. db_path defaults to HISTORY_DB at the time of the call.
+    """
+    db_path = db_path or HISTORY_DB
+    try:
+        delta = record_snapshot(updates, host, db_path=db_path)
+    except (sqlite3.Error, OSError) as e:
+        message = f'{db_path}: Could not record the update check: {e}'
+        logger.warning(message)
+        return None
+    logger.info(format_delta(delta))
+    return delta
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def query_first_seen(connection, package, host=None):
+    """
+    Returns (host, name.arch, first seen, version, resolved) of the first time an update of package was pending,
+    per host. package is a name or name.arch.
+    """
+    name, _, arch = package.rpartition('.')
+    # A name may contain dots itself, e.g. python3.11
+    condition = '((packages.name = ? AND packages.arch = ?) OR packages.name = ?)'
+    values = [name, arch, package]
+    if host:
+        condition += ' AND hosts.name = ?'
+        values.append(host)
+    return connection.execute(
+        "SELECT hosts.name, packages.name || '.' || packages.arch, MIN(first_seen), version, resolved FROM pending "
+        'JOIN packages ON packages.id = pending.package_id JOIN hosts ON hosts.id = pending.host_id '
+        f'WHERE {condition} GROUP BY pending.host_id, pending.package_id ORDER BY 3', values).fetchall()
+
+
+def query_pending(connection, days, host=None, now=None):
+    """
+    Returns (host, name.arch, version, first seen) of the updates pending for at least days days.
+    """
+    cutoff = (now or time.time()) - days * 86400
+    condition = 'resolved IS NULL AND first_seen <= ?'
+    values = [cutoff]
+    if host:
+        condition += ' AND hosts.name = ?'
+        values.append(host)
+    return connection.execute(
+        "SELECT hosts.name, packages.name || '.' || packages.arch, version, first_seen FROM pending "
+        'JOIN packages ON packages.id = pending.package_id JOIN hosts ON hosts.id = pending.host_id '
+        f'WHERE {condition} ORDER BY first_seen', values).fetchall()
+
+
+def query_hosts(connection, days, now=None):
+    """
+    Returns (host, number of updates, oldest first seen) of the hosts with updates pending for at least days days.
+    """
+    cutoff = (now or time.time()) - days * 86400
+    return connection.execute(
+        'SELECT hosts.name, COUNT(*), MIN(first_seen) FROM pending JOIN hosts ON hosts.id = pending.host_id '
+        'WHERE resolved IS NULL AND first_seen <= ? GROUP BY pending.host_id ORDER BY 3', (cutoff,)).fetchall()
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='Query the history of the pending updates.')
+    parser.add_argument('--db', default=HISTORY_DB, help='History database (default: %(default)s)')
+    subparsers = parser.add_subparsers(dest='query', required=True)
+    first_seen = subparsers.add_parser('first-seen', help='When an update of a package was first pending')
+    first_seen.add_argument('package', help='Package name or name.arch')
+    first_seen.add_argument('--host', help='Only this host')
+    pending = subparsers.add_parser('pending', help='Updates pending for at least DAYS days')
+    pending.add_argument('--days', type=float, default=30, help='Minimum days pending (default: %(default)s)')
+    pending.add_argument('--host', help='Only this host')
+    hosts = subparsers.add_parser('hosts', help='Hosts with updates pending for at least DAYS days')
+    hosts.add_argument('--days', type=float, default=30, help='Minimum days pending (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    try:
+        check_trusted(args.db)
+        # Open read-only, a query never creates the database
+        connection = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True, timeout=BUSY_TIMEOUT)
+    except (sqlite3.Error, OSError) as e:
+        print(f'{args.db}: Could not open the update history: {e}', file=sys.stderr)
+        return 1
+    with connection:
+        if args.query == 'first-seen':
+            for host, package, first_seen, version, resolved in query_first_seen(connection, args.package, args.host):
+                state = f'resolved {format_time(resolved)}' if resolved else 'pending'
+                print(f'{host}\t{package}\t{format_time(first_seen)}\t{version}\t{state}')
+        elif args.query == 'pending':
+            for host, package, version, first_seen in query_pending(connection, args.days, args.host):
+                print(f'{host}\t{package}\t{version}\tsince {format_time(first_seen)}')
+        else:
+            for host, count, oldest in query_hosts(connection, args.days):
+                print(f'{host}\t{count} updates\toldest since {format_time(oldest)}')
+    connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())